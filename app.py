@@ -1,15 +1,28 @@
-from flask import Flask, request, render_template, jsonify, session, flash, send_file, abort
+from flask import Flask, request, render_template, jsonify, session, flash, send_file, abort, Response
 import os
 import re
 import threading
+import time
 import string
 import mimetypes
+import textwrap
+import html
 from pathlib import Path
-from openai import OpenAI
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI, APIConnectionError, InternalServerError
 import json
 from dotenv import load_dotenv
-from database import ConversationDatabase
-from typing import List, Dict, Any, Optional
+from database import ConversationDatabase, content_hash, SEARCH_MATCH_START, SEARCH_MATCH_END
+from workspace_index import WorkspaceIndexRegistry
+from context_budget import ContextBudget, tokenizer
+from history_summarizer import HistorySummarizer
+from minifier import minify
+from outline import outline
+from retrieval import RetrievalIndex
+from llm_scheduler import LLMScheduler, QueueTimeout
+from backend_pool import BackendPool
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import pytz
 from flask_assets import Environment, Bundle
@@ -36,12 +49,82 @@ COLORS = {
     'code_bg': '#263238'
 }
 
-conversation_db = ConversationDatabase()
+DB_PATH = os.getenv("DB_PATH", "conversations.db")
+conversation_db = ConversationDatabase(
+    db_path=DB_PATH,
+    pool_size=int(os.getenv("DB_POOL_SIZE", 8)),
+    cache_size_kb=int(os.getenv("DB_CACHE_SIZE_KB", 16384)),
+    backfill_batch_size=int(os.getenv("DB_BACKFILL_BATCH_SIZE", 2000))
+)
 
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen3.5:9b")
-
-client = OpenAI(base_url=OLLAMA_BASE_URL, api_key="ollama")
+MAX_OUTPUT_TOKENS = int(os.getenv("MAX_OUTPUT_TOKENS", 4096))
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", 16384))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", OLLAMA_NUM_CTX - MAX_OUTPUT_TOKENS))
+RECENT_MESSAGE_COUNT = int(os.getenv("RECENT_MESSAGE_COUNT", 6))
+HISTORY_WINDOW_MESSAGES = int(os.getenv("HISTORY_WINDOW_MESSAGES", 12))
+MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", 50))
+MESSAGE_PAGE_MAX = 500
+
+# Per-request timeout (seconds without progress), so a stalled backend can't hold a server thread forever
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", 120))
+
+# Comma-separated list of Ollama hosts to spread chats across (defaults to OLLAMA_BASE_URL)
+OLLAMA_BASE_URLS = os.getenv("OLLAMA_BASE_URLS", OLLAMA_BASE_URL).split(",")
+# Requests each Ollama host runs at once (its OLLAMA_NUM_PARALLEL)
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", 1))
+
+# Ollama request fields that keep a conversation's prompt prefix in the KV cache between turns:
+# keep_alive (e.g. "30m", "-1") stops the model being unloaded while idle, and a fixed num_ctx
+# stops a request with a different context size from reloading the model (dropping the cache)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "")
+OLLAMA_PIN_NUM_CTX = os.getenv("OLLAMA_PIN_NUM_CTX", "1") != "0"
+OLLAMA_EXTRA_BODY = {
+    **({"keep_alive": OLLAMA_KEEP_ALIVE} if OLLAMA_KEEP_ALIVE else {}),
+    **({"options": {"num_ctx": OLLAMA_NUM_CTX}} if OLLAMA_PIN_NUM_CTX else {})
+} or None
+
+
+def make_llm_client(base_url: str) -> OpenAI:
+    """Client for one Ollama host; the backend pool fails over instead of retrying."""
+    return OpenAI(base_url=base_url, api_key="ollama", timeout=OLLAMA_TIMEOUT, max_retries=0)
+
+
+def warmup_backend(backend) -> None:
+    """Load the model on one Ollama host so its first real request doesn't pay the load time."""
+    try:
+        print(f"{Fore.YELLOW}Warming up model '{OLLAMA_MODEL}' on {backend.url}...{Style.RESET_ALL}")
+        start = time.time()
+        backend.client.chat.completions.create(
+            model=OLLAMA_MODEL,
+            messages=[{"role": "user", "content": "hi"}],
+            max_tokens=1,
+            temperature=0,
+            extra_body=OLLAMA_EXTRA_BODY
+        )
+        elapsed = round(time.time() - start, 1)
+        print(f"{Fore.GREEN}Model '{OLLAMA_MODEL}' warmed up on {backend.url} in {elapsed}s — ready for fast responses{Style.RESET_ALL}")
+    except Exception as e:
+        print(f"{Fore.RED}Model warmup failed on {backend.url}: {e}{Style.RESET_ALL}")
+
+
+backend_pool = BackendPool(
+    OLLAMA_BASE_URLS, make_llm_client,
+    failure_types=(APIConnectionError, InternalServerError),
+    routing=os.getenv("OLLAMA_ROUTING", "affinity"),
+    max_outstanding=OLLAMA_NUM_PARALLEL,
+    failure_threshold=int(os.getenv("OLLAMA_FAILURE_THRESHOLD", 2)),
+    health_interval=float(os.getenv("OLLAMA_HEALTH_INTERVAL", 15.0)),
+    warm=warmup_backend
+)
+
+# Chat completions are admitted through the scheduler: at most LLM_MAX_IN_FLIGHT run at once
+# (by default every host's OLLAMA_NUM_PARALLEL), the rest queue fairly per conversation
+llm_scheduler = LLMScheduler(
+    max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", OLLAMA_NUM_PARALLEL * len(backend_pool))),
+    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", 120))
+)
 
 IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.svg', '.bmp', '.ico'}
 BINARY_EXTENSIONS = {'.exe', '.dll', '.so', '.dylib', '.bin', '.dat', '.zip', '.tar',
@@ -53,22 +136,22 @@ IGNORE_DIRS = {'.git', '__pycache__', 'node_modules', '.venv', 'venv', '.env',
                '.nuxt', 'target', 'bin', 'obj', '.tox', '.mypy_cache', '.pytest_cache',
                'coverage', '.nyc_output', '.sass-cache'}
 
+MAX_CONTEXT_FILE_SIZE = 1 * 1024 * 1024
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", min(8, (os.cpu_count() or 1) + 4)))
+ingest_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+
+workspace_indexes = WorkspaceIndexRegistry(
+    IGNORE_DIRS, BINARY_EXTENSIONS, IMAGE_EXTENSIONS,
+    max_workspaces=int(os.getenv("WORKSPACE_INDEX_MAX", 8)),
+    poll_interval=float(os.getenv("WORKSPACE_POLL_INTERVAL", 2.0)),
+    use_watcher=os.getenv("WORKSPACE_WATCHER", "1") != "0"
+)
+
 
 def warmup_model():
-    try:
-        print(f"{Fore.YELLOW}Warming up model '{OLLAMA_MODEL}'...{Style.RESET_ALL}")
-        import time
-        start = time.time()
-        client.chat.completions.create(
-            model=OLLAMA_MODEL,
-            messages=[{"role": "user", "content": "hi"}],
-            max_tokens=1,
-            temperature=0,
-        )
-        elapsed = round(time.time() - start, 1)
-        print(f"{Fore.GREEN}Model '{OLLAMA_MODEL}' warmed up in {elapsed}s — ready for fast responses{Style.RESET_ALL}")
-    except Exception as e:
-        print(f"{Fore.RED}Model warmup failed: {e}{Style.RESET_ALL}")
+    """Warm every Ollama host in parallel."""
+    backend_pool.warmup()
 
 
 def strip_thinking_tokens(text: str) -> str:
@@ -76,6 +159,115 @@ def strip_thinking_tokens(text: str) -> str:
     return re.sub(r'<think>[\s\S]*?</think>', '', text).strip()
 
 
+class ThinkingStripper:
+    """Incrementally strip <think>...</think> blocks from streamed model output.
+
+    Deltas are fed in as they arrive; text outside thinking blocks is returned
+    as soon as it is known not to be the start of a tag, so the client sees the
+    answer without waiting for the whole completion.
+    """
+
+    OPEN_TAG = '<think>'
+    CLOSE_TAG = '</think>'
+
+    def __init__(self):
+        self._buffer = ''
+        self._in_think = False
+        self._emitted = False
+
+    @staticmethod
+    def _partial_tag_length(text: str, tag: str) -> int:
+        """Length of the longest suffix of text that is a proper prefix of tag."""
+        for length in range(min(len(text), len(tag) - 1), 0, -1):
+            if tag.startswith(text[-length:]):
+                return length
+        return 0
+
+    def feed(self, delta: str) -> str:
+        self._buffer += delta
+        output = []
+        while self._buffer:
+            if self._in_think:
+                idx = self._buffer.find(self.CLOSE_TAG)
+                if idx == -1:
+                    keep = self._partial_tag_length(self._buffer, self.CLOSE_TAG)
+                    self._buffer = self._buffer[len(self._buffer) - keep:] if keep else ''
+                    break
+                self._buffer = self._buffer[idx + len(self.CLOSE_TAG):]
+                self._in_think = False
+            else:
+                idx = self._buffer.find(self.OPEN_TAG)
+                if idx == -1:
+                    keep = self._partial_tag_length(self._buffer, self.OPEN_TAG)
+                    cut = len(self._buffer) - keep
+                    output.append(self._buffer[:cut])
+                    self._buffer = self._buffer[cut:]
+                    break
+                output.append(self._buffer[:idx])
+                self._buffer = self._buffer[idx + len(self.OPEN_TAG):]
+                self._in_think = True
+        return self._emit(''.join(output))
+
+    def flush(self) -> str:
+        """Return any buffered text once the stream has ended."""
+        remaining = '' if self._in_think else self._buffer
+        self._buffer = ''
+        return self._emit(remaining)
+
+    def _emit(self, text: str) -> str:
+        # Mirror strip_thinking_tokens(): no leading whitespace before the answer
+        if not self._emitted:
+            text = text.lstrip()
+            if text:
+                self._emitted = True
+        return text
+
+
+def summarize_messages(messages: List[Dict[str, str]]) -> str:
+    """Run a short, low-temperature completion used for history compaction."""
+    # Background compactions share one fairness queue, so they never outnumber a user's turns
+    with llm_scheduler.slot("history-summarizer"):
+        response = backend_pool.run(None, lambda client: client.chat.completions.create(
+            model=OLLAMA_MODEL,
+            messages=messages,
+            max_tokens=1024,
+            temperature=0.2,
+            extra_body=OLLAMA_EXTRA_BODY
+        ))
+    return strip_thinking_tokens(response.choices[0].message.content or "")
+
+
+history_summarizer = HistorySummarizer(
+    conversation_db, summarize_messages,
+    window_messages=HISTORY_WINDOW_MESSAGES,
+    min_batch_messages=int(os.getenv("HISTORY_SUMMARY_BATCH", 6))
+)
+
+# Workspace retrieval: top-k relevant chunks are injected per turn (0 disables)
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 5))
+# Embeddings model served by Ollama for re-ranking retrieved chunks (empty disables)
+OLLAMA_EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "")
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Embed texts with the local Ollama embeddings endpoint."""
+    # Background indexing queues for a model slot like any other client, so it can't starve chats
+    with llm_scheduler.slot("retrieval-indexer"):
+        response = backend_pool.run(None, lambda client: client.embeddings.create(model=OLLAMA_EMBED_MODEL,
+                                                                                  input=texts))
+    return [item.embedding for item in response.data]
+
+
+retrieval_index = RetrievalIndex(
+    os.getenv("RETRIEVAL_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "retrieval.db")),
+    IGNORE_DIRS, BINARY_EXTENSIONS, IMAGE_EXTENSIONS,
+    max_file_size=MAX_CONTEXT_FILE_SIZE,
+    chunk_lines=int(os.getenv("RETRIEVAL_CHUNK_LINES", 40)),
+    refresh_interval=float(os.getenv("RETRIEVAL_REFRESH_INTERVAL", 30.0)),
+    embed=embed_texts if OLLAMA_EMBED_MODEL else None
+)
+
+
 def format_timestamp(timestamp: str) -> str:
     try:
         try:
@@ -102,42 +294,13 @@ def is_safe_path(path: str, workspace: str = None) -> bool:
         return False
 
 
-def get_directory_tree(root_path: str, max_depth: int = 3, current_depth: int = 0) -> str:
-    """Build a text-based directory tree for the system prompt."""
-    if current_depth >= max_depth:
-        return ""
-    
-    tree_lines = []
-    try:
-        root = Path(root_path)
-        items = sorted(root.iterdir(), key=lambda x: (not x.is_dir(), x.name.lower()))
-        
-        for item in items:
-            if item.name in IGNORE_DIRS or item.name.startswith('.'):
-                continue
-            if item.suffix.lower() in BINARY_EXTENSIONS:
-                continue
-            
-            indent = "  " * current_depth
-            if item.is_dir():
-                tree_lines.append(f"{indent}📁 {item.name}/")
-                subtree = get_directory_tree(str(item), max_depth, current_depth + 1)
-                if subtree:
-                    tree_lines.append(subtree)
-            else:
-                size_kb = item.stat().st_size / 1024
-                tree_lines.append(f"{indent}📄 {item.name} ({size_kb:.1f}KB)")
-    except PermissionError:
-        tree_lines.append(f"{'  ' * current_depth}⛔ [Permission Denied]")
-    except Exception:
-        pass
-    
-    return "\n".join(tree_lines)
+def get_directory_tree(root_path: str, max_depth: int = 3) -> str:
+    """Build a text-based directory tree for the system prompt from the cached workspace index."""
+    # No file sizes: editing a file must not change the prompt prefix
+    return workspace_indexes.get(root_path).render_tree(max_depth, show_sizes=False)
 
 
-def build_agent_system_prompt(workspace_path: str = None, contexts: list = None, code_artifacts: list = None) -> str:
-    """Build the system prompt with workspace awareness for the coding agent."""
-    prompt = """You are CodeChat, an AI coding agent with full access to the user's workspace.
+AGENT_SYSTEM_RULES = """You are CodeChat, an AI coding agent with full access to the user's workspace.
 You can read, analyze, and suggest modifications to any file in the workspace.
 
 RULES:
@@ -153,91 +316,493 @@ RULES:
 7. Always consider the full project context when making changes.
 """
 
-    if workspace_path and os.path.isdir(workspace_path):
-        tree = get_directory_tree(workspace_path, max_depth=3)
-        prompt += f"\n\nWORKSPACE: {workspace_path}\n"
-        prompt += f"FILE STRUCTURE:\n{tree}\n"
 
+def build_workspace_section(workspace_path: str = None) -> str:
+    """Render the workspace root and file tree part of the system prompt."""
+    if not workspace_path or not os.path.isdir(workspace_path):
+        return ""
+    tree = get_directory_tree(workspace_path, max_depth=3)
+    return f"\n\nWORKSPACE: {workspace_path}\nFILE STRUCTURE:\n{tree}\n"
+
+
+CONTEXT_FILES_HEADER = "\n\nLOADED CONTEXT FILES:\n"
+RETRIEVAL_HEADER = "\n\nRELEVANT WORKSPACE EXCERPTS (retrieved for this request):\n"
+ARTIFACTS_HEADER = "\n\nPREVIOUS CODE ARTIFACTS:\n"
+TURN_REQUEST_HEADER = "\n\nREQUEST:\n"
+
+
+def render_context_file(context: Dict[str, Any]) -> str:
+    return f"\n--- {context['file_path']} ---\n{context['file_content']}\n"
+
+
+def render_retrieved_chunk(chunk: Dict[str, Any]) -> str:
+    # Chunks are line windows that may start mid-statement, so they are shown verbatim
+    content = textwrap.dedent(chunk['content'])
+    return f"\n--- {chunk['path']} (lines {chunk['start_line']}-{chunk['end_line']}) ---\n{content}\n"
+
+
+def render_artifact(artifact: Dict[str, Any]) -> str:
+    return f"\n--- {artifact['language']} ---\n{artifact['content']}\n"
+
+
+def build_context_sections(contexts: list = None, code_artifacts: list = None) -> str:
+    """Render the loaded context files and previous code artifacts part of the system prompt."""
+    parts = []
     if contexts:
-        prompt += "\n\nLOADED CONTEXT FILES:\n"
-        for context in contexts:
-            prompt += f"\n--- {context['file_path']} ---\n{context['file_content']}\n"
+        parts.append(CONTEXT_FILES_HEADER)
+        parts.extend(render_context_file(context) for context in contexts)
 
     if code_artifacts:
-        prompt += "\n\nPREVIOUS CODE ARTIFACTS:\n"
-        for artifact in code_artifacts:
-            prompt += f"\n--- {artifact['language']} ---\n{artifact['content']}\n"
+        parts.append(ARTIFACTS_HEADER)
+        parts.extend(render_artifact(artifact) for artifact in code_artifacts)
 
-    return prompt
+    return "".join(parts)
 
 
-def prepare_conversation_context(conversation_id: int) -> Dict[str, Any]:
-    messages = conversation_db.get_conversation_messages(conversation_id)
+def build_agent_system_prompt(workspace_path: str = None, contexts: list = None, code_artifacts: list = None) -> str:
+    """Build the system prompt with workspace awareness for the coding agent."""
+    return (AGENT_SYSTEM_RULES
+            + build_workspace_section(workspace_path)
+            + build_context_sections(contexts, code_artifacts))
+
+
+class PromptSectionCache:
+    """LRU cache of rendered context-file and artifact segments, keyed on each conversation's context_version.
+
+    The version is bumped by the database whenever contexts, artifacts, or the
+    workspace change, so a hit means the cached segments (and their token counts)
+    are still exact and the context/artifact rows don't need to be fetched again.
+    """
+
+    def __init__(self, max_conversations: int = 32):
+        self.max_conversations = max_conversations
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id, version: int) -> Optional[Dict[str, Any]]:
+        key = str(conversation_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, conversation_id, version: int, segments: Dict[str, Any]) -> None:
+        key = str(conversation_id)
+        with self._lock:
+            self._entries[key] = (version, segments)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_conversations:
+                self._entries.popitem(last=False)
+
+
+prompt_section_cache = PromptSectionCache(int(os.getenv("PROMPT_CACHE_CONVERSATIONS", 32)))
+
+
+class PromptPrefixTracker:
+    """Remembers the messages last sent for each conversation, to measure how much of each prompt is a repeat.
+
+    Ollama skips evaluating the longest prefix a request shares with the one
+    before it on the same host, so the leading messages that are unchanged since
+    the conversation's previous request to the same backend approximate the
+    prompt tokens served from the KV cache.
+    """
+
+    def __init__(self, max_conversations: int = 256):
+        self.max_conversations = max_conversations
+        self._entries = OrderedDict()
+        self._prompt_tokens = 0
+        self._reused_tokens = 0
+        self._lock = threading.Lock()
+
+    def observe(self, conversation_id, backend_url: str, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Record a request and report its prompt tokens and how many of them repeat the previous request."""
+        fingerprints = [content_hash(f"{message['role']}\0{message['content']}") for message in messages]
+        key = str(conversation_id)
+        with self._lock:
+            previous = self._entries.get(key)
+            self._entries[key] = (backend_url, fingerprints)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_conversations:
+                self._entries.popitem(last=False)
+
+        reused = 0
+        if previous and previous[0] == backend_url:
+            for old, new in zip(previous[1], fingerprints):
+                if old != new:
+                    break
+                reused += 1
+        counts = [tokenizer.count_message(message) for message in messages]
+        prompt_tokens, reused_tokens = sum(counts), sum(counts[:reused])
+        with self._lock:
+            self._prompt_tokens += prompt_tokens
+            self._reused_tokens += reused_tokens
+        return {
+            "prompt_tokens": prompt_tokens,
+            "reused_prefix_tokens": reused_tokens,
+            "prefix_reuse": round(reused_tokens / prompt_tokens, 3) if prompt_tokens else 0.0
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "prompt_tokens": self._prompt_tokens,
+                "reused_prefix_tokens": self._reused_tokens,
+                "prefix_reuse": round(self._reused_tokens / self._prompt_tokens, 3) if self._prompt_tokens else 0.0
+            }
+
+
+prompt_prefix_tracker = PromptPrefixTracker()
+
+
+def load_prompt_segments(conversation_id) -> Dict[str, Any]:
+    """Render each context file and artifact once, with its token count, for budgeted assembly."""
     contexts = conversation_db.get_project_contexts(conversation_id)
     code_artifacts = conversation_db.get_code_artifacts(conversation_id)
+
+    missing_counts = {}
+    context_segments = []
+    for context in contexts:
+        text = render_context_file(context)
+        tokens = context.get('token_count')
+        if tokens is None:
+            tokens = tokenizer.count(text)
+            missing_counts[context['id']] = tokens
+        context_segments.append({"label": context['file_path'], "text": text, "tokens": tokens})
+    if missing_counts:
+        conversation_db.set_context_token_counts(missing_counts)
+
+    artifact_segments = []
+    for artifact in code_artifacts:
+        text = render_artifact(artifact)
+        artifact_segments.append({"label": artifact['id'], "text": text, "tokens": tokenizer.count(text)})
+
+    return {"contexts": context_segments, "artifacts": artifact_segments}
+
+
+def _admit_newest_first(budget: ContextBudget, items: List[Dict[str, Any]], costs: List[int],
+                        category: str) -> List[Dict[str, Any]]:
+    """Admit items from newest to oldest until one doesn't fit, keeping the kept run contiguous."""
+    kept = []
+    for index in range(len(items) - 1, -1, -1):
+        if not budget.take(costs[index]):
+            for _ in range(index + 1):
+                budget.drop(category)
+            break
+        kept.append(items[index])
+    kept.reverse()
+    return kept
+
+
+def prepare_conversation_context(conversation_id: int, prompt: str = "") -> Dict[str, Any]:
+    """Assemble the system prompt, history, and per-turn context for a turn within CONTEXT_TOKEN_BUDGET.
+
+    Context files edited on disk since they were added are refreshed first.
+    Sections are admitted by priority: recent messages, the summary of compacted
+    history, context files, workspace chunks retrieved for the prompt, the
+    workspace tree, older messages, then previous code artifacts. Anything that doesn't fit is left out and listed in the
+    returned budget report.
+
+    The prompt is laid out from stable to volatile so Ollama can reuse the KV
+    cache of the previous turn: the system prompt (rules, workspace tree, context
+    files) and the history only change when the conversation does, while the
+    artifacts and retrieved excerpts, which change from turn to turn, are
+    returned as ``turn_context`` to precede the prompt in the final user message.
+    """
+    refresh_stale_contexts(conversation_id)
+    messages = conversation_db.get_conversation_messages(conversation_id)
+    summary = conversation_db.get_latest_summary(conversation_id) if history_summarizer.enabled else None
+    messages = history_summarizer.split_history(messages, summary)
     workspace_path = conversation_db.get_workspace(conversation_id)
+    version = conversation_db.get_context_version(conversation_id)
 
-    system_context = build_agent_system_prompt(workspace_path, contexts, code_artifacts)
+    segments = prompt_section_cache.get(conversation_id, version)
+    if segments is None:
+        segments = load_prompt_segments(conversation_id)
+        prompt_section_cache.put(conversation_id, version, segments)
+
+    budget = ContextBudget(CONTEXT_TOKEN_BUDGET)
+    budget.reserve(tokenizer.count(AGENT_SYSTEM_RULES) + tokenizer.count(TURN_REQUEST_HEADER)
+                   + tokenizer.count_message({"content": prompt}))
+
+    history = [{"role": msg['role'], "content": msg['content']} for msg in messages]
+    costs = [tokenizer.count_message(msg) for msg in history]
+    split = max(0, len(history) - RECENT_MESSAGE_COUNT)
+
+    recent = _admit_newest_first(budget, history[split:], costs[split:], "messages")
+
+    summary_message = None
+    if summary:
+        summary_message = {
+            "role": "system",
+            "content": f"SUMMARY OF EARLIER CONVERSATION ({summary['message_count']} messages):\n{summary['summary']}"
+        }
+        if not budget.take(tokenizer.count_message(summary_message)):
+            budget.drop("summary")
+            summary_message = None
+
+    header_tokens = tokenizer.count(CONTEXT_FILES_HEADER) if segments["contexts"] else 0
+    budget.reserve(header_tokens)
+    kept_contexts = []
+    for segment in segments["contexts"]:
+        if budget.take(segment["tokens"]):
+            kept_contexts.append(segment)
+        else:
+            budget.drop("context_files", segment["label"])
+    if not kept_contexts:
+        budget.release(header_tokens)
+
+    retrieved = []
+    if workspace_path and prompt and RETRIEVAL_TOP_K > 0:
+        header_tokens = tokenizer.count(RETRIEVAL_HEADER)
+        budget.reserve(header_tokens)
+        context_paths = {segment["label"] for segment in segments["contexts"]}
+        for chunk in retrieval_index.search(workspace_path, prompt, RETRIEVAL_TOP_K, context_paths):
+            text = render_retrieved_chunk(chunk)
+            if budget.take(tokenizer.count(text)):
+                retrieved.append(text)
+            else:
+                budget.drop("retrieved_chunks", f"{chunk['path']}:{chunk['start_line']}")
+        if not retrieved:
+            budget.release(header_tokens)
+
+    workspace_section = build_workspace_section(workspace_path)
+    if workspace_section and not budget.take(tokenizer.count(workspace_section)):
+        budget.drop("workspace_tree")
+        workspace_section = f"\n\nWORKSPACE: {workspace_path}\n"
+
+    older = []
+    if len(recent) == len(history[split:]):
+        older = _admit_newest_first(budget, history[:split], costs[:split], "messages")
+    else:
+        for _ in range(split):
+            budget.drop("messages")
+
+    header_tokens = tokenizer.count(ARTIFACTS_HEADER) if segments["artifacts"] else 0
+    budget.reserve(header_tokens)
+    kept_artifacts = _admit_newest_first(
+        budget, segments["artifacts"], [segment["tokens"] for segment in segments["artifacts"]], "artifacts"
+    )
+    if not kept_artifacts:
+        budget.release(header_tokens)
+
+    sections = []
+    if kept_contexts:
+        sections.append(CONTEXT_FILES_HEADER)
+        sections.extend(segment["text"] for segment in kept_contexts)
+
+    turn_sections = []
+    if kept_artifacts:
+        turn_sections.append(ARTIFACTS_HEADER)
+        turn_sections.extend(segment["text"] for segment in kept_artifacts)
+    if retrieved:
+        turn_sections.append(RETRIEVAL_HEADER)
+        turn_sections.extend(retrieved)
+
+    system_context = AGENT_SYSTEM_RULES + workspace_section + "".join(sections)
 
     return {
         "system": system_context,
-        "messages": [{"role": msg['role'], "content": msg['content']} for msg in messages],
-        "workspace_path": workspace_path
+        "messages": ([summary_message] if summary_message else []) + older + recent,
+        "turn_context": "".join(turn_sections),
+        "workspace_path": workspace_path,
+        "context_file_count": len(segments["contexts"]),
+        "retrieved_chunk_count": len(retrieved),
+        "budget": budget.report()
     }
 
 
-def preprocess_code_content(content: str) -> str:
-    lines = content.split('\n')
-    processed_lines = []
-    in_multiline_comment = False
-    in_docstring = False
-    docstring_quotes = None
+# Bump when preprocess_code_content() output changes so cached compressions are not reused
+COMPRESSION_TRANSFORM = "minify:v2"
+# Bump when outline() output changes
+OUTLINE_TRANSFORM = "outline:v1"
+# "auto" outlines only files whose minified form exceeds OUTLINE_AUTO_TOKENS
+COMPRESSION_MODES = ("minify", "outline", "auto")
+OUTLINE_AUTO_TOKENS = int(os.getenv("OUTLINE_AUTO_TOKENS", 4000))
 
-    for line in lines:
-        if not line.strip():
-            continue
-        if not in_docstring and not in_multiline_comment:
-            docstring_start = re.match(r'\s*(\'\'\'|""").*', line)
-            if docstring_start:
-                in_docstring = True
-                docstring_quotes = docstring_start.group(1)
-                processed_lines.append(line.strip())
-                continue
-        if in_docstring:
-            processed_lines.append(line.strip())
-            if line.strip().endswith(docstring_quotes):
-                in_docstring = False
-            continue
-        if re.match(r'^\s*#.*$', line):
-            continue
-        if not in_multiline_comment:
-            in_string = False
-            string_char = None
-            for i, char in enumerate(line):
-                if char in '"\'':
-                    if not in_string:
-                        in_string = True
-                        string_char = char
-                    elif char == string_char:
-                        in_string = False
-                if char == '#' and not in_string:
-                    line = line[:i].rstrip()
-                    break
-        line = ' '.join(line.split())
-        if line:
-            processed_lines.append(line)
 
-    from textwrap import dedent
-    processed_content = '\n'.join(processed_lines)
-    processed_content = dedent(processed_content)
-    return processed_content
+def preprocess_code_content(content: str, language: str = 'python') -> str:
+    return minify(content, language)
+
+
+def _cached_transform(source_hash: str, transform: str, build, derived: list = None) -> str:
+    """Return a stored derivation of the source, computing and storing it on a miss.
+
+    With ``derived`` a miss is appended there as (source_hash, transform, result)
+    for the caller to store in its own transaction instead of one write per file.
+    """
+    # Identical source was compressed before (any conversation): reuse the stored result
+    cached = conversation_db.get_derived_content(source_hash, transform)
+    if cached is not None:
+        return cached
+    result = build()
+    if derived is None:
+        conversation_db.put_derived_content(source_hash, transform, result)
+    else:
+        derived.append((source_hash, transform, result))
+    return result
 
 
-def compress_file_content(file_path: str, content: str) -> str:
+def compress_file_content(file_path: str, content: str, source_hash: str = None,
+                          mode: str = "minify", focus: List[str] = (), derived: list = None) -> str:
+    """Compress a file for context: ``minify`` strips comments and whitespace,
+    ``outline`` keeps only signatures and docstrings except for the focus symbols,
+    ``auto`` outlines files too large to minify into OUTLINE_AUTO_TOKENS."""
     ext = file_path.split('.')[-1].lower()
     if ext in ['json', 'yaml', 'yml']:
         return content
-    return preprocess_code_content(content)
+    language = _detect_language(file_path)
+    source_hash = source_hash or content_hash(content)
+    focus = sorted(set(focus))
+
+    if mode != "outline":
+        minified = _cached_transform(source_hash, f"{COMPRESSION_TRANSFORM}:{language}",
+                                     lambda: preprocess_code_content(content, language), derived)
+        if mode == "minify" or tokenizer.count(minified) <= OUTLINE_AUTO_TOKENS:
+            return minified
+    return _cached_transform(source_hash, f"{OUTLINE_TRANSFORM}:{language}:{','.join(focus)}",
+                             lambda: outline(content, language, focus), derived)
+
+
+def parse_compression_options(form) -> Tuple[str, List[str]]:
+    """Read the ``compression`` mode and comma-separated ``focus`` symbols of a request.
+
+    :raises ValueError: for an unknown compression mode
+    """
+    mode = (form.get("compression") or "minify").lower()
+    if mode not in COMPRESSION_MODES:
+        raise ValueError(f"Unknown compression mode '{mode}' (expected one of: {', '.join(COMPRESSION_MODES)})")
+    focus = [name.strip() for name in (form.get("focus") or "").split(",") if name.strip()]
+    return mode, focus
+
+
+CODE_BLOCK_PATTERN = re.compile(r'```(\w+)?(?::([^\n]+))?\n([\s\S]*?)```')
+
+
+def extract_code_artifacts(response_text: str) -> List[Dict[str, Any]]:
+    """Pull fenced code blocks (optionally tagged with a file path) out of a response."""
+    artifacts = []
+    for match in CODE_BLOCK_PATTERN.finditer(response_text):
+        language = match.group(1) or 'text'
+        file_path = match.group(2) or None
+        code_content = match.group(3).strip()
+
+        if not code_content:
+            continue
+        if not language or language == 'text':
+            if 'def ' in code_content or 'class ' in code_content or 'import ' in code_content:
+                language = 'python'
+            elif 'function ' in code_content or 'const ' in code_content or 'let ' in code_content:
+                language = 'javascript'
+            elif '<' in code_content and '>' in code_content:
+                language = 'html'
+            elif '{' in code_content and '}' in code_content and ';' in code_content:
+                language = 'css'
+
+        artifacts.append({
+            "content": code_content,
+            "language": language,
+            "file_path": file_path
+        })
+    return artifacts
+
+
+def attach_uploaded_file(conversation_id, file) -> None:
+    """Compress an uploaded file and store it as conversation context."""
+    filename = file.filename
+    file_content = file.read().decode("utf-8")
+    source_hash = content_hash(file_content)
+    compressed_content = compress_file_content(filename, file_content, source_hash)
+    metadata = {
+        "original_size": len(file_content),
+        "compressed_size": len(compressed_content),
+        "compression_ratio": round(len(compressed_content) / len(file_content) * 100, 2) if file_content else 100.0
+    }
+    conversation_db.add_project_context(
+        conversation_id, filename, compressed_content,
+        metadata=metadata,
+        token_count=tokenizer.count(render_context_file({"file_path": filename, "file_content": compressed_content})),
+        source_hash=source_hash
+    )
+
+
+def build_api_messages(conversation_id, prompt: str) -> Dict[str, Any]:
+    """Assemble the chat-completions payload for the next turn."""
+    context = prepare_conversation_context(conversation_id, prompt or "")
+    # Only the bare prompt is stored, so next turn's history still matches this turn's prefix
+    content = prompt or ""
+    if context["turn_context"]:
+        content = context["turn_context"].lstrip("\n") + TURN_REQUEST_HEADER + content
+    context["messages"].append({"role": "user", "content": content})
+    context["api_messages"] = [{"role": "system", "content": context["system"]}] + context["messages"]
+    return context
+
+
+def turn_timing(ticket, requested_at: float, finished_at: float, first_token_at: float = None,
+                output_tokens: int = 0, prefix: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Split a turn's latency into queueing, prompt evaluation (time to first token), and generation."""
+    timing = {
+        "queue_ms": round(ticket.wait_seconds * 1000),
+        "total_ms": round((finished_at - requested_at) * 1000)
+    }
+    if first_token_at is not None:
+        generation = finished_at - first_token_at
+        timing["prompt_eval_ms"] = round((first_token_at - requested_at) * 1000)
+        timing["generation_ms"] = round(generation * 1000)
+        timing["tokens_per_second"] = round(output_tokens / generation, 1) if output_tokens and generation > 0 else None
+    timing.update(prefix or {})
+    return timing
+
+
+def record_chat_turn(conversation_id, prompt: str, response_text: str,
+                     input_tokens: int, output_tokens: int,
+                     context: Dict[str, Any], timing: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Persist a completed turn and build the response payload shared by /process and /process-stream."""
+    extracted = extract_code_artifacts(response_text)
+    ids = conversation_db.record_turn(
+        conversation_id,
+        messages=[
+            {"role": "user", "content": prompt or "", "input_tokens": input_tokens},
+            {"role": "assistant", "content": response_text, "output_tokens": output_tokens}
+        ],
+        artifacts=extracted
+    )
+
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    artifacts = [
+        {"id": artifact_id, "message_id": ids["message_ids"][-1], **artifact, "timestamp": timestamp}
+        for artifact_id, artifact in zip(ids["artifact_ids"], extracted)
+    ]
+
+    history_summarizer.schedule(conversation_id)
+    total_tokens = conversation_db.get_conversation_tokens(conversation_id)
+
+    print(f"{Fore.GREEN}Successfully processed request for conversation {conversation_id}{Style.RESET_ALL}")
+    print(f"Generated {len(artifacts)} code artifacts")
+    print(f"Total tokens: {total_tokens['total_tokens']}")
+    if timing:
+        print(f"Prompt eval: {timing.get('prompt_eval_ms', '-')}ms, generation: {timing.get('generation_ms', '-')}ms, "
+              f"reused prefix: {timing.get('reused_prefix_tokens', 0)}/{timing.get('prompt_tokens', 0)} tokens")
+
+    return {
+        "conversation_id": conversation_id,
+        "response": response_text,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": total_tokens,
+        "artifacts": artifacts,
+        "workspace_path": context.get("workspace_path"),
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "metadata": {
+            "model": OLLAMA_MODEL,
+            "conversation_name": conversation_db.get_conversation_name(conversation_id),
+            "has_context_files": bool(context.get("context_file_count")),
+            "artifact_count": len(artifacts),
+            "context_budget": context.get("budget"),
+            "timing": timing
+        }
+    }
 
 
 # ─── Routes ───────────────────────────────────────────────────────────────────
@@ -318,29 +883,84 @@ def delete_conversation():
         return jsonify({"error": str(e)}), 500
 
 
+def _snippet_html(snippet: Optional[str]) -> str:
+    """Escape a search snippet and turn its match markers into <mark> tags."""
+    escaped = html.escape(snippet or "")
+    return escaped.replace(SEARCH_MATCH_START, "<mark>").replace(SEARCH_MATCH_END, "</mark>")
+
+
+@app.route("/search")
+def search():
+    """Full-text search over conversation names, messages, and code artifacts."""
+    query = request.args.get("q", "").strip()
+    limit = max(1, min(request.args.get("limit", 20, type=int), 100))
+    if not query:
+        return jsonify({"query": query, "results": []})
+
+    try:
+        results = conversation_db.search(query, limit)
+        for result in results:
+            result["snippet_html"] = _snippet_html(result.pop("snippet"))
+            result["formatted_time"] = format_timestamp(result["timestamp"]) if result["timestamp"] else ""
+            result["rank"] = round(result["rank"], 4)
+        return jsonify({"query": query, "results": results})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def message_page(conversation_id, before_id: int = None, limit: int = None) -> Dict[str, Any]:
+    """Load one page of messages with their artifact summaries attached."""
+    limit = max(1, min(limit or MESSAGE_PAGE_SIZE, MESSAGE_PAGE_MAX))
+    page = conversation_db.get_message_page(conversation_id, before_id, limit)
+    messages = page["messages"]
+    artifacts = conversation_db.get_artifact_summaries([m["id"] for m in messages])
+    for message in messages:
+        message["formatted_time"] = format_timestamp(message["timestamp"])
+        message["artifacts"] = artifacts.get(message["id"], [])
+    return {
+        "messages": messages,
+        "has_more": page["has_more"],
+        "next_before": messages[0]["id"] if messages else None
+    }
+
+
+def list_contexts(conversation_id) -> List[Dict[str, Any]]:
+    """Describe a conversation's context files (sizes, token counts) without loading their content."""
+    contexts = conversation_db.get_context_summaries(conversation_id)
+    missing_counts = {}
+    listing = []
+    for context in contexts:
+        tokens = context["token_count"]
+        if tokens is None:
+            # Rows stored before token counts were cached; count once so the listing is stable per version
+            stored = conversation_db.get_project_context(context["id"])
+            tokens = missing_counts[context["id"]] = tokenizer.count(render_context_file(stored))
+        metadata = _context_metadata(context["metadata"])
+        listing.append({
+            "id": context["id"],
+            "file_path": context["file_path"],
+            "file_type": context["file_type"],
+            "last_updated": context["last_updated"],
+            "token_count": tokens,
+            "original_size": metadata.get("original_size"),
+            "compressed_size": metadata.get("compressed_size"),
+            "compression": metadata.get("compression"),
+            "source": metadata.get("source")
+        })
+    if missing_counts:
+        conversation_db.set_context_token_counts(missing_counts)
+    return listing
+
+
 @app.route("/load-conversation/<int:conversation_id>")
 def load_conversation(conversation_id):
     try:
-        messages = conversation_db.get_conversation_messages(conversation_id)
-        contexts = conversation_db.get_project_contexts(conversation_id)
-        conversation_tokens = conversation_db.get_conversation_tokens(conversation_id)
-        code_artifacts = conversation_db.get_code_artifacts(conversation_id)
-        workspace_path = conversation_db.get_workspace(conversation_id)
-
-        for message in messages:
-            message['formatted_time'] = format_timestamp(message['timestamp'])
-            message['artifacts'] = [
-                artifact for artifact in code_artifacts
-                if abs(datetime.strptime(artifact['timestamp'], '%Y-%m-%d %H:%M:%S').timestamp() -
-                      datetime.strptime(message['timestamp'], '%Y-%m-%d %H:%M:%S').timestamp()) <= 1
-            ]
-
+        page = message_page(conversation_id, limit=request.args.get("limit", type=int))
         return jsonify({
-            "messages": messages,
-            "contexts": contexts,
-            "tokens": conversation_tokens,
-            "artifacts": code_artifacts,
-            "workspace_path": workspace_path,
+            **page,
+            "contexts": list_contexts(conversation_id),
+            "tokens": conversation_db.get_conversation_tokens(conversation_id),
+            "workspace_path": conversation_db.get_workspace(conversation_id),
             "colors": COLORS
         })
     except Exception as e:
@@ -348,6 +968,60 @@ def load_conversation(conversation_id):
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/load-messages/<int:conversation_id>")
+def load_messages(conversation_id):
+    try:
+        return jsonify(message_page(
+            conversation_id,
+            before_id=request.args.get("before", type=int),
+            limit=request.args.get("limit", type=int)
+        ))
+    except Exception as e:
+        print(f"{Fore.RED}Failed to load messages for conversation {conversation_id}: {str(e)}{Style.RESET_ALL}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/list-contexts/<int:conversation_id>")
+def list_contexts_endpoint(conversation_id):
+    try:
+        # Read the version before the rows, so a concurrent change can only make the ETag older
+        version = conversation_db.get_context_version(conversation_id)
+        etag = f"ctx-{conversation_id}-{version}"
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            contexts = list_contexts(conversation_id)
+            response = jsonify({
+                "conversation_id": conversation_id,
+                "version": version,
+                "contexts": contexts,
+                "total_tokens": sum(ctx["token_count"] for ctx in contexts)
+            })
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    except Exception as e:
+        print(f"{Fore.RED}Failed to list contexts for conversation {conversation_id}: {str(e)}{Style.RESET_ALL}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/artifact/<int:artifact_id>")
+def get_artifact(artifact_id):
+    artifact = conversation_db.get_code_artifact(artifact_id)
+    if not artifact:
+        return jsonify({"error": "Artifact not found"}), 404
+    return jsonify(artifact)
+
+
+@app.route("/context-file/<int:context_id>")
+def get_context_file(context_id):
+    context = conversation_db.get_project_context(context_id)
+    if not context:
+        return jsonify({"error": "Context file not found"}), 404
+    context["metadata"] = _context_metadata(context["metadata"])
+    return jsonify(context)
+
+
 # ─── File System / Workspace Endpoints ────────────────────────────────────────
 
 @app.route("/drives")
@@ -391,25 +1065,14 @@ def browse_directory():
         if not os.path.isdir(dir_path):
             return jsonify({"error": "Directory not found"}), 404
 
-        items = []
-        for entry in sorted(Path(dir_path).iterdir(), key=lambda x: (not x.is_dir(), x.name.lower())):
-            if entry.name in IGNORE_DIRS:
-                continue
-            try:
-                item = {
-                    "name": entry.name,
-                    "path": str(entry),
-                    "is_dir": entry.is_dir(),
-                }
-                if not entry.is_dir():
-                    stat = entry.stat()
-                    item["size"] = stat.st_size
-                    item["ext"] = entry.suffix.lower()
-                    item["is_image"] = entry.suffix.lower() in IMAGE_EXTENSIONS
-                    item["is_binary"] = entry.suffix.lower() in BINARY_EXTENSIONS
-                items.append(item)
-            except PermissionError:
-                continue
+        workspace = request.args.get("workspace", "")
+        workspace = str(Path(workspace).resolve()) if workspace else ""
+        index = workspace_indexes.get(workspace) if workspace and is_safe_path(dir_path, workspace) \
+            else workspace_indexes.find(dir_path)
+        if index is not None:
+            items = index.list_dir(dir_path)
+        else:
+            items = _list_directory(dir_path)
 
         parent = str(Path(dir_path).parent)
         return jsonify({
@@ -482,11 +1145,15 @@ def write_file():
 
         fp.parent.mkdir(parents=True, exist_ok=True)
         fp.write_text(content, encoding='utf-8')
+        workspace_indexes.invalidate(str(fp.parent))
+        retrieval_index.invalidate(str(fp))
+        refreshed = refresh_stale_contexts(file_path=str(fp))
 
         return jsonify({
             "message": f"File written successfully: {fp.name}",
             "path": str(fp),
-            "size": len(content)
+            "size": len(content),
+            "contexts_refreshed": len(refreshed)
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -508,6 +1175,10 @@ def set_workspace():
 
         success = conversation_db.set_workspace(conversation_id, resolved)
         if success:
+            if resolved:
+                # Build the workspace index in the background so the first turn doesn't pay for it
+                threading.Thread(target=get_directory_tree, args=(resolved,), daemon=True).start()
+                retrieval_index.schedule(resolved)
             return jsonify({
                 "message": "Workspace set successfully",
                 "workspace_path": resolved
@@ -543,6 +1214,11 @@ def add_file_context():
     if not conversation_id or not file_path:
         return jsonify({"error": "Conversation ID and file path are required"}), 400
 
+    try:
+        compression, focus = parse_compression_options(request.form)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     try:
         fp = Path(file_path).resolve()
         if not fp.is_file():
@@ -551,85 +1227,276 @@ def add_file_context():
         if fp.suffix.lower() in BINARY_EXTENSIONS:
             return jsonify({"error": "Binary files cannot be added as context"}), 400
 
-        content = fp.read_text(encoding='utf-8', errors='replace')
-        compressed = compress_file_content(fp.name, content)
-
-        metadata = {
-            "original_size": len(content),
-            "compressed_size": len(compressed),
-            "source": "workspace"
-        }
+        ctx = load_context_file(str(fp), "workspace", compression, focus)
+        if ctx is None:
+            return jsonify({"error": "File could not be read"}), 500
 
         context_id = conversation_db.add_project_context(
-            conversation_id, str(fp), compressed,
-            file_type=_detect_language(fp.name),
-            metadata=json.dumps(metadata)
+            conversation_id, str(fp), ctx["file_content"],
+            file_type=ctx["file_type"],
+            metadata=ctx["metadata"],
+            token_count=ctx["token_count"],
+            source_hash=ctx["source_hash"],
+            source_mtime=ctx["source_mtime"],
+            source_size=ctx["source_size"]
         )
 
         return jsonify({
             "message": f"Added {fp.name} to context",
             "context_id": context_id,
             "file_path": str(fp),
-            "size": len(compressed)
+            "size": len(ctx["file_content"]),
+            "compression": compression
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def iter_folder_files(root: str):
+    """Lazily yield file entries under root, pruning IGNORE_DIRS before descending into them."""
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in IGNORE_DIRS:
+                        subdirs.append(entry.path)
+                elif entry.is_file():
+                    yield entry
+            except OSError:
+                continue
+        stack.extend(reversed(subdirs))
+
+
+def load_context_file(file_path: str, source: str, compression: str = "minify",
+                      focus: List[str] = (), derived: list = None) -> Optional[Dict[str, Any]]:
+    """Read and compress one file for context; returns None if it can't be read.
+
+    ``derived`` collects newly computed compressions instead of storing them (see _cached_transform).
+    """
+    try:
+        stat = os.stat(file_path)
+        content = Path(file_path).read_text(encoding='utf-8', errors='replace')
+    except OSError:
+        return None
+    source_hash = content_hash(content)
+    compressed = compress_file_content(Path(file_path).name, content, source_hash, compression, focus, derived)
+    metadata = {
+        "original_size": len(content),
+        "compressed_size": len(compressed),
+        "source": source,
+        "compression": compression
+    }
+    if focus:
+        metadata["focus"] = list(focus)
+    return {
+        "file_path": file_path,
+        "file_content": compressed,
+        "file_type": _detect_language(file_path),
+        "metadata": metadata,
+        "token_count": tokenizer.count(render_context_file({"file_path": file_path, "file_content": compressed})),
+        "source_hash": source_hash,
+        "source_mtime": stat.st_mtime_ns,
+        "source_size": stat.st_size
+    }
+
+
+def _context_metadata(metadata: Any) -> Dict[str, Any]:
+    """Decode a context row's metadata, tolerating metadata stored JSON-encoded twice."""
+    while isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata)
+        except ValueError:
+            return {}
+    return metadata or {}
+
+
+def refresh_stale_contexts(conversation_id=None, file_path: str = None) -> List[str]:
+    """Re-read context files whose source changed on disk since they were added.
+
+    Only a stat per file is paid when nothing changed. When mtime or size differ
+    the file is re-read and hashed; unchanged content just records the new stat,
+    changed content is recompressed and stored, which bumps the conversation's
+    context_version. Uploaded files (no absolute path) and deleted files keep
+    their last stored copy. Returns the paths that were refreshed.
+    """
+    refreshed = []
+    for row in conversation_db.get_context_sources(conversation_id, file_path):
+        path = row['file_path']
+        if not os.path.isabs(path):
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if row['source_mtime'] == stat.st_mtime_ns and row['source_size'] == stat.st_size:
+            continue
+        metadata = _context_metadata(row['metadata'])
+        ctx = load_context_file(path, metadata.get("source", "workspace"),
+                                metadata.get("compression", "minify"), metadata.get("focus", ()))
+        if ctx is None:
+            continue
+        if ctx['source_hash'] == row['source_hash']:
+            conversation_db.update_context_source(row['id'], ctx['source_mtime'], ctx['source_size'])
+            continue
+        conversation_db.add_project_context(
+            row['conversation_id'], path, ctx['file_content'],
+            file_type=ctx['file_type'],
+            metadata=ctx['metadata'],
+            token_count=ctx['token_count'],
+            source_hash=ctx['source_hash'],
+            source_mtime=ctx['source_mtime'],
+            source_size=ctx['source_size']
+        )
+        refreshed.append(path)
+    return refreshed
+
+
+def ingest_folder(conversation_id, root: Path, max_files: int, compression: str = "minify",
+                  focus: List[str] = ()):
+    """Walk, read, compress, and store a folder's text files, yielding progress events.
+
+    Each file is submitted to ingest_executor as the walk finds it, with at most
+    two reads per worker in flight, so reading overlaps the walk; everything is
+    inserted in one transaction at the end. Progress totals count the files found
+    so far. The final event is ``done`` with the same payload /add-folder-context
+    returns. Closing the generator early cancels the reads not yet started.
+    """
+    skipped = []
+    loaded = []
+    failed = []
+    derived = []
+
+    def load(file_path):
+        # One bad file (or a locked database while caching its compression) must not abort the ingest
+        try:
+            return load_context_file(file_path, "workspace_folder", compression, focus, derived), None
+        except Exception as e:
+            print(f"{Fore.RED}Skipping {file_path}: {str(e)}{Style.RESET_ALL}")
+            return None, str(e)
+
+    def collect(file_path, future):
+        result, error = future.result()
+        if error is not None:
+            failed.append({"file": Path(file_path).name, "error": error})
+        if result is None:
+            skipped.append(Path(file_path).name)
+        else:
+            loaded.append(result)
+        return {"type": "progress", "phase": "reading", "total": found, "processed": processed,
+                "file": Path(file_path).name}
+
+    in_flight = deque()
+    found = processed = 0
+    try:
+        yield {"type": "progress", "phase": "reading", "total": 0, "processed": 0, "skipped_count": 0}
+        for entry in iter_folder_files(str(root)):
+            if found >= max_files:
+                break
+            ext = os.path.splitext(entry.name)[1].lower()
+            try:
+                too_large = entry.stat().st_size > MAX_CONTEXT_FILE_SIZE
+            except OSError:
+                too_large = True
+            if ext in BINARY_EXTENSIONS or ext in IMAGE_EXTENSIONS or too_large:
+                skipped.append(entry.name)
+                continue
+            found += 1
+            in_flight.append((entry.path, ingest_executor.submit(load, entry.path)))
+            if len(in_flight) >= INGEST_WORKERS * 2:
+                processed += 1
+                yield collect(*in_flight.popleft())
+        while in_flight:
+            processed += 1
+            yield collect(*in_flight.popleft())
+    finally:
+        # A disconnected client closes the generator: don't keep reading for it
+        for _, future in in_flight:
+            future.cancel()
+
+    yield {"type": "progress", "phase": "saving", "total": found, "processed": processed}
+    # The compressions computed while reading are stored with the contexts: one write transaction
+    with conversation_db.get_connection():
+        conversation_db.put_derived_contents(derived)
+        conversation_db.add_project_contexts(conversation_id, loaded)
+
+    yield {
+        "type": "done",
+        "message": f"Added {len(loaded)} files from {root.name}/",
+        "added_count": len(loaded),
+        "skipped_count": len(skipped),
+        "failed": failed,
+        "files": [Path(ctx["file_path"]).name for ctx in loaded]
+    }
+
+
 @app.route("/add-folder-context", methods=["POST"])
 def add_folder_context():
-    """Recursively add all text files in a folder to conversation context."""
+    """Recursively add all text files in a folder to conversation context.
+
+    With ``stream=1`` progress is streamed back as NDJSON events ending in
+    ``done`` (or ``error``); otherwise a single JSON summary is returned.
+    """
     conversation_id = request.form.get("conversation_id")
     folder_path = request.form.get("folder_path")
     max_files = int(request.form.get("max_files", 50))
+    stream = request.form.get("stream") in ("1", "true")
 
     if not conversation_id or not folder_path:
         return jsonify({"error": "Conversation ID and folder path are required"}), 400
 
+    try:
+        compression, focus = parse_compression_options(request.form)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     try:
         root = Path(folder_path).resolve()
         if not root.is_dir():
             return jsonify({"error": "Directory not found"}), 404
 
-        added = []
-        skipped = []
-        for fp in sorted(root.rglob("*")):
-            if len(added) >= max_files:
-                break
-            if not fp.is_file():
-                continue
-            if any(part in IGNORE_DIRS for part in fp.parts):
-                continue
-            if fp.suffix.lower() in BINARY_EXTENSIONS or fp.suffix.lower() in IMAGE_EXTENSIONS:
-                skipped.append(fp.name)
-                continue
-            if fp.stat().st_size > 1 * 1024 * 1024:
-                skipped.append(fp.name)
-                continue
+        if stream:
+            def generate():
+                events = ingest_folder(conversation_id, root, max_files, compression, focus)
+                try:
+                    for event in events:
+                        yield _ndjson(event)
+                except Exception as e:
+                    yield _ndjson({"type": "error", "error": str(e)})
+                finally:
+                    # Runs on client disconnect too, cancelling the queued reads
+                    events.close()
+
+            return Response(generate(), mimetype="application/x-ndjson", headers={
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no"
+            })
 
-            try:
-                content = fp.read_text(encoding='utf-8', errors='replace')
-                compressed = compress_file_content(fp.name, content)
-                metadata = json.dumps({
-                    "original_size": len(content),
-                    "compressed_size": len(compressed),
-                    "source": "workspace_folder"
-                })
-                conversation_db.add_project_context(
-                    conversation_id, str(fp), compressed,
-                    file_type=_detect_language(fp.name),
-                    metadata=metadata
-                )
-                added.append(str(fp))
-            except Exception:
-                skipped.append(fp.name)
+        result = None
+        for event in ingest_folder(conversation_id, root, max_files, compression, focus):
+            result = event
+        result.pop("type")
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        return jsonify({
-            "message": f"Added {len(added)} files from {root.name}/",
-            "added_count": len(added),
-            "skipped_count": len(skipped),
-            "files": [Path(f).name for f in added]
-        })
+
+@app.route("/refresh-contexts", methods=["POST"])
+def refresh_contexts():
+    """Re-read a conversation's context files that changed on disk."""
+    conversation_id = request.form.get("conversation_id")
+    if not conversation_id:
+        return jsonify({"error": "Conversation ID is required"}), 400
+
+    try:
+        refreshed = refresh_stale_contexts(conversation_id)
+        return jsonify({"refreshed": refreshed, "count": len(refreshed)})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -644,21 +1511,28 @@ def remove_file_context():
         return jsonify({"error": "Conversation ID and file path are required"}), 400
 
     try:
-        with conversation_db.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                DELETE FROM project_contexts 
-                WHERE conversation_id = ? AND file_path = ?
-            ''', (conversation_id, file_path))
-            if cursor.rowcount > 0:
-                return jsonify({"message": f"Removed context: {file_path}"})
-            return jsonify({"error": "Context not found"}), 404
+        if conversation_db.remove_project_context(conversation_id, file_path):
+            return jsonify({"message": f"Removed context: {file_path}"})
+        return jsonify({"error": "Context not found"}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 # ─── Process / Chat Endpoint ─────────────────────────────────────────────────
 
+@app.route("/llm-status")
+def llm_status():
+    """Report queue depth and per-backend health and load."""
+    return jsonify({"scheduler": llm_scheduler.stats(), "prompt_prefix": prompt_prefix_tracker.stats(),
+                    **backend_pool.stats()})
+
+
+@app.route("/db-status")
+def db_status():
+    """Report database totals, size, schema version, and pending backfills (cheap enough to poll)."""
+    return jsonify(conversation_db.get_database_stats())
+
+
 @app.route("/process", methods=["POST"])
 def process():
     conversation_id = request.form.get("conversation_id")
@@ -673,31 +1547,22 @@ def process():
 
     try:
         if file:
-            filename = file.filename
-            file_content = file.read().decode("utf-8")
-            compressed_content = compress_file_content(filename, file_content)
-            metadata = {
-                "original_size": len(file_content),
-                "compressed_size": len(compressed_content),
-                "compression_ratio": round(len(compressed_content) / len(file_content) * 100, 2)
-            }
-            conversation_db.add_project_context(
-                conversation_id, filename, compressed_content,
-                metadata=json.dumps(metadata)
-            )
-
-        context = prepare_conversation_context(conversation_id)
-        context["messages"].append({"role": "user", "content": prompt or ""})
-
-        project_contexts = conversation_db.get_project_contexts(conversation_id)
-        api_messages = [{"role": "system", "content": context["system"]}] + context["messages"]
-
-        response = client.chat.completions.create(
-            model=OLLAMA_MODEL,
-            messages=api_messages,
-            max_tokens=4096,
-            temperature=0.7
-        )
+            attach_uploaded_file(conversation_id, file)
+
+        context = build_api_messages(conversation_id, prompt)
+
+        with llm_scheduler.slot(conversation_id) as ticket:
+            requested_at = time.monotonic()
+            lease, response = backend_pool.run(conversation_id, lambda client: client.chat.completions.create(
+                model=OLLAMA_MODEL,
+                messages=context["api_messages"],
+                max_tokens=MAX_OUTPUT_TOKENS,
+                temperature=0.7,
+                extra_body=OLLAMA_EXTRA_BODY
+            ), hold=True)
+            lease.release()
+            finished_at = time.monotonic()
+        prefix = prompt_prefix_tracker.observe(conversation_id, lease.backend.url, context["api_messages"])
 
         response_text = response.choices[0].message.content
         response_text = strip_thinking_tokens(response_text)
@@ -705,66 +1570,19 @@ def process():
         input_tokens = response.usage.prompt_tokens if response.usage else 0
         output_tokens = response.usage.completion_tokens if response.usage else 0
 
-        conversation_db.add_message(conversation_id, "user", prompt, input_tokens)
-        conversation_db.add_message(conversation_id, "assistant", response_text, output_tokens=output_tokens)
-
-        artifacts = []
-        code_block_pattern = r'```(\w+)?(?::([^\n]+))?\n([\s\S]*?)```'
-        for match in re.finditer(code_block_pattern, response_text):
-            language = match.group(1) or 'text'
-            file_path = match.group(2) or None
-            code_content = match.group(3).strip()
-
-            if code_content:
-                if not language or language == 'text':
-                    if 'def ' in code_content or 'class ' in code_content or 'import ' in code_content:
-                        language = 'python'
-                    elif 'function ' in code_content or 'const ' in code_content or 'let ' in code_content:
-                        language = 'javascript'
-                    elif '<' in code_content and '>' in code_content:
-                        language = 'html'
-                    elif '{' in code_content and '}' in code_content and ';' in code_content:
-                        language = 'css'
-
-                artifact_id = conversation_db.add_code_artifact(
-                    conversation_id, code_content, language
-                )
-
-                artifacts.append({
-                    "id": artifact_id,
-                    "content": code_content,
-                    "language": language,
-                    "file_path": file_path,
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
-
-        total_tokens = conversation_db.get_conversation_tokens(conversation_id)
-
-        response_data = {
-            "conversation_id": conversation_id,
-            "response": response_text,
-            "input_tokens": input_tokens,
-            "output_tokens": output_tokens,
-            "total_tokens": total_tokens,
-            "artifacts": artifacts,
-            "workspace_path": context.get("workspace_path"),
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "metadata": {
-                "model": OLLAMA_MODEL,
-                "conversation_name": conversation_db.get_conversation_name(conversation_id),
-                "has_context_files": bool(project_contexts),
-                "artifact_count": len(artifacts)
-            }
-        }
-
-        print(f"{Fore.GREEN}Successfully processed request for conversation {conversation_id}{Style.RESET_ALL}")
-        print(f"Generated {len(artifacts)} code artifacts")
-        print(f"Total tokens: {total_tokens['total_tokens']}")
-
+        response_data = record_chat_turn(
+            conversation_id, prompt, response_text,
+            input_tokens, output_tokens, context,
+            turn_timing(ticket, requested_at, finished_at, prefix=prefix)
+        )
         return jsonify(response_data)
 
+    except QueueTimeout as e:
+        print(f"{Fore.YELLOW}Server busy: {str(e)}{Style.RESET_ALL}")
+        return jsonify({"error": f"Server busy: {str(e)}. Please retry."}), 503
+
     except ConnectionError as conn_error:
-        error_message = f"Ollama Connection Error: {str(conn_error)} - Is Ollama running at {OLLAMA_BASE_URL}?"
+        error_message = _connection_error_message(conn_error)
         print(f"{Fore.RED}{error_message}{Style.RESET_ALL}")
         return jsonify({"error": error_message}), 503
 
@@ -777,8 +1595,153 @@ def process():
         }), 500
 
 
+def _connection_error_message(error: ConnectionError, lease=None) -> str:
+    """Describe a failed LLM call with the URLs of the backends that actually failed."""
+    urls = [lease.backend.url] if lease is not None else getattr(error, "urls", None) or OLLAMA_BASE_URLS
+    return f"Ollama Connection Error: {str(error)} - Is Ollama running at {', '.join(urls)}?"
+
+
+def _ndjson(event: Dict[str, Any]) -> str:
+    return json.dumps(event) + "\n"
+
+
+@app.route("/process-stream", methods=["POST"])
+def process_stream():
+    """Streaming variant of /process that relays answer deltas as NDJSON lines.
+
+    Events: ``start`` (conversation id), ``delta`` (visible answer text with
+    thinking blocks removed), then ``done`` carrying the same payload as
+    /process, or ``error``. The turn is persisted once the stream completes.
+    """
+    conversation_id = request.form.get("conversation_id")
+    if not conversation_id:
+        conversation_id = conversation_db.create_conversation()
+
+    prompt = request.form.get("prompt")
+    file = request.files.get("file")
+
+    if not prompt and not file:
+        return jsonify({"error": "Please provide a prompt or attach a file."}), 400
+
+    try:
+        if file:
+            attach_uploaded_file(conversation_id, file)
+        context = build_api_messages(conversation_id, prompt)
+    except Exception as e:
+        error_message = f"Processing Error: {str(e)}"
+        print(f"{Fore.RED}{error_message}{Style.RESET_ALL}")
+        return jsonify({"error": error_message}), 500
+
+    def generate():
+        yield _ndjson({"type": "start", "conversation_id": conversation_id})
+
+        stream = lease = failure = None
+        ticket = llm_scheduler.submit(conversation_id)
+        try:
+            # Queue updates double as a liveness probe: writing to a closed connection
+            # closes this generator, and the finally block gives up the queue slot
+            for position in llm_scheduler.wait_turn(ticket):
+                yield _ndjson({"type": "queued", "position": position})
+
+            # The lease stays held (counted against its backend) until the stream is consumed
+            requested_at = time.monotonic()
+            lease, stream = backend_pool.run(conversation_id, lambda client: client.chat.completions.create(
+                model=OLLAMA_MODEL,
+                messages=context["api_messages"],
+                max_tokens=MAX_OUTPUT_TOKENS,
+                temperature=0.7,
+                stream=True,
+                stream_options={"include_usage": True},
+                extra_body=OLLAMA_EXTRA_BODY
+            ), hold=True)
+            prefix = prompt_prefix_tracker.observe(conversation_id, lease.backend.url, context["api_messages"])
+
+            stripper = ThinkingStripper()
+            parts = []
+            input_tokens = output_tokens = 0
+            first_token_at = None
+            for chunk in stream:
+                if chunk.usage:
+                    input_tokens = chunk.usage.prompt_tokens or 0
+                    output_tokens = chunk.usage.completion_tokens or 0
+                if not chunk.choices:
+                    continue
+                # The first token (visible or thinking) arrives once the prompt has been evaluated
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                visible = stripper.feed(chunk.choices[0].delta.content or "")
+                if visible:
+                    parts.append(visible)
+                    yield _ndjson({"type": "delta", "content": visible})
+
+            tail = stripper.flush()
+            if tail:
+                parts.append(tail)
+                yield _ndjson({"type": "delta", "content": tail})
+
+            response_text = "".join(parts).strip()
+            timing = turn_timing(ticket, requested_at, time.monotonic(), first_token_at, output_tokens, prefix)
+            response_data = record_chat_turn(
+                conversation_id, prompt, response_text,
+                input_tokens, output_tokens, context, timing
+            )
+            yield _ndjson({"type": "done", **response_data})
+
+        except QueueTimeout as e:
+            print(f"{Fore.YELLOW}Server busy: {str(e)}{Style.RESET_ALL}")
+            yield _ndjson({"type": "error", "error": f"Server busy: {str(e)}. Please retry."})
+
+        except ConnectionError as conn_error:
+            failure = conn_error
+            error_message = _connection_error_message(conn_error, lease)
+            print(f"{Fore.RED}{error_message}{Style.RESET_ALL}")
+            yield _ndjson({"type": "error", "error": error_message})
+
+        except Exception as e:
+            failure = e
+            error_message = f"Processing Error: {str(e)}"
+            print(f"{Fore.RED}{error_message}{Style.RESET_ALL}")
+            yield _ndjson({"type": "error", "error": error_message})
+
+        finally:
+            if stream is not None:
+                stream.close()
+            if lease is not None:
+                lease.release(failure)
+            llm_scheduler.release(ticket)
+
+    return Response(generate(), mimetype="application/x-ndjson", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
 # ─── Helpers ──────────────────────────────────────────────────────────────────
 
+def _list_directory(dir_path: str) -> List[Dict[str, Any]]:
+    """List a directory outside any indexed workspace (e.g. the browse modal)."""
+    items = []
+    for entry in sorted(Path(dir_path).iterdir(), key=lambda x: (not x.is_dir(), x.name.lower())):
+        if entry.name in IGNORE_DIRS:
+            continue
+        try:
+            item = {
+                "name": entry.name,
+                "path": str(entry),
+                "is_dir": entry.is_dir(),
+            }
+            if not entry.is_dir():
+                stat = entry.stat()
+                item["size"] = stat.st_size
+                item["ext"] = entry.suffix.lower()
+                item["is_image"] = entry.suffix.lower() in IMAGE_EXTENSIONS
+                item["is_binary"] = entry.suffix.lower() in BINARY_EXTENSIONS
+            items.append(item)
+        except PermissionError:
+            continue
+    return items
+
+
 def _detect_language(filename: str) -> str:
     ext_map = {
         '.py': 'python', '.js': 'javascript', '.ts': 'typescript',
@@ -815,11 +1778,13 @@ def internal_error(error):
     }), 500
 
 
-if __name__ == "__main__":
+def initialize_server(start_warmup: bool = True) -> None:
+    """Ensure the schema is current and warm up the model; shared by every launcher."""
     print(f"{Fore.CYAN}Starting CodeChat Agent Server{Style.RESET_ALL}")
-    print(f"Environment: {'Development' if app.debug else 'Production'}")
-    print(f"LLM Backend: Ollama @ {OLLAMA_BASE_URL}")
+    print(f"LLM Backends: Ollama @ {', '.join(backend.url for backend in backend_pool.backends)} "
+          f"(routing: {backend_pool.routing})")
     print(f"Model: {OLLAMA_MODEL}")
+    print(f"Tokenizer: {tokenizer.name}")
     print(f"Database: {conversation_db.db_path}")
 
     try:
@@ -828,14 +1793,29 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"{Fore.RED}Database initialization failed: {str(e)}{Style.RESET_ALL}")
         raise
+    # Data rewrites queued by migrations run in small chunks while requests are served
+    conversation_db.start_backfills(pause=float(os.getenv("DB_BACKFILL_PAUSE", 0.05)))
+    # Hard-delete conversations past their retention period and return freed pages to the filesystem
+    conversation_db.start_maintenance(interval=float(os.getenv("DB_MAINTENANCE_INTERVAL", 3600)),
+                                      retention_days=int(os.getenv("DB_RETENTION_DAYS", 30)))
 
-    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' or not app.debug:
+    if start_warmup:
         warmup_thread = threading.Thread(target=warmup_model, daemon=True)
         warmup_thread.start()
+        backend_pool.start_health_checks()
+
+
+if __name__ == "__main__":
+    # Development server; use serve.py (or asgi.py) in production
+    debug = os.getenv("FLASK_DEBUG", "1") != "0"
+    print(f"Environment: {'Development' if debug else 'Production'}")
+    # With the reloader on, only the child process that serves requests warms up
+    initialize_server(start_warmup=os.environ.get('WERKZEUG_RUN_MAIN') == 'true' or not debug)
 
     app.run(
-        debug=True,
+        debug=debug,
         host='0.0.0.0',
         port=int(os.getenv('PORT', 5000)),
-        use_reloader=True
+        use_reloader=debug,
+        threaded=True
     )
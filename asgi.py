@@ -0,0 +1,155 @@
+"""
+ASGI entry point: uvicorn asgi:application (or hypercorn asgi:application)
+
+The ASGI server's event loop owns the connections and each request runs the
+Flask app on a dedicated thread pool of SERVER_THREADS threads, so slow LLM
+streams, file reads, and database work proceed side by side. The worker
+thread sends each response chunk itself and waits until the server has taken
+it, so a slow client holds back its own response only; when the client
+disconnects the response iterable is closed, which stops a streaming chat or
+folder ingest.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app, initialize_server
+
+# Each streaming chat holds a thread for its whole response
+SERVER_THREADS = int(os.getenv("SERVER_THREADS", 64))
+# Request bodies larger than this are spooled to a temporary file
+MAX_MEMORY_BODY = 1024 * 1024
+
+_executor = ThreadPoolExecutor(max_workers=SERVER_THREADS, thread_name_prefix="asgi-request")
+
+
+class ClientDisconnected(Exception):
+    """The client went away before the response was complete"""
+
+
+class PooledWsgiToAsgi:
+    """Serves a WSGI app to ASGI servers, one pool thread per request, and answers lifespan events."""
+
+    def __init__(self, wsgi_application):
+        self.wsgi_application = wsgi_application
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    _executor.shutdown(wait=False)
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+        body = tempfile.SpooledTemporaryFile(max_size=MAX_MEMORY_BODY)
+        try:
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                body.write(message.get("body", b""))
+                if not message.get("more_body"):
+                    break
+            body.seek(0)
+
+            disconnected = threading.Event()
+            watcher = asyncio.ensure_future(self._watch_disconnect(receive, disconnected))
+            try:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(_executor, self._run, scope, body, send, loop, disconnected)
+            finally:
+                watcher.cancel()
+        finally:
+            body.close()
+
+    @staticmethod
+    async def _watch_disconnect(receive, disconnected: threading.Event):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected.set()
+
+    def _run(self, scope, body, send, loop, disconnected: threading.Event):
+        """Run the WSGI app on a pool thread, sending its response through the event loop."""
+        response = {}
+
+        def send_message(message):
+            if disconnected.is_set():
+                raise ClientDisconnected()
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def send_start():
+            if not response.get("started"):
+                response["started"] = True
+                send_message({"type": "http.response.start", "status": response["status"],
+                              "headers": response["headers"]})
+
+        def write(data: bytes):
+            send_start()
+            send_message({"type": "http.response.body", "body": data, "more_body": True})
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and response.get("started"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                                   for name, value in headers]
+            return write
+
+        iterable = self.wsgi_application(self._environ(scope, body), start_response)
+        try:
+            for chunk in iterable:
+                if chunk:
+                    write(chunk)
+            send_start()
+            send_message({"type": "http.response.body", "body": b"", "more_body": False})
+        except ClientDisconnected:
+            pass
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+
+    @staticmethod
+    def _environ(scope, body) -> dict:
+        """Build the WSGI environ for an ASGI HTTP scope (PEP 3333)."""
+        root_path = scope.get("root_path", "")
+        path = scope["path"]
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        server = scope.get("server") or ("localhost", 80)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": root_path.encode("utf-8").decode("latin-1"),
+            "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1] or 80),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        if scope.get("client"):
+            environ["REMOTE_ADDR"], environ["REMOTE_PORT"] = scope["client"][0], str(scope["client"][1])
+        for raw_name, raw_value in scope.get("headers", []):
+            name, value = raw_name.decode("latin-1").upper().replace("-", "_"), raw_value.decode("latin-1")
+            if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                name = f"HTTP_{name}"
+            environ[name] = f"{environ[name]},{value}" if name in environ else value
+        return environ
+
+
+initialize_server()
+
+application = PooledWsgiToAsgi(app)
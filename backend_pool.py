@@ -0,0 +1,280 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROUTING_MODES = ("affinity", "least_outstanding")
+
+
+class BackendsUnavailable(ConnectionError):
+    """
+    Every backend tried for a call failed; urls lists them in the order tried
+    """
+
+    def __init__(self, urls: List[str], error: BaseException):
+        super().__init__(str(error))
+        self.urls = urls
+
+
+class Backend:
+    """
+    One LLM server: its client plus the load and health the pool routes on
+    """
+
+    def __init__(self, url: str, client: Any):
+        self.url = url
+        self.client = client
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.total_requests = 0
+        self.total_failures = 0
+        self.last_error: Optional[str] = None
+        self.last_checked: Optional[float] = None
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "consecutive_failures": self.consecutive_failures,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures,
+            "last_error": self.last_error
+        }
+
+
+class Lease:
+    """
+    A request's claim on a backend; counts as outstanding until released
+    """
+
+    def __init__(self, pool: 'BackendPool', backend: Backend, key: Optional[str]):
+        self.pool = pool
+        self.backend = backend
+        self.key = key
+        self._released = False
+
+    def release(self, error: BaseException = None):
+        """
+        Return the backend to the pool, counting error against it if it is a backend failure
+        """
+        if not self._released:
+            self._released = True
+            self.pool._finish(self, error)
+
+
+class BackendPool:
+    """
+    Routes LLM calls across several OpenAI-compatible servers (e.g. Ollama hosts)
+
+    With 'affinity' routing a conversation sticks to the backend that served it
+    last, so that backend's KV cache for the conversation's prompt prefix stays
+    warm; it spills to the least-loaded backend while its own has max_outstanding
+    requests or is unhealthy. 'least_outstanding' always picks the least-loaded
+    backend. A backend that fails failure_threshold calls in a row is evicted
+    until a background health check (GET /models) succeeds again, at which point
+    it is warmed up before rejoining.
+
+    :param make_client: Builds the client for a base URL
+    :param failure_types: Exceptions that mean the backend (not the request) failed
+    :param warm: Called with a backend to load the model into memory
+    :param health_interval: Seconds between health checks (0 disables the checker)
+    """
+
+    def __init__(self, urls: Iterable[str], make_client: Callable[[str], Any],
+                 failure_types: Tuple[Type[BaseException], ...] = (ConnectionError,),
+                 routing: str = "affinity", max_outstanding: int = 1,
+                 failure_threshold: int = 2, health_interval: float = 15.0,
+                 health_timeout: float = 5.0, warm: Callable[[Backend], None] = None,
+                 max_affinity_keys: int = 4096):
+        if routing not in ROUTING_MODES:
+            raise ValueError(f"Unknown routing mode '{routing}' (expected one of {', '.join(ROUTING_MODES)})")
+        urls = list(dict.fromkeys(url.strip().rstrip('/') for url in urls if url and url.strip()))
+        if not urls:
+            raise ValueError("At least one backend URL is required")
+        self.backends = [Backend(url, make_client(url)) for url in urls]
+        self.failure_types = failure_types
+        self.routing = routing
+        self.max_outstanding = max(1, max_outstanding)
+        self.failure_threshold = max(1, failure_threshold)
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.warm = warm
+        self.max_affinity_keys = max_affinity_keys
+        self._affinity: 'OrderedDict[str, Backend]' = OrderedDict()
+        self._next = 0  # Rotates ties between equally loaded backends
+        self._lock = threading.Lock()
+        self._health_thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self.backends)
+
+    def acquire(self, key=None, exclude: Iterable[str] = ()) -> Lease:
+        """
+        Pick a backend for a request and count it as outstanding
+
+        :param key: Affinity key (conversation ID); None routes by load only
+        :param exclude: Backend URLs to avoid (already failed for this request)
+        """
+        key = str(key) if key is not None else None
+        exclude = set(exclude)
+        with self._lock:
+            candidates = [b for b in self.backends if b.healthy and b.url not in exclude]
+            if not candidates:
+                # Everything is down or already tried: fall back to any untried backend so the
+                # caller gets a real error (and a recovered backend gets a chance)
+                candidates = [b for b in self.backends if b.url not in exclude] or self.backends
+
+            affinity = self.routing == "affinity" and key is not None
+            bound = self._affinity.get(key) if affinity else None
+            if bound in candidates and bound.outstanding < self.max_outstanding:
+                backend = bound
+            else:
+                self._next = (self._next + 1) % len(self.backends)
+                backend = min(candidates, key=lambda b: (
+                    b.outstanding, (self.backends.index(b) - self._next) % len(self.backends)))
+            if affinity:
+                # A busy bound backend only spills this request; an unhealthy one loses the binding
+                if bound is None or not bound.healthy:
+                    self._affinity[key] = backend
+                self._affinity.move_to_end(key)
+                while len(self._affinity) > self.max_affinity_keys:
+                    self._affinity.popitem(last=False)
+
+            backend.outstanding += 1
+            backend.total_requests += 1
+            return Lease(self, backend, key)
+
+    def _finish(self, lease: Lease, error: BaseException = None):
+        backend = lease.backend
+        failed = isinstance(error, self.failure_types)
+        with self._lock:
+            backend.outstanding -= 1
+            if not failed:
+                if error is None:
+                    backend.consecutive_failures = 0
+                return
+            backend.consecutive_failures += 1
+            backend.total_failures += 1
+            backend.last_error = f"{type(error).__name__}: {error}"
+            if lease.key is not None and self._affinity.get(lease.key) is backend:
+                # Let the conversation settle on whichever backend serves it next
+                del self._affinity[lease.key]
+            if backend.healthy and backend.consecutive_failures >= self.failure_threshold:
+                backend.healthy = False
+                evicted = True
+            else:
+                evicted = False
+        if evicted:
+            logger.warning(f"Evicted LLM backend {backend.url} after {backend.consecutive_failures} failures: "
+                           f"{backend.last_error}")
+            self.start_health_checks()
+
+    def run(self, key, call: Callable[[Any], Any], hold: bool = False, attempts: int = None):
+        """
+        Call a backend's client, failing over to other backends on backend errors
+
+        :param call: Receives the chosen backend's client
+        :param hold: Return (lease, result) with the lease still held, for streamed
+                     responses that keep using the backend after call returns
+        :param attempts: Backends to try (default: every backend, at least twice in total)
+        :raises BackendsUnavailable: when every attempt failed with a backend error
+        """
+        attempts = attempts or max(2, len(self.backends))
+        tried: List[str] = []
+        last_error: Optional[BaseException] = None
+        for _ in range(attempts):
+            lease = self.acquire(key, exclude=tried if len(tried) < len(self.backends) else ())
+            try:
+                result = call(lease.backend.client)
+            except self.failure_types as e:
+                lease.release(e)
+                tried.append(lease.backend.url)
+                last_error = e
+                logger.warning(f"LLM backend {lease.backend.url} failed, trying another: {e}")
+                continue
+            except BaseException as e:
+                lease.release(e)
+                raise
+            if hold:
+                return lease, result
+            lease.release()
+            return result
+        raise BackendsUnavailable(list(dict.fromkeys(tried)), last_error) from last_error
+
+    def check_health(self, backend: Backend) -> bool:
+        """
+        Probe a backend with GET /models, reinstating (and warming) it if it recovered
+        """
+        try:
+            backend.client.with_options(timeout=self.health_timeout, max_retries=0).models.list()
+            ok = True
+        except Exception as e:
+            ok = False
+            backend.last_error = f"{type(e).__name__}: {e}"
+        with self._lock:
+            backend.last_checked = time.time()
+            recovered = ok and not backend.healthy
+            if ok:
+                backend.consecutive_failures = 0
+            elif backend.healthy:
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures >= self.failure_threshold:
+                    backend.healthy = False
+                    logger.warning(f"Evicted LLM backend {backend.url}: health check failed ({backend.last_error})")
+        if recovered:
+            logger.info(f"LLM backend {backend.url} is healthy again")
+            if self.warm:
+                self.warm(backend)
+            with self._lock:
+                backend.healthy = True
+        return ok
+
+    def check_all(self):
+        for backend in self.backends:
+            self.check_health(backend)
+
+    def start_health_checks(self):
+        """
+        Start the background health checker (idempotent)
+        """
+        if self.health_interval <= 0:
+            return
+        with self._lock:
+            if self._health_thread is not None and self._health_thread.is_alive():
+                return
+            self._health_thread = threading.Thread(target=self._run_health_checks,
+                                                   name="llm-backend-health", daemon=True)
+            self._health_thread.start()
+
+    def _run_health_checks(self):
+        while True:
+            time.sleep(self.health_interval)
+            try:
+                self.check_all()
+            except Exception as e:
+                logger.error(f"LLM backend health check failed: {str(e)}")
+
+    def warmup(self):
+        """
+        Warm every backend in parallel; returns once all have finished or failed
+        """
+        if not self.warm:
+            return
+        threads = [threading.Thread(target=self.warm, args=(backend,), daemon=True) for backend in self.backends]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "routing": self.routing,
+                "affinity_keys": len(self._affinity),
+                "backends": [backend.describe() for backend in self.backends]
+            }
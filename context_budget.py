@@ -0,0 +1,108 @@
+import os
+import re
+from typing import Any, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Per-message framing overhead added by chat templates (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_WORD_PIECES = re.compile(r"\w+|[^\w\s]|\s+")
+
+
+class Tokenizer:
+    """
+    Counts tokens with tiktoken, or with an estimator when no encoding is configured
+
+    The estimator splits text into words, punctuation, and whitespace runs and
+    charges long words roughly one token per four characters, which tracks BPE
+    tokenizers used by local models closely enough for budgeting. Falling back
+    to it because tiktoken is missing or its encoding can't load is logged.
+    """
+
+    def __init__(self, encoding_name: Optional[str] = None):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        if encoding_name:
+            try:
+                import tiktoken
+                self._encoding = tiktoken.get_encoding(encoding_name)
+            except ImportError:
+                logger.warning(f"tiktoken is not installed, estimating tokens instead of using '{encoding_name}' "
+                               f"(pip install tiktoken, or set TOKENIZER_ENCODING= to choose the estimator)")
+            except Exception as e:
+                logger.warning(f"tiktoken encoding '{encoding_name}' unavailable, estimating tokens: {str(e)}")
+
+    @property
+    def name(self) -> str:
+        return f"tiktoken:{self.encoding_name}" if self._encoding else "estimate"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        tokens = 0
+        for piece in _WORD_PIECES.findall(text):
+            if piece.isspace():
+                tokens += 1 if '\n' in piece or len(piece) > 1 else 0
+            else:
+                tokens += max(1, (len(piece) + 3) // 4)
+        return tokens
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        return self.count(message.get('content') or '') + MESSAGE_OVERHEAD_TOKENS
+
+
+tokenizer = Tokenizer(os.getenv("TOKENIZER_ENCODING", "cl100k_base") or None)
+
+
+class ContextBudget:
+    """
+    Tracks token usage while prompt sections are admitted in priority order
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.dropped: Dict[str, List[Any]] = {}
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.limit - self.used)
+
+    def reserve(self, tokens: int):
+        """
+        Charge tokens that must be sent regardless of the budget
+        """
+        self.used += tokens
+
+    def release(self, tokens: int):
+        """
+        Give back tokens charged for a section that ended up empty
+        """
+        self.used = max(0, self.used - tokens)
+
+    def take(self, tokens: int) -> bool:
+        """
+        Admit a section if it fits in the remaining budget
+        """
+        if self.used + tokens > self.limit:
+            return False
+        self.used += tokens
+        return True
+
+    def drop(self, category: str, label: Any = None):
+        self.dropped.setdefault(category, []).append(label)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "budget": self.limit,
+            "used": self.used,
+            "tokenizer": tokenizer.name,
+            "dropped": {
+                category: labels if any(label is not None for label in labels) else len(labels)
+                for category, labels in self.dropped.items()
+            }
+        }
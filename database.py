@@ -1,8 +1,13 @@
 import os
+import hashlib
+import queue
+import re
 import sqlite3
+import threading
+import time
 from datetime import datetime
 import json
-from typing import List, Dict, Any, Optional, Union
+from typing import Iterable, List, Dict, Any, Optional, Tuple, Union
 from contextlib import contextmanager
 import logging
 
@@ -13,147 +18,1091 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Tables whose content is stored in the content-addressed blobs table: (table, legacy content column)
+BLOB_BACKED_TABLES = [('project_contexts', 'file_content'), ('code_artifacts', 'content')]
+
+# Version of the last step in ConversationDatabase._migrations, stored in PRAGMA user_version
+SCHEMA_VERSION = 8
+
+# Columns added since the original schema: (table, column, type, default)
+ADDED_COLUMNS = [
+    ('project_contexts', 'metadata', 'TEXT', "'{}'"),
+    ('conversations', 'workspace_path', 'TEXT', 'NULL'),
+    ('project_contexts', 'token_count', 'INTEGER', 'NULL'),
+    ('conversations', 'context_version', 'INTEGER', '0'),
+    ('project_contexts', 'content_hash', 'TEXT', 'NULL'),
+    ('project_contexts', 'source_hash', 'TEXT', 'NULL'),
+    ('code_artifacts', 'content_hash', 'TEXT', 'NULL'),
+    ('project_contexts', 'source_mtime', 'INTEGER', 'NULL'),
+    ('project_contexts', 'source_size', 'INTEGER', 'NULL'),
+    ('code_artifacts', 'message_id', 'INTEGER', 'NULL'),
+    ('code_artifacts', 'is_executable', 'INTEGER', '0'),
+    ('code_artifacts', 'language', 'TEXT', "'markup'"),
+    ('code_artifacts', 'metadata', 'TEXT', "'{}'"),
+]
+
+# Secondary indexes: (name, table, columns)
+LOOKUP_INDEXES = [
+    ('idx_art_conv_lang', 'code_artifacts', 'conversation_id, language'),
+    ('idx_art_exec', 'code_artifacts', 'is_executable'),
+    ('idx_ctx_hash', 'project_contexts', 'content_hash'),
+    ('idx_ctx_path', 'project_contexts', 'file_path'),
+    ('idx_art_hash', 'code_artifacts', 'content_hash'),
+    ('idx_art_msg', 'code_artifacts', 'message_id'),
+    ('idx_blob_refs', 'blobs', 'ref_count'),
+    ('idx_derived_blob', 'derived_blobs', 'blob_hash'),
+]
+# Composite indexes matching each query's filter and sort order
+COMPOSITE_INDEXES = [
+    ('idx_msg_conv_time', 'messages', 'conversation_id, timestamp'),
+    ('idx_conv_active_updated', 'conversations', 'is_deleted, last_updated'),
+    ('idx_art_conv_time', 'code_artifacts', 'conversation_id, timestamp'),
+]
+
+# Tables whose rows belong to a conversation and are deleted with it
+CONVERSATION_CHILD_TABLES = ['messages', 'project_contexts', 'code_artifacts', 'conversation_summaries']
+
+# Counters kept on each conversation by triggers, with the query that recounts each one
+CONVERSATION_COUNTERS = {
+    'message_count': 'SELECT COUNT(*) FROM messages WHERE conversation_id = conversations.id',
+    'message_bytes': '''SELECT COALESCE(SUM(length(CAST(content AS BLOB))), 0) FROM messages 
+                        WHERE conversation_id = conversations.id''',
+    'artifact_count': 'SELECT COUNT(*) FROM code_artifacts WHERE conversation_id = conversations.id',
+    'artifact_bytes': '''SELECT COALESCE(SUM(b.size), 0) FROM code_artifacts a JOIN blobs b ON b.hash = a.content_hash 
+                         WHERE a.conversation_id = conversations.id''',
+    'context_count': 'SELECT COUNT(*) FROM project_contexts WHERE conversation_id = conversations.id',
+    'context_bytes': '''SELECT COALESCE(SUM(b.size), 0) FROM project_contexts p JOIN blobs b ON b.hash = p.content_hash 
+                        WHERE p.conversation_id = conversations.id''',
+}
+
+# database_stats totals: the table each comes from and the query summing them (over rows aliased t;
+# +is_deleted keeps an id-range chunk on the primary key rather than the is_deleted index)
+DATABASE_TOTALS = [
+    ('conversations', ('active_conversations', 'total_input_tokens', 'total_output_tokens'),
+     '''SELECT COUNT(*), COALESCE(SUM(total_input_tokens), 0), COALESCE(SUM(total_output_tokens), 0)
+        FROM conversations t WHERE +is_deleted = 0'''),
+    ('messages', ('message_count', 'message_bytes'),
+     'SELECT COUNT(*), COALESCE(SUM(length(CAST(content AS BLOB))), 0) FROM messages t WHERE 1'),
+    ('code_artifacts', ('artifact_count', 'artifact_bytes'),
+     '''SELECT COUNT(*), COALESCE(SUM(b.size), 0)
+        FROM code_artifacts t LEFT JOIN blobs b ON b.hash = t.content_hash WHERE 1'''),
+    ('project_contexts', ('context_count', 'context_bytes'),
+     '''SELECT COUNT(*), COALESCE(SUM(b.size), 0)
+        FROM project_contexts t LEFT JOIN blobs b ON b.hash = t.content_hash WHERE 1'''),
+    ('blobs', ('blob_count', 'blob_bytes'), 'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs t WHERE 1'),
+]
+
+# Full-text search indexes and the table whose ids they share
+SEARCH_INDEXES = [('messages_fts', 'messages'), ('artifacts_fts', 'code_artifacts'),
+                  ('conversations_fts', 'conversations')]
+
+# Insert a context file, or replace the row for the same conversation and path (idx_ctx_conv_path)
+CONTEXT_UPSERT = '''
+    INSERT INTO project_contexts 
+    (conversation_id, file_path, file_content, content_hash, source_hash,
+     source_mtime, source_size, file_type, metadata, token_count, last_updated)
+    VALUES (?, ?, '', ?, ?, ?, ?, ?, ?, ?, COALESCE(?, datetime('now')))
+    ON CONFLICT(conversation_id, file_path) DO UPDATE SET
+        file_content = '', content_hash = excluded.content_hash,
+        source_hash = excluded.source_hash, source_mtime = excluded.source_mtime,
+        source_size = excluded.source_size, file_type = excluded.file_type,
+        metadata = excluded.metadata, token_count = excluded.token_count,
+        last_updated = excluded.last_updated
+'''
+
+# PRAGMA auto_vacuum values
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+# Markers wrapped around matched terms in search snippets (control characters never found in text)
+SEARCH_MATCH_START = '\x02'
+SEARCH_MATCH_END = '\x03'
+
+
+def content_hash(content: str) -> str:
+    """
+    SHA-256 hex digest used as the content address of a blob
+    """
+    return hashlib.sha256(content.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
 class ConversationDatabase:
-    def __init__(self, db_path='conversations.db'):
+    def __init__(self, db_path='conversations.db', pool_size: int = 8,
+                 journal_mode: str = 'WAL', synchronous: str = 'NORMAL',
+                 cache_size_kb: int = 16384, busy_timeout: float = 5.0,
+                 migrate: bool = True, backfill_batch_size: int = 2000):
         """
         Initialize the conversation database with improved error handling and logging
+
+        :param db_path: Path to the SQLite database file
+        :param pool_size: Maximum number of pooled connections kept open
+        :param journal_mode: SQLite journal mode (WAL lets readers proceed during writes)
+        :param synchronous: SQLite synchronous level (NORMAL is durable enough under WAL)
+        :param cache_size_kb: Page cache size per connection, in KiB
+        :param busy_timeout: Seconds to wait on a locked database or an exhausted pool
+        :param migrate: Create missing tables and apply pending migrations (False to only inspect)
+        :param backfill_batch_size: Ids per background backfill chunk (one short write transaction each)
         """
         self.db_path = db_path
         self.logger = logging.getLogger(__name__)
-        self._initialize_database()
+        self.pool_size = max(1, pool_size)
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size_kb = cache_size_kb
+        self.busy_timeout = busy_timeout
+        self._pool = queue.LifoQueue(maxsize=self.pool_size)
+        self._pool_lock = threading.Lock()
+        self._connections_created = 0
+        self._local = threading.local()
+        self.backfill_batch_size = max(1, backfill_batch_size)
+        self._backfill_thread: Optional[threading.Thread] = None
+        self._maintenance_thread: Optional[threading.Thread] = None
+        if migrate:
+            self._initialize_database()
+            self._migrate_database()
+
+    def _create_connection(self) -> sqlite3.Connection:
+        """
+        Open a new connection and apply the configured pragmas
+        """
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # Lets free pages be returned to the filesystem; only takes effect when this creates the file
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def _acquire_connection(self) -> sqlite3.Connection:
+        """
+        Take an idle connection from the pool, opening a new one while under pool_size
+        """
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._pool_lock:
+            can_create = self._connections_created < self.pool_size
+            if can_create:
+                self._connections_created += 1
+
+        if can_create:
+            try:
+                return self._create_connection()
+            except Exception:
+                with self._pool_lock:
+                    self._connections_created -= 1
+                raise
+
+        try:
+            return self._pool.get(timeout=self.busy_timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"Timed out waiting for a database connection (pool_size={self.pool_size})"
+            )
+
+    def _release_connection(self, conn: sqlite3.Connection, discard: bool = False):
+        """
+        Return a connection to the pool, or close it if it is no longer usable
+        """
+        if discard:
+            with self._pool_lock:
+                self._connections_created -= 1
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            return
+        self._pool.put_nowait(conn)
 
     @contextmanager
     def get_connection(self):
         """
-        Context manager for database connections with automatic commit/rollback
+        Context manager for pooled database connections with automatic commit/rollback
+
+        Nested use on the same thread shares the outer connection and transaction;
+        only the outermost block commits or rolls back.
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self._acquire_connection()
+        self._local.conn = conn
+        discard = False
         try:
             yield conn
             conn.commit()
         except Exception as e:
-            conn.rollback()
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                discard = True
             self.logger.error(f"Database error: {str(e)}")
             raise
         finally:
-            conn.close()
+            self._local.conn = None
+            self._release_connection(conn, discard=discard)
+
+    def close(self):
+        """
+        Close all idle pooled connections
+        """
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            self._release_connection(conn, discard=True)
 
-    def _safe_add_column(self, cursor, table_name: str, column_name: str, column_type: str, default_value: str = 'NULL'):
+    def _safe_add_column(self, cursor, table_name: str, column_name: str, column_type: str,
+                         default_value: str = 'NULL') -> bool:
         """
-        Safely add a column to a table if it doesn't exist
-        
+        Add a column to a table if it doesn't exist
+
+        Existing rows read the default without being rewritten, so this only
+        changes the schema however large the table is.
+
         :param cursor: Database cursor
         :param table_name: Name of the table
         :param column_name: Name of the column to add
         :param column_type: SQLite column type
         :param default_value: Default value for the column
+        :return: True if the column was added
         """
-        try:
-            # Check if column exists
-            cursor.execute(f"SELECT {column_name} FROM {table_name} LIMIT 1")
-        except sqlite3.OperationalError:
-            # Column doesn't exist, so add it
-            try:
-                alter_query = f"""
-                ALTER TABLE {table_name} 
-                ADD COLUMN {column_name} {column_type} DEFAULT {default_value}
-                """
-                cursor.execute(alter_query)
-                self.logger.info(f"Added column {column_name} to {table_name}")
-                
-                # Update existing rows with default value
-                update_query = f"""
-                UPDATE {table_name} 
-                SET {column_name} = {default_value} 
-                WHERE {column_name} IS NULL
-                """
-                cursor.execute(update_query)
-            except Exception as e:
-                self.logger.error(f"Error adding column {column_name} to {table_name}: {str(e)}")
-                raise
+        if self._column_exists(cursor, table_name, column_name):
+            return False
+        cursor.execute(f'''
+            ALTER TABLE {table_name} 
+            ADD COLUMN {column_name} {column_type} DEFAULT {default_value}
+        ''')
+        self.logger.info(f"Added column {column_name} to {table_name}")
+        return True
+
+    @staticmethod
+    def _column_exists(cursor, table_name: str, column_name: str) -> bool:
+        cursor.execute(f"PRAGMA table_info({table_name})")
+        return any(row['name'] == column_name for row in cursor.fetchall())
+
+    @staticmethod
+    def _schema_object_exists(cursor, object_type: str, name: str) -> bool:
+        cursor.execute('SELECT 1 FROM sqlite_master WHERE type = ? AND name = ?', (object_type, name))
+        return cursor.fetchone() is not None
+
+    def _table_rows(self, cursor, table_name: str) -> int:
+        """
+        Approximate row count from the largest rowid (the id, for tables that have one;
+        a primary key lookup, unlike COUNT(*))
+        """
+        if not self._schema_object_exists(cursor, 'table', table_name):
+            return 0
+        cursor.execute(f'SELECT MAX(rowid) FROM {table_name}')
+        return cursor.fetchone()[0] or 0
+
+    @staticmethod
+    def _schema_version(cursor) -> int:
+        cursor.execute('PRAGMA user_version')
+        return cursor.fetchone()[0]
+
+    def _migrations(self) -> List[Dict[str, Any]]:
+        """
+        Numbered schema migrations; PRAGMA user_version records the last one applied
+
+        Databases from before versioning are at version 0 with any subset of these
+        steps already in place, so every step is idempotent. Add new steps at the
+        end with the next number and never change an applied one. Steps only
+        change the schema; rewriting existing rows is queued as a background
+        backfill (see _backfills).
+        """
+        return [
+            {'version': 1, 'description': 'Add columns introduced since the original schema',
+             'apply': self._migrate_columns, 'estimate': self._estimate_columns},
+            {'version': 2, 'description': 'Store context and artifact content in the blob store',
+             'apply': self._migrate_blobs, 'estimate': self._estimate_blobs},
+            {'version': 3, 'description': 'Create full-text search indexes',
+             'apply': self._create_search_index, 'estimate': self._estimate_search_index},
+            {'version': 4, 'description': 'Add lookup indexes',
+             'apply': lambda cursor: self._create_indexes(cursor, LOOKUP_INDEXES),
+             'estimate': lambda cursor: self._estimate_indexes(cursor, LOOKUP_INDEXES)},
+            {'version': 5, 'description': 'Add composite indexes matching sorted reads',
+             'apply': self._migrate_composite_indexes,
+             'estimate': lambda cursor: self._estimate_indexes(cursor, COMPOSITE_INDEXES)},
+            {'version': 6, 'description': 'Keep one context row per file per conversation',
+             'apply': self._migrate_unique_contexts, 'estimate': self._estimate_unique_contexts},
+            {'version': 7, 'description': 'Delete conversation data with its conversation (foreign keys)',
+             'apply': self._migrate_foreign_keys, 'estimate': self._estimate_foreign_keys},
+            {'version': 8, 'description': 'Keep conversation and database totals as counters',
+             'apply': self._migrate_counters, 'estimate': self._estimate_counters},
+        ]
+
+    def _backfills(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Row rewrites that run in id-range chunks after startup, in this order
+
+        Each job covers the ids that existed when it was queued; newer rows are
+        written correctly by the write paths and triggers. Artifacts are indexed
+        for search before their inline content moves to the blob store, because
+        the blob move's update trigger indexes the rows it moves.
+        """
+        return {
+            'blobs:project_contexts': {
+                'table': 'project_contexts',
+                'run': lambda cursor, after_id, upto_id: self._backfill_blobs(
+                    cursor, 'project_contexts', 'file_content', after_id, upto_id)
+            },
+            'search:messages': {
+                'table': 'messages',
+                'run': lambda cursor, after_id, upto_id: self._backfill_search_index(
+                    cursor, 'messages_fts', 'messages', 'content', after_id, upto_id)
+            },
+            'search:conversations': {
+                'table': 'conversations',
+                'run': lambda cursor, after_id, upto_id: self._backfill_search_index(
+                    cursor, 'conversations_fts', 'conversations', 'name', after_id, upto_id)
+            },
+            'search:artifacts': {
+                'table': 'code_artifacts',
+                'run': lambda cursor, after_id, upto_id: self._backfill_search_index(
+                    cursor, 'artifacts_fts', 'artifact_documents', 'content', after_id, upto_id)
+            },
+            'blobs:code_artifacts': {
+                'table': 'code_artifacts',
+                'run': lambda cursor, after_id, upto_id: self._backfill_blobs(
+                    cursor, 'code_artifacts', 'content', after_id, upto_id)
+            },
+            'artifact_messages': {
+                'table': 'code_artifacts',
+                'run': self._backfill_artifact_messages
+            },
+            **{f'orphans:{table_name}': {
+                'table': table_name,
+                'run': lambda cursor, after_id, upto_id, table_name=table_name: self._backfill_orphans(
+                    cursor, table_name, after_id, upto_id)
+            } for table_name in CONVERSATION_CHILD_TABLES},
+            'counters:conversations': {
+                'table': 'conversations',
+                'run': self._backfill_conversation_counters,
+                # Each conversation reads all its rows, so take fewer ids per chunk
+                'rows_per_id': 50
+            },
+            **{f'totals:{table_name}': {
+                'table': table_name,
+                'run': lambda cursor, after_id, upto_id, table_name=table_name: self._backfill_database_totals(
+                    cursor, table_name, after_id, upto_id)
+            } for table_name, _, _ in DATABASE_TOTALS},
+        }
 
     def _migrate_database(self):
         """
-        Perform comprehensive database migrations with improved error handling
+        Apply pending numbered migrations, each in its own transaction with its version bump
         """
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
+                version = self._schema_version(conn.cursor())
+            pending = [step for step in self._migrations() if step['version'] > version]
+            for step in pending:
+                self._apply_migration(step)
+            if pending:
+                self.logger.info(f"Database migrated from schema version {version} to {SCHEMA_VERSION}")
+        except Exception as e:
+            self.logger.error(f"Database migration failed: {str(e)}")
+            raise
 
-                # Migration steps for code_artifacts table
-                migrations = [
-                    {
-                        'table': 'code_artifacts',
-                        'columns': [
-                            {'name': 'is_executable', 'type': 'INTEGER', 'default': '0'},
-                            {'name': 'language', 'type': 'TEXT', 'default': "'markup'"},
-                            {'name': 'metadata', 'type': 'TEXT', 'default': "'{}'"}
-                        ]
-                    }
+    def _apply_migration(self, step: Dict[str, Any]):
+        start = time.perf_counter()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            # DDL doesn't open a transaction implicitly; take the write lock up front
+            cursor.execute('BEGIN IMMEDIATE')
+            if self._schema_version(cursor) >= step['version']:
+                return  # Applied by another process while this one waited for the lock
+            step['apply'](cursor)
+            cursor.execute(f"PRAGMA user_version = {int(step['version'])}")
+        self.logger.info(f"Applied migration {step['version']} ({step['description']}) "
+                         f"in {time.perf_counter() - start:.2f}s")
+
+    def migration_plan(self) -> Dict[str, Any]:
+        """
+        Dry run: the pending migration steps and backfills with their estimated cost
+
+        Nothing is changed. Each step reports 'rows', the rows it reads or writes
+        while startup waits, and 'background_rows', the rows it queues for
+        background backfill.
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                version = self._schema_version(cursor)
+                steps = [
+                    {'version': step['version'], 'description': step['description'], **step['estimate'](cursor)}
+                    for step in self._migrations() if step['version'] > version
                 ]
+                cursor.execute('PRAGMA auto_vacuum')
+                auto_vacuum = AUTO_VACUUM_MODES.get(cursor.fetchone()[0], 'unknown')
+                return {
+                    'schema_version': version,
+                    'target_version': SCHEMA_VERSION,
+                    'steps': steps,
+                    'backfills': self._backfill_progress(cursor),
+                    'auto_vacuum': auto_vacuum
+                }
+        except Exception as e:
+            self.logger.error(f"Failed to plan migrations: {str(e)}")
+            raise
+
+    def _estimate_columns(self, cursor) -> Dict[str, Any]:
+        missing = [(table, column) for table, column, _, _ in ADDED_COLUMNS
+                   if self._schema_object_exists(cursor, 'table', table)
+                   and not self._column_exists(cursor, table, column)]
+        background = self._table_rows(cursor, 'code_artifacts') if ('code_artifacts', 'message_id') in missing else 0
+        return {
+            'detail': f"add {', '.join(f'{table}.{column}' for table, column in missing)}" if missing else 'up to date',
+            'rows': 0,
+            'background_rows': background
+        }
+
+    def _estimate_blobs(self, cursor) -> Dict[str, Any]:
+        background = 0
+        for table_name, _ in BLOB_BACKED_TABLES:
+            if not self._column_exists(cursor, table_name, 'content_hash'):
+                background += self._table_rows(cursor, table_name)
+            else:
+                cursor.execute(f'SELECT COUNT(*) FROM {table_name} WHERE content_hash IS NULL')
+                background += cursor.fetchone()[0]
+        return {'detail': f"move {background} rows of inline content", 'rows': 0, 'background_rows': background}
+
+    def _estimate_search_index(self, cursor) -> Dict[str, Any]:
+        missing = [(index_name, table) for index_name, table in SEARCH_INDEXES
+                   if not self._schema_object_exists(cursor, 'table', index_name)]
+        return {
+            'detail': f"create {', '.join(index_name for index_name, _ in missing)}" if missing else 'up to date',
+            'rows': 0,
+            'background_rows': sum(self._table_rows(cursor, table) for _, table in missing)
+        }
+
+    def _estimate_indexes(self, cursor, indexes: List[tuple]) -> Dict[str, Any]:
+        missing = [(index_name, table) for index_name, table, _ in indexes
+                   if not self._schema_object_exists(cursor, 'index', index_name)]
+        return {
+            'detail': f"build {', '.join(index_name for index_name, _ in missing)}" if missing else 'up to date',
+            'rows': sum(self._table_rows(cursor, table) for _, table in missing),
+            'background_rows': 0
+        }
+
+    def _estimate_unique_contexts(self, cursor) -> Dict[str, Any]:
+        if self._schema_object_exists(cursor, 'index', 'idx_ctx_conv_path'):
+            return {'detail': 'up to date', 'rows': 0, 'background_rows': 0}
+        cursor.execute('''
+            SELECT COUNT(*) - (SELECT COUNT(*) FROM (
+                SELECT DISTINCT conversation_id, file_path FROM project_contexts
+            ))
+            FROM project_contexts
+        ''')
+        duplicates = cursor.fetchone()[0]
+        return {
+            'detail': f"remove {duplicates} duplicate rows, build idx_ctx_conv_path",
+            'rows': self._table_rows(cursor, 'project_contexts'),
+            'background_rows': 0
+        }
+
+    def _migrate_columns(self, cursor):
+        for table_name, column_name, column_type, default_value in ADDED_COLUMNS:
+            added = self._safe_add_column(cursor, table_name, column_name, column_type, default_value)
+            if added and (table_name, column_name) == ('code_artifacts', 'message_id'):
+                # Artifacts used to be matched to messages by timestamp on every load
+                self._queue_backfill(cursor, 'artifact_messages')
+
+    def _migrate_blobs(self, cursor):
+        self._create_blob_triggers(cursor)
+        for table_name, _ in BLOB_BACKED_TABLES:
+            self._queue_backfill(cursor, f'blobs:{table_name}')
+
+    def _create_indexes(self, cursor, indexes: List[tuple]):
+        for index_name, table, columns in indexes:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table}({columns})')
+
+    def _migrate_composite_indexes(self, cursor):
+        self._create_indexes(cursor, COMPOSITE_INDEXES)
+        # Superseded by idx_conv_active_updated
+        cursor.execute('DROP INDEX IF EXISTS idx_conv_deleted')
+
+    def _migrate_unique_contexts(self, cursor):
+        # One row per file per conversation, so contexts can be upserted
+        if not self._schema_object_exists(cursor, 'index', 'idx_ctx_conv_path'):
+            self._dedupe_project_contexts(cursor)
+            cursor.execute('''
+                CREATE UNIQUE INDEX idx_ctx_conv_path ON project_contexts(conversation_id, file_path)
+            ''')
+
+    def _tables_without_cascade(self, cursor) -> List[str]:
+        tables = []
+        for table_name in CONVERSATION_CHILD_TABLES:
+            if not self._schema_object_exists(cursor, 'table', table_name):
+                continue
+            cursor.execute(f'PRAGMA foreign_key_list({table_name})')
+            if not any(row['table'] == 'conversations' for row in cursor.fetchall()):
+                tables.append(table_name)
+        return tables
+
+    def _estimate_foreign_keys(self, cursor) -> Dict[str, Any]:
+        tables = self._tables_without_cascade(cursor)
+        return {
+            'detail': f"cascade deletes to {', '.join(tables)} by trigger, remove orphans" if tables else 'up to date',
+            'rows': 0,
+            'background_rows': sum(self._table_rows(cursor, table_name) for table_name in tables)
+        }
+
+    def _migrate_foreign_keys(self, cursor):
+        """
+        Delete conversation data with its conversation in tables created without the foreign key
+
+        SQLite can't add a constraint to an existing table, and rebuilding one
+        copies all its rows while startup waits, so older tables get an AFTER
+        DELETE trigger on conversations that does what ON DELETE CASCADE does for
+        tables created since. Rows whose conversation was deleted before are
+        removed by a background backfill.
+        """
+        tables = self._tables_without_cascade(cursor)
+        if not tables:
+            return
+        deletes = ' '.join(f'DELETE FROM {table_name} WHERE conversation_id = OLD.id;' for table_name in tables)
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_conversations_cascade_delete AFTER DELETE ON conversations
+            BEGIN {deletes} END
+        ''')
+        for table_name in tables:
+            self._queue_backfill(cursor, f'orphans:{table_name}')
+
+    @staticmethod
+    def _backfill_orphans(cursor, table_name: str, after_id: int, upto_id: int) -> int:
+        # NULL conversation_ids are left by the table rebuild earlier versions of step 7 did
+        cursor.execute(f'''
+            DELETE FROM {table_name} WHERE id > ? AND id <= ? AND (conversation_id IS NULL OR NOT EXISTS (
+                SELECT 1 FROM conversations c WHERE c.id = {table_name}.conversation_id
+            ))
+        ''', (after_id, upto_id))
+        return cursor.rowcount
+
+    def _estimate_counters(self, cursor) -> Dict[str, Any]:
+        return {
+            'detail': 'queue database totals and per-conversation recounts',
+            'rows': 0,
+            'background_rows': sum(self._table_rows(cursor, table_name) for table_name, _, _ in DATABASE_TOTALS)
+                               + self._table_rows(cursor, 'conversations')
+        }
+
+    def _migrate_counters(self, cursor):
+        """
+        Add trigger-maintained counters to conversations and the database_stats row
+
+        Both start at zero. Background backfills recount each conversation and
+        add up the database totals in id ranges; until they finish, stats are
+        counted directly. Triggers leave rows a totals backfill has yet to reach
+        to that backfill, so every row is counted exactly once.
+        """
+        for column in CONVERSATION_COUNTERS:
+            self._safe_add_column(cursor, 'conversations', column, 'INTEGER', '0')
+        cursor.execute('INSERT OR IGNORE INTO database_stats (id) VALUES (1)')
+        self._create_counter_triggers(cursor)
+        self._queue_backfill(cursor, 'counters:conversations')
+        for table_name, _, _ in DATABASE_TOTALS:
+            self._queue_backfill(cursor, f'totals:{table_name}')
+
+    @staticmethod
+    def _count_database_totals(cursor) -> Dict[str, int]:
+        """
+        Count the database_stats totals from the tables themselves (reads every row)
+        """
+        totals = {}
+        for _, columns, query in DATABASE_TOTALS:
+            cursor.execute(query)
+            totals.update(zip(columns, cursor.fetchone()))
+        return totals
+
+    @staticmethod
+    def _backfill_database_totals(cursor, table_name: str, after_id: int, upto_id: int) -> int:
+        """
+        Add the totals of a table's rows in an id range to database_stats
+        """
+        columns, query = next((columns, query) for name, columns, query in DATABASE_TOTALS if name == table_name)
+        cursor.execute(f'{query} AND t.rowid > ? AND t.rowid <= ?', (after_id, upto_id))
+        sums = cursor.fetchone()
+        cursor.execute(f'''
+            UPDATE database_stats SET {', '.join(f'{column} = {column} + ?' for column in columns)} WHERE id = 1
+        ''', tuple(sums))
+        cursor.execute(f'SELECT COUNT(*) FROM {table_name} WHERE rowid > ? AND rowid <= ?', (after_id, upto_id))
+        return cursor.fetchone()[0]
+
+    def _create_counter_triggers(self, cursor):
+        """
+        Keep conversation counters and the database_stats row in step with every write
+
+        Writes are serialized by SQLite anyway, so the single stats row adds no
+        contention. Context and artifact bytes are the size of the blob each row
+        points at (0 while its content is still inline). A row a totals backfill
+        has yet to reach doesn't change database_stats; the backfill counts it.
+        """
+        def counted(table_name, row):
+            return f'''NOT EXISTS (
+                SELECT 1 FROM schema_backfills WHERE name = 'totals:{table_name}' AND finished_at IS NULL
+                AND {row}.rowid > position AND {row}.rowid <= upto_id
+            )'''
+
+        message_bytes = 'length(CAST({row}.content AS BLOB))'
+        blob_bytes = 'COALESCE((SELECT size FROM blobs WHERE hash = {row}.content_hash), 0)'
+        triggers = []
+        for table_name, prefix, size, changed_column in [
+                ('messages', 'message', message_bytes, 'content'),
+                ('code_artifacts', 'artifact', blob_bytes, 'content_hash'),
+                ('project_contexts', 'context', blob_bytes, 'content_hash')]:
+            new_size, old_size = size.format(row='NEW'), size.format(row='OLD')
+            triggers += [
+                f'''CREATE TRIGGER IF NOT EXISTS trg_{table_name}_count_insert AFTER INSERT ON {table_name}
+                   BEGIN
+                       UPDATE conversations
+                       SET {prefix}_count = {prefix}_count + 1, {prefix}_bytes = {prefix}_bytes + {new_size}
+                       WHERE id = NEW.conversation_id;
+                       UPDATE database_stats
+                       SET {prefix}_count = {prefix}_count + 1, {prefix}_bytes = {prefix}_bytes + {new_size}
+                       WHERE id = 1 AND {counted(table_name, 'NEW')};
+                   END''',
+                f'''CREATE TRIGGER IF NOT EXISTS trg_{table_name}_count_delete AFTER DELETE ON {table_name}
+                   BEGIN
+                       UPDATE conversations
+                       SET {prefix}_count = {prefix}_count - 1, {prefix}_bytes = {prefix}_bytes - {old_size}
+                       WHERE id = OLD.conversation_id;
+                       UPDATE database_stats
+                       SET {prefix}_count = {prefix}_count - 1, {prefix}_bytes = {prefix}_bytes - {old_size}
+                       WHERE id = 1 AND {counted(table_name, 'OLD')};
+                   END''',
+                f'''CREATE TRIGGER IF NOT EXISTS trg_{table_name}_count_update AFTER UPDATE OF {changed_column} ON {table_name}
+                   BEGIN
+                       UPDATE conversations SET {prefix}_bytes = {prefix}_bytes - {old_size} + {new_size}
+                       WHERE id = NEW.conversation_id;
+                       UPDATE database_stats SET {prefix}_bytes = {prefix}_bytes - {old_size} + {new_size}
+                       WHERE id = 1 AND {counted(table_name, 'NEW')};
+                   END''',
+            ]
+
+        active = ('(CASE WHEN {row}.is_deleted = 0 THEN 1 ELSE 0 END)',
+                  '(CASE WHEN {row}.is_deleted = 0 THEN COALESCE({row}.total_input_tokens, 0) ELSE 0 END)',
+                  '(CASE WHEN {row}.is_deleted = 0 THEN COALESCE({row}.total_output_tokens, 0) ELSE 0 END)')
+        columns = ('active_conversations', 'total_input_tokens', 'total_output_tokens')
+
+        def adjust(*terms):
+            return ', '.join(
+                f"{column} = {column} {' '.join(f'{sign} {expr.format(row=row)}' for sign, row in terms)}"
+                for column, expr in zip(columns, active)
+            )
+        triggers += [
+            f'''CREATE TRIGGER IF NOT EXISTS trg_conversations_count_insert AFTER INSERT ON conversations
+               BEGIN
+                   UPDATE database_stats SET {adjust(('+', 'NEW'))}
+                   WHERE id = 1 AND {counted('conversations', 'NEW')};
+               END''',
+            f'''CREATE TRIGGER IF NOT EXISTS trg_conversations_count_delete AFTER DELETE ON conversations
+               BEGIN
+                   UPDATE database_stats SET {adjust(('-', 'OLD'))}
+                   WHERE id = 1 AND {counted('conversations', 'OLD')};
+               END''',
+            f'''CREATE TRIGGER IF NOT EXISTS trg_conversations_count_update
+               AFTER UPDATE OF is_deleted, total_input_tokens, total_output_tokens ON conversations
+               BEGIN
+                   UPDATE database_stats SET {adjust(('-', 'OLD'), ('+', 'NEW'))}
+                   WHERE id = 1 AND {counted('conversations', 'NEW')};
+               END''',
+            f'''CREATE TRIGGER IF NOT EXISTS trg_blobs_count_insert AFTER INSERT ON blobs
+               BEGIN
+                   UPDATE database_stats SET blob_count = blob_count + 1, blob_bytes = blob_bytes + NEW.size
+                   WHERE id = 1 AND {counted('blobs', 'NEW')};
+               END''',
+            f'''CREATE TRIGGER IF NOT EXISTS trg_blobs_count_delete AFTER DELETE ON blobs
+               BEGIN
+                   UPDATE database_stats SET blob_count = blob_count - 1, blob_bytes = blob_bytes - OLD.size
+                   WHERE id = 1 AND {counted('blobs', 'OLD')};
+               END''',
+        ]
+        for trigger in triggers:
+            cursor.execute(trigger)
+
+    def _backfill_conversation_counters(self, cursor, after_id: int, upto_id: int) -> int:
+        """
+        Recount the counters of the conversations in an id range
+        """
+        cursor.execute(f'''
+            UPDATE conversations
+            SET {', '.join(f'{column} = ({query})' for column, query in CONVERSATION_COUNTERS.items())}
+            WHERE id > ? AND id <= ?
+        ''', (after_id, upto_id))
+        return cursor.rowcount
+
+    @staticmethod
+    def _counters_pending(cursor, conversation_id: int) -> bool:
+        """
+        Whether a conversation's counters are still waiting for the recount backfill
+        """
+        cursor.execute('''
+            SELECT 1 FROM schema_backfills
+            WHERE name = 'counters:conversations' AND finished_at IS NULL
+            AND ? > position AND ? <= upto_id
+        ''', (conversation_id, conversation_id))
+        return cursor.fetchone() is not None
+
+    def _queue_backfill(self, cursor, name: str):
+        """
+        Queue a backfill over the rows that exist now (no-op for an empty table or a queued job)
+        """
+        upto_id = self._table_rows(cursor, self._backfills()[name]['table'])
+        if not upto_id:
+            return
+        cursor.execute('''
+            INSERT OR IGNORE INTO schema_backfills (name, upto_id) VALUES (?, ?)
+        ''', (name, upto_id))
+        if cursor.rowcount:
+            self.logger.info(f"Queued background backfill {name} over ids up to {upto_id}")
+
+    def _backfill_progress(self, cursor) -> List[Dict]:
+        if not self._schema_object_exists(cursor, 'table', 'schema_backfills'):
+            return []
+        cursor.execute('''
+            SELECT name, position, upto_id, rows_done, queued_at
+            FROM schema_backfills 
+            WHERE finished_at IS NULL
+        ''')
+        rows = {row['name']: dict(row) for row in cursor.fetchall()}
+        return [rows[name] for name in self._backfills() if name in rows]
+
+    def run_backfills(self, batch_size: int = None, pause: float = 0.0, max_seconds: float = None) -> int:
+        """
+        Run queued backfills, one short write transaction per chunk of ids
+
+        Progress is saved with every chunk, so an interrupted run resumes where it
+        stopped. Requests keep being served between chunks.
+
+        :param batch_size: Ids per chunk (default backfill_batch_size)
+        :param pause: Seconds to sleep between chunks, leaving the write lock to requests
+        :param max_seconds: Stop after roughly this long (None runs until every job is done)
+        :return: Rows rewritten
+        """
+        batch_size = batch_size or self.backfill_batch_size
+        jobs = self._backfills()
+        deadline = time.monotonic() + max_seconds if max_seconds is not None else None
+        processed = 0
+        while deadline is None or time.monotonic() < deadline:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                # The write lock also stops two processes from running the same chunk
+                cursor.execute('BEGIN IMMEDIATE')
+                pending = self._backfill_progress(cursor)
+                job = next((job for job in pending if job['name'] in jobs), None)
+                if job is None:
+                    break
+                ids = max(1, batch_size // jobs[job['name']].get('rows_per_id', 1))
+                chunk_end = min(job['position'] + ids, job['upto_id'])
+                rows = jobs[job['name']]['run'](cursor, job['position'], chunk_end)
+                cursor.execute('''
+                    UPDATE schema_backfills 
+                    SET position = ?, rows_done = rows_done + ?,
+                        finished_at = CASE WHEN ? >= upto_id THEN datetime('now') END
+                    WHERE name = ?
+                ''', (chunk_end, rows, chunk_end, job['name']))
+            processed += rows
+            if chunk_end >= job['upto_id']:
+                self.logger.info(f"Backfill {job['name']} finished ({job['rows_done'] + rows} rows rewritten)")
+            if pause:
+                time.sleep(pause)
+        return processed
+
+    def start_backfills(self, pause: float = 0.05):
+        """
+        Run queued backfills on a background thread (idempotent)
+        """
+        with self._pool_lock:
+            if self._backfill_thread is not None and self._backfill_thread.is_alive():
+                return
+            self._backfill_thread = threading.Thread(target=self._run_backfills_in_background, args=(pause,),
+                                                     name="schema-backfill", daemon=True)
+            self._backfill_thread.start()
+
+    def _run_backfills_in_background(self, pause: float):
+        try:
+            self.run_backfills(pause=pause)
+        except Exception as e:
+            self.logger.error(f"Background backfill failed (it resumes on the next start): {str(e)}")
 
-                # Add metadata column to project_contexts if it doesn't exist
-                self._safe_add_column(
-                    cursor,
-                    'project_contexts',
-                    'metadata',
-                    'TEXT',
-                    "'{}'"
+    def _dedupe_project_contexts(self, cursor):
+        """
+        Keep only the most recently updated row for each file of a conversation
+        """
+        cursor.execute('''
+            DELETE FROM project_contexts
+            WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY conversation_id, file_path
+                        ORDER BY last_updated DESC, id DESC
+                    ) AS position
+                    FROM project_contexts
                 )
+                WHERE position > 1
+            )
+        ''')
+        if cursor.rowcount > 0:
+            self.logger.info(f"Removed {cursor.rowcount} duplicate project_contexts rows")
+
+    def _backfill_artifact_messages(self, cursor, after_id: int, upto_id: int) -> int:
+        """
+        Link artifacts in an id range to the assistant message stored in the same second
+
+        Artifacts used to be matched to messages by timestamp on every load; this
+        runs that match once so lookups can go through message_id.
+        """
+        cursor.execute('''
+            UPDATE code_artifacts
+            SET message_id = (
+                SELECT m.id FROM messages m
+                WHERE m.conversation_id = code_artifacts.conversation_id
+                  AND m.role = 'assistant'
+                  AND m.timestamp BETWEEN datetime(code_artifacts.timestamp, '-1 second')
+                                      AND datetime(code_artifacts.timestamp, '+1 second')
+                ORDER BY m.id DESC
+                LIMIT 1
+            )
+            WHERE id > ? AND id <= ? AND message_id IS NULL
+        ''', (after_id, upto_id))
+        return cursor.rowcount
+
+    def _create_blob_triggers(self, cursor):
+        """
+        Keep blobs.ref_count in step with the rows that point at each blob
+        """
+        for table_name, _ in BLOB_BACKED_TABLES:
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table_name}_blob_insert
+                AFTER INSERT ON {table_name}
+                WHEN NEW.content_hash IS NOT NULL
+                BEGIN
+                    UPDATE blobs SET ref_count = ref_count + 1 WHERE hash = NEW.content_hash;
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table_name}_blob_delete
+                AFTER DELETE ON {table_name}
+                WHEN OLD.content_hash IS NOT NULL
+                BEGIN
+                    UPDATE blobs SET ref_count = ref_count - 1 WHERE hash = OLD.content_hash;
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table_name}_blob_update
+                AFTER UPDATE OF content_hash ON {table_name}
+                WHEN OLD.content_hash IS NOT NEW.content_hash
+                BEGIN
+                    UPDATE blobs SET ref_count = ref_count - 1 WHERE hash = OLD.content_hash;
+                    UPDATE blobs SET ref_count = ref_count + 1 WHERE hash = NEW.content_hash;
+                END
+            ''')
+
+    def _create_search_index(self, cursor):
+        """
+        Create FTS5 indexes over message content, artifact content, and conversation names
 
-                # Add workspace_path column to conversations if it doesn't exist
-                self._safe_add_column(
-                    cursor,
-                    'conversations',
-                    'workspace_path',
-                    'TEXT',
-                    'NULL'
+        Messages and conversations are indexed as external-content tables; artifact
+        content lives in the blob store, so its index reads through the
+        artifact_documents view. Triggers keep all three in sync, and a newly
+        created index is filled from the existing rows by a background backfill.
+        """
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE '%_fts'")
+        existing = {row['name'] for row in cursor.fetchall()}
+
+        cursor.execute('''
+            CREATE VIEW IF NOT EXISTS artifact_documents AS
+            SELECT a.id, b.content
+            FROM code_artifacts a JOIN blobs b ON b.hash = a.content_hash
+        ''')
+        for table_name, source, column in [('messages_fts', 'messages', 'content'),
+                                           ('artifacts_fts', 'artifact_documents', 'content'),
+                                           ('conversations_fts', 'conversations', 'name')]:
+            cursor.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS {table_name} USING fts5(
+                    {column}, content='{source}', content_rowid='id', tokenize='porter unicode61'
                 )
+            ''')
 
-                # Perform migrations
-                for table_migration in migrations:
-                    table_name = table_migration['table']
-                    
-                    # Get existing columns
-                    cursor.execute(f"PRAGMA table_info({table_name})")
-                    existing_columns = {row['name'] for row in cursor.fetchall()}
-                    
-                    for column in table_migration['columns']:
-                        if column['name'] not in existing_columns:
-                            # Add missing column
-                            alter_query = f'''
-                                ALTER TABLE {table_name} 
-                                ADD COLUMN {column['name']} {column['type']} 
-                                DEFAULT {column['default']}
-                            '''
-                            cursor.execute(alter_query)
-                            self.logger.info(f"Added {column['name']} column to {table_name} table")
-                            
-                            # Update existing rows
-                            update_query = f'''
-                                UPDATE {table_name} 
-                                SET {column['name']} = {column['default']} 
-                                WHERE {column['name']} IS NULL
-                            '''
-                            cursor.execute(update_query)
-
-                # Add missing indexes
-                indexes = [
-                    ('idx_art_conv_lang', 'code_artifacts', 'conversation_id, language'),
-                    ('idx_art_exec', 'code_artifacts', 'is_executable')
-                ]
-                
-                for idx_name, table, columns in indexes:
-                    try:
-                        cursor.execute(f'CREATE INDEX IF NOT EXISTS {idx_name} ON {table}({columns})')
-                    except Exception as e:
-                        self.logger.warning(f"Failed to create index {idx_name}: {str(e)}")
-                
-                self.logger.info("Database migration completed successfully")
-                
+        triggers = [
+            '''CREATE TRIGGER IF NOT EXISTS trg_messages_fts_insert AFTER INSERT ON messages
+               BEGIN
+                   INSERT INTO messages_fts(rowid, content) VALUES (NEW.id, NEW.content);
+               END''',
+            '''CREATE TRIGGER IF NOT EXISTS trg_messages_fts_delete AFTER DELETE ON messages
+               BEGIN
+                   INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', OLD.id, OLD.content);
+               END''',
+            '''CREATE TRIGGER IF NOT EXISTS trg_messages_fts_update AFTER UPDATE OF content ON messages
+               BEGIN
+                   INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', OLD.id, OLD.content);
+                   INSERT INTO messages_fts(rowid, content) VALUES (NEW.id, NEW.content);
+               END''',
+            '''CREATE TRIGGER IF NOT EXISTS trg_conversations_fts_insert AFTER INSERT ON conversations
+               BEGIN
+                   INSERT INTO conversations_fts(rowid, name) VALUES (NEW.id, NEW.name);
+               END''',
+            '''CREATE TRIGGER IF NOT EXISTS trg_conversations_fts_delete AFTER DELETE ON conversations
+               BEGIN
+                   INSERT INTO conversations_fts(conversations_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+               END''',
+            '''CREATE TRIGGER IF NOT EXISTS trg_conversations_fts_update AFTER UPDATE OF name ON conversations
+               BEGIN
+                   INSERT INTO conversations_fts(conversations_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+                   INSERT INTO conversations_fts(rowid, name) VALUES (NEW.id, NEW.name);
+               END''',
+            '''CREATE TRIGGER IF NOT EXISTS trg_artifacts_fts_insert AFTER INSERT ON code_artifacts
+               WHEN NEW.content_hash IS NOT NULL
+               BEGIN
+                   INSERT INTO artifacts_fts(rowid, content)
+                   SELECT NEW.id, content FROM blobs WHERE hash = NEW.content_hash;
+               END''',
+            '''CREATE TRIGGER IF NOT EXISTS trg_artifacts_fts_delete AFTER DELETE ON code_artifacts
+               WHEN OLD.content_hash IS NOT NULL
+               BEGIN
+                   INSERT INTO artifacts_fts(artifacts_fts, rowid, content)
+                   SELECT 'delete', OLD.id, content FROM blobs WHERE hash = OLD.content_hash;
+               END''',
+            '''CREATE TRIGGER IF NOT EXISTS trg_artifacts_fts_update AFTER UPDATE OF content_hash ON code_artifacts
+               WHEN OLD.content_hash IS NOT NEW.content_hash
+               BEGIN
+                   INSERT INTO artifacts_fts(artifacts_fts, rowid, content)
+                   SELECT 'delete', OLD.id, content FROM blobs WHERE hash = OLD.content_hash;
+                   INSERT INTO artifacts_fts(rowid, content)
+                   SELECT NEW.id, content FROM blobs WHERE hash = NEW.content_hash;
+               END''',
+        ]
+        for trigger in triggers:
+            cursor.execute(trigger)
+
+        for index_name, table_name in SEARCH_INDEXES:
+            if index_name not in existing:
+                self._queue_backfill(cursor, f"search:{index_name[:-len('_fts')]}")
+
+    def _backfill_search_index(self, cursor, index_name: str, source: str, column: str,
+                               after_id: int, upto_id: int) -> int:
+        """
+        Add the rows of an id range to an external-content search index
+        """
+        cursor.execute(f'''
+            INSERT INTO {index_name}(rowid, {column})
+            SELECT id, {column} FROM {source} WHERE id > ? AND id <= ?
+        ''', (after_id, upto_id))
+        return cursor.rowcount
+
+    def _backfill_blobs(self, cursor, table_name: str, content_column: str, after_id: int, upto_id: int) -> int:
+        """
+        Move inline content of pre-blob rows in an id range into the blob store
+        """
+        cursor.execute(f'''
+            SELECT id, {content_column} AS content FROM {table_name}
+            WHERE id > ? AND id <= ? AND content_hash IS NULL
+        ''', (after_id, upto_id))
+        rows = cursor.fetchall()
+        for row in rows:
+            digest = self._store_blob(cursor, row['content'] or '')
+            cursor.execute(f'''
+                UPDATE {table_name} SET content_hash = ?, {content_column} = '' WHERE id = ?
+            ''', (digest, row['id']))
+        return len(rows)
+
+    def _store_blob(self, cursor, content: str) -> str:
+        """
+        Insert content into the blob store if it isn't there yet and return its hash
+
+        Reference counts are maintained by triggers on the referencing tables.
+        """
+        encoded = content.encode('utf-8', 'surrogatepass')
+        digest = hashlib.sha256(encoded).hexdigest()
+        cursor.execute('''
+            INSERT OR IGNORE INTO blobs (hash, content, size) VALUES (?, ?, ?)
+        ''', (digest, content, len(encoded)))
+        return digest
+
+    def get_derived_content(self, source_hash: str, transform: str) -> Optional[str]:
+        """
+        Get a cached transform (e.g. compression) of content with the given source hash
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT b.content FROM derived_blobs d
+                    JOIN blobs b ON b.hash = d.blob_hash
+                    WHERE d.source_hash = ? AND d.transform = ?
+                ''', (source_hash, transform))
+                result = cursor.fetchone()
+                return result['content'] if result else None
         except Exception as e:
-            self.logger.error(f"Database migration failed: {str(e)}")
+            self.logger.error(f"Failed to get derived content: {str(e)}")
+            raise
+
+    def put_derived_content(self, source_hash: str, transform: str, content: str):
+        """
+        Cache a transform of source content in the blob store
+        """
+        self.put_derived_contents([(source_hash, transform, content)])
+
+    def put_derived_contents(self, entries: Iterable[Tuple[str, str, str]]):
+        """
+        Cache many transforms in one transaction
+
+        Call inside an outer get_connection() block to share its transaction,
+        e.g. with the add_project_contexts() of the files they were derived from.
+
+        :param entries: (source_hash, transform, content) tuples
+        """
+        entries = list(entries)
+        if not entries:
+            return
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO derived_blobs (source_hash, transform, blob_hash)
+                    VALUES (?, ?, ?)
+                ''', [(source_hash, transform, self._store_blob(cursor, content))
+                      for source_hash, transform, content in entries])
+        except Exception as e:
+            self.logger.error(f"Failed to cache derived content: {str(e)}")
+            raise
+
+    def purge_unreferenced_blobs(self) -> int:
+        """
+        Delete blobs no context or artifact points at any more, with their cached transforms
+
+        Sources are hashed but never stored, so a cached transform goes once no
+        context was read from its source any more, or once no row points at its
+        own blob; the unreferenced blobs go after it.
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                # One pass over the transform cache; the subquery is read once, not per row
+                cursor.execute('''
+                    DELETE FROM derived_blobs 
+                    WHERE source_hash NOT IN (
+                        SELECT source_hash FROM project_contexts WHERE source_hash IS NOT NULL
+                    )
+                    OR blob_hash IN (SELECT hash FROM blobs WHERE ref_count <= 0)
+                ''')
+                cursor.execute('''
+                    DELETE FROM blobs 
+                    WHERE ref_count <= 0 
+                    AND NOT EXISTS (SELECT 1 FROM derived_blobs WHERE blob_hash = blobs.hash)
+                ''')
+                return cursor.rowcount
+        except Exception as e:
+            self.logger.error(f"Failed to purge unreferenced blobs: {str(e)}")
             raise
 
     def _initialize_database(self):
@@ -164,9 +1113,6 @@ class ConversationDatabase:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 
-                # Enable foreign keys
-                cursor.execute("PRAGMA foreign_keys = ON")
-                
                 # Create conversations table with additional metadata
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS conversations (
@@ -179,6 +1125,13 @@ class ConversationDatabase:
                         is_deleted INTEGER DEFAULT 0,
                         is_favorite INTEGER DEFAULT 0,
                         workspace_path TEXT DEFAULT NULL,
+                        context_version INTEGER DEFAULT 0,
+                        message_count INTEGER DEFAULT 0,
+                        message_bytes INTEGER DEFAULT 0,
+                        artifact_count INTEGER DEFAULT 0,
+                        artifact_bytes INTEGER DEFAULT 0,
+                        context_count INTEGER DEFAULT 0,
+                        context_bytes INTEGER DEFAULT 0,
                         metadata TEXT DEFAULT '{}'
                     )
                 ''')
@@ -187,7 +1140,7 @@ class ConversationDatabase:
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS messages (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        conversation_id INTEGER,
+                        conversation_id INTEGER REFERENCES conversations(id) ON DELETE CASCADE,
                         role TEXT CHECK(role IN ('user', 'assistant', 'system')),
                         content TEXT NOT NULL,
                         tokens_input INTEGER DEFAULT 0,
@@ -201,11 +1154,16 @@ class ConversationDatabase:
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS project_contexts (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        conversation_id INTEGER,
+                        conversation_id INTEGER REFERENCES conversations(id) ON DELETE CASCADE,
                         file_path TEXT NOT NULL,
                         file_content TEXT NOT NULL,
                         file_type TEXT,
                         last_updated DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        token_count INTEGER DEFAULT NULL,
+                        content_hash TEXT DEFAULT NULL,
+                        source_hash TEXT DEFAULT NULL,
+                        source_mtime INTEGER DEFAULT NULL,
+                        source_size INTEGER DEFAULT NULL,
                         metadata TEXT DEFAULT '{}'
                     )
                 ''')
@@ -214,21 +1172,86 @@ class ConversationDatabase:
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS code_artifacts (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        conversation_id INTEGER,
+                        conversation_id INTEGER REFERENCES conversations(id) ON DELETE CASCADE,
                         content TEXT NOT NULL,
                         language TEXT DEFAULT 'markup',
                         timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
                         is_executable INTEGER DEFAULT 0,
+                        content_hash TEXT DEFAULT NULL,
+                        message_id INTEGER DEFAULT NULL,
                         metadata TEXT DEFAULT '{}'
                     )
                 ''')
                 
+                # Create content-addressed blob store shared by contexts and artifacts
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS blobs (
+                        hash TEXT PRIMARY KEY,
+                        content TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        ref_count INTEGER DEFAULT 0,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                
+                # Create derived_blobs table caching transforms (e.g. compression) of source content
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS derived_blobs (
+                        source_hash TEXT NOT NULL,
+                        transform TEXT NOT NULL,
+                        blob_hash TEXT NOT NULL,
+                        PRIMARY KEY (source_hash, transform)
+                    )
+                ''')
+                
+                # Create conversation_summaries table for compacted history
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS conversation_summaries (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        conversation_id INTEGER REFERENCES conversations(id) ON DELETE CASCADE,
+                        upto_message_id INTEGER NOT NULL,
+                        summary TEXT NOT NULL,
+                        message_count INTEGER DEFAULT 0,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                
+                # Create schema_backfills table tracking chunked background data migrations
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS schema_backfills (
+                        name TEXT PRIMARY KEY,
+                        position INTEGER NOT NULL DEFAULT 0,
+                        upto_id INTEGER NOT NULL,
+                        rows_done INTEGER DEFAULT 0,
+                        queued_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        finished_at DATETIME DEFAULT NULL
+                    )
+                ''')
+                
+                # Create database_stats table holding database-wide totals in its single row
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS database_stats (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        active_conversations INTEGER DEFAULT 0,
+                        total_input_tokens INTEGER DEFAULT 0,
+                        total_output_tokens INTEGER DEFAULT 0,
+                        message_count INTEGER DEFAULT 0,
+                        message_bytes INTEGER DEFAULT 0,
+                        artifact_count INTEGER DEFAULT 0,
+                        artifact_bytes INTEGER DEFAULT 0,
+                        context_count INTEGER DEFAULT 0,
+                        context_bytes INTEGER DEFAULT 0,
+                        blob_count INTEGER DEFAULT 0,
+                        blob_bytes INTEGER DEFAULT 0
+                    )
+                ''')
+                
                 # Create indexes for better query performance
-                cursor.execute('CREATE INDEX IF NOT EXISTS idx_conv_deleted ON conversations(is_deleted)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_conv_updated ON conversations(last_updated)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_msg_conv ON messages(conversation_id)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_ctx_conv ON project_contexts(conversation_id)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_art_conv ON code_artifacts(conversation_id)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_sum_conv ON conversation_summaries(conversation_id, upto_message_id)')
                 
                 self.logger.info("Database initialized successfully")
         except Exception as e:
@@ -302,6 +1325,33 @@ class ConversationDatabase:
             self.logger.error(f"Failed to get conversation name {conversation_id}: {str(e)}")
             raise
 
+    def _bump_context_version(self, cursor, conversation_id: int):
+        """
+        Mark a conversation's prompt inputs (contexts, artifacts, workspace) as changed
+        """
+        cursor.execute('''
+            UPDATE conversations 
+            SET context_version = context_version + 1
+            WHERE id = ?
+        ''', (conversation_id,))
+
+    def get_context_version(self, conversation_id: int) -> int:
+        """
+        Get the counter that changes whenever a conversation's prompt inputs change
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT context_version FROM conversations 
+                    WHERE id = ?
+                ''', (conversation_id,))
+                result = cursor.fetchone()
+                return result['context_version'] if result else 0
+        except Exception as e:
+            self.logger.error(f"Failed to get context version {conversation_id}: {str(e)}")
+            raise
+
     def add_message(self, conversation_id: int, role: str, content: str,
                    input_tokens: int = 0, output_tokens: int = 0,
                    metadata: Dict = None) -> int:
@@ -334,94 +1384,360 @@ class ConversationDatabase:
 
     def add_project_context(self, conversation_id: int, file_path: str,
                           file_content: str, file_type: str = None,
-                          metadata: Dict = None) -> int:
+                          metadata: Dict = None, token_count: int = None,
+                          source_hash: str = None, source_mtime: int = None,
+                          source_size: int = None) -> int:
         """
-        Add project context with improved metadata handling
+        Add a project context, or replace the conversation's context for the same file
+
+        The content is stored once in the blob store and referenced by hash.
+
+        :param source_hash: Hash of the uncompressed source the content was derived from
+        :param source_mtime: Source file modification time (ns) when it was read
+        :param source_size: Source file size (bytes) when it was read
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(CONTEXT_UPSERT + ' RETURNING id', self._context_row(cursor, conversation_id, {
+                    'file_path': file_path, 'file_content': file_content, 'file_type': file_type,
+                    'metadata': metadata, 'token_count': token_count, 'source_hash': source_hash,
+                    'source_mtime': source_mtime, 'source_size': source_size
+                }))
+                context_id = cursor.fetchone()['id']
+                self._bump_context_version(cursor, conversation_id)
+                return context_id
+        except Exception as e:
+            self.logger.error(f"Failed to add project context: {str(e)}")
+            raise
+
+    def add_project_contexts(self, conversation_id: int, contexts: Iterable[Dict]) -> List[int]:
+        """
+        Add or replace many project contexts with one batched upsert in a single transaction
+
+        :param contexts: Dicts with file_path, file_content and optional file_type, metadata,
+                         token_count, source_hash, source_mtime, source_size, last_updated
+        :return: Context ids in input order
+        """
+        contexts = list(contexts)
+        if not contexts:
+            return []
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany(CONTEXT_UPSERT, [
+                    self._context_row(cursor, conversation_id, ctx) for ctx in contexts
+                ])
+                self._bump_context_version(cursor, conversation_id)
+                cursor.execute('''
+                    SELECT id, file_path FROM project_contexts 
+                    WHERE conversation_id = ?
+                ''', (conversation_id,))
+                ids = {row['file_path']: row['id'] for row in cursor.fetchall()}
+                return [ids[ctx['file_path']] for ctx in contexts]
+        except Exception as e:
+            self.logger.error(f"Failed to add project contexts: {str(e)}")
+            raise
+
+    def _context_row(self, cursor, conversation_id: int, ctx: Dict) -> tuple:
+        """
+        Store a context's content as a blob and build its CONTEXT_UPSERT parameters
+        """
+        return (
+            conversation_id, ctx['file_path'], self._store_blob(cursor, ctx['file_content']),
+            ctx.get('source_hash'), ctx.get('source_mtime'), ctx.get('source_size'),
+            ctx.get('file_type'), json.dumps(ctx.get('metadata') or {}), ctx.get('token_count'),
+            ctx.get('last_updated')
+        )
+
+    def get_context_sources(self, conversation_id: int = None, file_path: str = None) -> List[Dict]:
+        """
+        Get the source snapshot (without content) of context rows, by conversation or file path
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                if file_path is not None:
+                    where_clause, params = 'WHERE file_path = ?', (file_path,)
+                else:
+                    where_clause, params = 'WHERE conversation_id = ?', (conversation_id,)
+                cursor.execute(f'''
+                    SELECT id, conversation_id, file_path, file_type, source_hash,
+                           source_mtime, source_size, metadata
+                    FROM project_contexts 
+                    {where_clause}
+                ''', params)
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            self.logger.error(f"Failed to get context sources: {str(e)}")
+            raise
+
+    def update_context_source(self, context_id: int, source_mtime: int, source_size: int):
+        """
+        Record that a context's source file was re-checked and its content is unchanged
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE project_contexts 
+                    SET source_mtime = ?, source_size = ?
+                    WHERE id = ?
+                ''', (source_mtime, source_size, context_id))
+        except Exception as e:
+            self.logger.error(f"Failed to update context source {context_id}: {str(e)}")
+            raise
+
+    def set_context_token_counts(self, token_counts: Dict[int, int]):
+        """
+        Cache token counts for context rows that were stored without one
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    UPDATE project_contexts SET token_count = ? WHERE id = ?
+                ''', [(count, context_id) for context_id, count in token_counts.items()])
+        except Exception as e:
+            self.logger.error(f"Failed to cache context token counts: {str(e)}")
+            raise
+
+    def remove_project_context(self, conversation_id: int, file_path: str) -> bool:
+        """
+        Remove a file from a conversation's project context
         """
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                
-                # Check for existing context
                 cursor.execute('''
-                    SELECT id FROM project_contexts 
+                    DELETE FROM project_contexts 
                     WHERE conversation_id = ? AND file_path = ?
                 ''', (conversation_id, file_path))
-                existing = cursor.fetchone()
-                
-                if existing:
-                    # Update existing context
-                    cursor.execute('''
-                        UPDATE project_contexts 
-                        SET file_content = ?, file_type = ?, metadata = ?,
-                            last_updated = datetime('now')
-                        WHERE id = ?
-                    ''', (file_content, file_type, json.dumps(metadata or {}),
-                         existing['id']))
-                    return existing['id']
-                else:
-                    # Insert new context
-                    cursor.execute('''
-                        INSERT INTO project_contexts 
-                        (conversation_id, file_path, file_content, file_type, metadata)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (conversation_id, file_path, file_content, file_type,
-                         json.dumps(metadata or {})))
-                    return cursor.lastrowid
+                removed = cursor.rowcount > 0
+                if removed:
+                    self._bump_context_version(cursor, conversation_id)
+                return removed
         except Exception as e:
-            self.logger.error(f"Failed to add project context: {str(e)}")
+            self.logger.error(f"Failed to remove project context: {str(e)}")
             raise
 
+    def _prepare_artifact(self, language: str, content: str, metadata: Dict = None):
+        """
+        Normalize an artifact's language and build its stored metadata
+        """
+        language = (language or '').lower() or 'markup'
+        metadata = dict(metadata or {})
+        metadata.update({
+            'added_at': datetime.now().isoformat(),
+            'size': len(content),
+            'language_detected': language
+        })
+        return language, json.dumps(metadata)
+
     def add_code_artifact(self, conversation_id: int, content: str,
                         language: str = 'markup', is_executable: bool = False,
-                        metadata: Dict = None) -> int:
+                        metadata: Dict = None, message_id: int = None) -> int:
         """
         Add a code artifact with improved metadata handling
+
+        :param message_id: Message the artifact was extracted from, if any
         """
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                
-                # Validate language
-                language = language.lower()
-                if not language:
-                    language = 'markup'
-                
-                # Prepare metadata
-                if metadata is None:
-                    metadata = {}
-                
-                metadata.update({
-                    'added_at': datetime.now().isoformat(),
-                    'size': len(content),
-                    'language_detected': language
-                })
+                language, metadata_json = self._prepare_artifact(language, content, metadata)
+                digest = self._store_blob(cursor, content)
                 
                 cursor.execute('''
                     INSERT INTO code_artifacts 
-                    (conversation_id, content, language, 
-                    timestamp, is_executable, metadata)
-                    VALUES (?, ?, ?, datetime('now'), ?, ?)
+                    (conversation_id, content, content_hash, language, 
+                    timestamp, is_executable, message_id, metadata)
+                    VALUES (?, '', ?, ?, datetime('now'), ?, ?, ?)
                 ''', (
                     conversation_id,
-                    content,
+                    digest,
                     language,
                     1 if is_executable else 0,
-                    json.dumps(metadata)
+                    message_id,
+                    metadata_json
                 ))
+                artifact_id = cursor.lastrowid
                 
-                # Update conversation last_updated
+                # Update conversation last_updated and invalidate cached prompts
                 cursor.execute('''
                     UPDATE conversations 
-                    SET last_updated = datetime('now')
+                    SET last_updated = datetime('now'),
+                        context_version = context_version + 1
                     WHERE id = ?
                 ''', (conversation_id,))
                 
-                return cursor.lastrowid
+                return artifact_id
         except Exception as e:
             self.logger.error(f"Failed to add code artifact: {str(e)}")
             raise
 
+    def record_turn(self, conversation_id: int, messages: List[Dict],
+                    artifacts: List[Dict] = None) -> Dict[str, List[int]]:
+        """
+        Record a complete chat turn in a single transaction
+
+        Writes every message, every code artifact, and the conversation's token
+        totals and last_updated together, so a turn costs one commit instead of one
+        per row. Artifacts are linked to the turn's last assistant message.
+
+        :param messages: Dicts with role, content and optional input_tokens, output_tokens, metadata
+        :param artifacts: Dicts with content and optional language, is_executable, metadata
+        :return: {'message_ids': [...], 'artifact_ids': [...]} in input order
+        """
+        artifacts = artifacts or []
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.executemany('''
+                    INSERT INTO messages 
+                    (conversation_id, role, content, tokens_input, tokens_output, metadata)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [
+                    (conversation_id, msg['role'], msg['content'],
+                     msg.get('input_tokens', 0), msg.get('output_tokens', 0),
+                     json.dumps(msg.get('metadata') or {}))
+                    for msg in messages
+                ])
+                message_ids = self._last_inserted_ids(cursor, 'messages', conversation_id, len(messages))
+                source_message_id = next((
+                    message_id for message_id, msg in zip(reversed(message_ids), reversed(messages))
+                    if msg['role'] == 'assistant'
+                ), None)
+
+                artifact_rows = []
+                for art in artifacts:
+                    language, metadata_json = self._prepare_artifact(
+                        art.get('language'), art['content'], art.get('metadata'))
+                    artifact_rows.append((
+                        conversation_id, self._store_blob(cursor, art['content']), language,
+                        1 if art.get('is_executable') else 0, source_message_id, metadata_json
+                    ))
+                cursor.executemany('''
+                    INSERT INTO code_artifacts 
+                    (conversation_id, content, content_hash, language, 
+                    timestamp, is_executable, message_id, metadata)
+                    VALUES (?, '', ?, ?, datetime('now'), ?, ?, ?)
+                ''', artifact_rows)
+                artifact_ids = self._last_inserted_ids(cursor, 'code_artifacts', conversation_id, len(artifact_rows))
+
+                cursor.execute('''
+                    UPDATE conversations 
+                    SET total_input_tokens = total_input_tokens + ?,
+                        total_output_tokens = total_output_tokens + ?,
+                        context_version = context_version + ?,
+                        last_updated = datetime('now')
+                    WHERE id = ?
+                ''', (
+                    sum(msg.get('input_tokens', 0) for msg in messages),
+                    sum(msg.get('output_tokens', 0) for msg in messages),
+                    1 if artifact_rows else 0,
+                    conversation_id
+                ))
+
+                return {"message_ids": message_ids, "artifact_ids": artifact_ids}
+        except Exception as e:
+            self.logger.error(f"Failed to record turn for conversation {conversation_id}: {str(e)}")
+            raise
+
+    def _last_inserted_ids(self, cursor, table_name: str, conversation_id: int, count: int) -> List[int]:
+        """
+        IDs of the rows just bulk-inserted for a conversation, oldest first
+
+        Only valid inside the inserting transaction, which holds the write lock.
+        """
+        if count == 0:
+            return []
+        cursor.execute(f'''
+            SELECT id FROM {table_name}
+            WHERE conversation_id = ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (conversation_id, count))
+        return [row['id'] for row in reversed(cursor.fetchall())]
+
+    @staticmethod
+    def _fts_query(text: str) -> Optional[str]:
+        """
+        Turn free text into a safe FTS5 query: every word must match, the last as a prefix
+        """
+        words = re.findall(r'\w+', text)
+        if not words:
+            return None
+        quoted = [f'"{word}"' for word in words]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def search(self, query: str, limit: int = 20) -> List[Dict]:
+        """
+        Full-text search over conversation names, messages, and code artifacts
+
+        Results from the three indexes are merged by bm25 rank (lower is better).
+        Matched terms in snippets are wrapped in SEARCH_MATCH_START/SEARCH_MATCH_END.
+
+        :param query: Free text; words are ANDed and the last one is prefix-matched
+        :return: Dicts with type ('conversation', 'message', 'artifact'), conversation_id,
+                 conversation_name, snippet, rank, and type-specific ids
+        """
+        match = self._fts_query(query)
+        if not match:
+            return []
+        markers = (SEARCH_MATCH_START, SEARCH_MATCH_END)
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT 'conversation' AS type, c.id AS conversation_id, c.name AS conversation_name,
+                           NULL AS message_id, NULL AS artifact_id, NULL AS role, NULL AS language,
+                           c.last_updated AS timestamp,
+                           highlight(conversations_fts, 0, ?, ?) AS snippet,
+                           conversations_fts.rank AS rank
+                    FROM conversations_fts
+                    JOIN conversations c ON c.id = conversations_fts.rowid
+                    WHERE conversations_fts MATCH ? AND c.is_deleted = 0
+                    ORDER BY conversations_fts.rank LIMIT ?
+                ''', (*markers, match, limit))
+                results = [dict(row) for row in cursor.fetchall()]
+
+                cursor.execute('''
+                    SELECT 'message' AS type, m.conversation_id, c.name AS conversation_name,
+                           m.id AS message_id, NULL AS artifact_id, m.role, NULL AS language,
+                           m.timestamp,
+                           snippet(messages_fts, 0, ?, ?, '…', 16) AS snippet,
+                           messages_fts.rank AS rank
+                    FROM messages_fts
+                    JOIN messages m ON m.id = messages_fts.rowid
+                    JOIN conversations c ON c.id = m.conversation_id
+                    WHERE messages_fts MATCH ? AND c.is_deleted = 0
+                    ORDER BY messages_fts.rank LIMIT ?
+                ''', (*markers, match, limit))
+                results.extend(dict(row) for row in cursor.fetchall())
+
+                cursor.execute('''
+                    SELECT 'artifact' AS type, a.conversation_id, c.name AS conversation_name,
+                           NULL AS message_id, a.id AS artifact_id, NULL AS role, a.language,
+                           a.timestamp,
+                           snippet(artifacts_fts, 0, ?, ?, '…', 16) AS snippet,
+                           artifacts_fts.rank AS rank
+                    FROM artifacts_fts
+                    JOIN code_artifacts a ON a.id = artifacts_fts.rowid
+                    JOIN conversations c ON c.id = a.conversation_id
+                    WHERE artifacts_fts MATCH ? AND c.is_deleted = 0
+                    ORDER BY artifacts_fts.rank LIMIT ?
+                ''', (*markers, match, limit))
+                results.extend(dict(row) for row in cursor.fetchall())
+
+                results.sort(key=lambda result: result['rank'])
+                return results[:limit]
+        except Exception as e:
+            self.logger.error(f"Search failed for {query!r}: {str(e)}")
+            raise
+
     def get_conversation_history(self, limit: int = 50,
                                include_deleted: bool = False) -> List[Dict]:
         """
@@ -453,17 +1769,135 @@ class ConversationDatabase:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    SELECT role, content, tokens_input, tokens_output,
+                    SELECT id, role, content, tokens_input, tokens_output,
                            timestamp, metadata
                     FROM messages 
                     WHERE conversation_id = ? 
-                    ORDER BY timestamp ASC
+                    ORDER BY timestamp ASC, id ASC
                 ''', (conversation_id,))
                 return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
             self.logger.error(f"Failed to get conversation messages: {str(e)}")
             raise
 
+    def get_message_page(self, conversation_id: int, before_id: int = None,
+                         limit: int = 50) -> Dict[str, Any]:
+        """
+        Get one page of a conversation's messages, newest page first
+
+        Pages are keyed by message ID rather than offset, so each page is a single
+        index range scan however long the conversation is.
+
+        :param before_id: Only return messages older than this ID (None for the newest page)
+        :param limit: Maximum number of messages in the page
+        :return: {'messages': [...] oldest first, 'has_more': bool}
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                before_clause = 'AND id < ?' if before_id is not None else ''
+                params = [conversation_id] + ([before_id] if before_id is not None else []) + [limit + 1]
+                cursor.execute(f'''
+                    SELECT id, role, content, tokens_input, tokens_output,
+                           timestamp, metadata
+                    FROM messages 
+                    WHERE conversation_id = ? {before_clause}
+                    ORDER BY id DESC 
+                    LIMIT ?
+                ''', params)
+                rows = [dict(row) for row in cursor.fetchall()]
+                return {"messages": rows[:limit][::-1], "has_more": len(rows) > limit}
+        except Exception as e:
+            self.logger.error(f"Failed to get messages for conversation {conversation_id}: {str(e)}")
+            raise
+
+    def get_artifact_summaries(self, message_ids: List[int]) -> Dict[int, List[Dict]]:
+        """
+        Get artifact metadata (no content) for a set of messages
+
+        :return: Artifact summaries keyed by message ID, in creation order
+        """
+        if not message_ids:
+            return {}
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                placeholders = ','.join('?' * len(message_ids))
+                cursor.execute(f'''
+                    SELECT a.id, a.message_id, a.language, a.is_executable, a.timestamp,
+                           COALESCE(b.size, LENGTH(a.content)) AS size
+                    FROM code_artifacts a
+                    LEFT JOIN blobs b ON b.hash = a.content_hash
+                    WHERE a.message_id IN ({placeholders})
+                    ORDER BY a.message_id ASC, a.id ASC
+                ''', list(message_ids))
+                summaries: Dict[int, List[Dict]] = {}
+                for row in cursor.fetchall():
+                    summaries.setdefault(row['message_id'], []).append(dict(row))
+                return summaries
+        except Exception as e:
+            self.logger.error(f"Failed to get artifact summaries: {str(e)}")
+            raise
+
+    def get_code_artifact(self, artifact_id: int) -> Optional[Dict]:
+        """
+        Get a single code artifact with its content
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT a.id, a.conversation_id, a.message_id,
+                           COALESCE(b.content, a.content) AS content,
+                           a.language, a.timestamp, a.is_executable, a.metadata
+                    FROM code_artifacts a
+                    LEFT JOIN blobs b ON b.hash = a.content_hash
+                    WHERE a.id = ?
+                ''', (artifact_id,))
+                result = cursor.fetchone()
+                return dict(result) if result else None
+        except Exception as e:
+            self.logger.error(f"Failed to get code artifact {artifact_id}: {str(e)}")
+            raise
+
+    def add_conversation_summary(self, conversation_id: int, upto_message_id: int,
+                                 summary: str, message_count: int) -> int:
+        """
+        Store a summary covering every message up to and including upto_message_id
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO conversation_summaries 
+                    (conversation_id, upto_message_id, summary, message_count)
+                    VALUES (?, ?, ?, ?)
+                ''', (conversation_id, upto_message_id, summary, message_count))
+                return cursor.lastrowid
+        except Exception as e:
+            self.logger.error(f"Failed to add summary for conversation {conversation_id}: {str(e)}")
+            raise
+
+    def get_latest_summary(self, conversation_id: int) -> Optional[Dict]:
+        """
+        Get the summary covering the most messages of a conversation, if any
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT upto_message_id, summary, message_count, created_at
+                    FROM conversation_summaries 
+                    WHERE conversation_id = ? 
+                    ORDER BY upto_message_id DESC 
+                    LIMIT 1
+                ''', (conversation_id,))
+                result = cursor.fetchone()
+                return dict(result) if result else None
+        except Exception as e:
+            self.logger.error(f"Failed to get summary for conversation {conversation_id}: {str(e)}")
+            raise
+
     def get_project_contexts(self, conversation_id: int) -> List[Dict]:
         """
         Get project contexts with metadata
@@ -472,16 +1906,59 @@ class ConversationDatabase:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    SELECT file_path, file_content, file_type,
-                           last_updated, metadata
-                    FROM project_contexts 
-                    WHERE conversation_id = ?
+                    SELECT pc.id, pc.file_path,
+                           COALESCE(b.content, pc.file_content) AS file_content,
+                           pc.file_type, pc.last_updated, pc.token_count,
+                           pc.content_hash, pc.metadata
+                    FROM project_contexts pc
+                    LEFT JOIN blobs b ON b.hash = pc.content_hash
+                    WHERE pc.conversation_id = ?
+                    ORDER BY pc.id ASC
                 ''', (conversation_id,))
                 return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
             self.logger.error(f"Failed to get project contexts: {str(e)}")
             raise
 
+    def get_context_summaries(self, conversation_id: int) -> List[Dict]:
+        """
+        Get a conversation's context files without their content
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, file_path, file_type, last_updated, token_count, metadata
+                    FROM project_contexts
+                    WHERE conversation_id = ?
+                    ORDER BY id ASC
+                ''', (conversation_id,))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            self.logger.error(f"Failed to get context summaries: {str(e)}")
+            raise
+
+    def get_project_context(self, context_id: int) -> Optional[Dict]:
+        """
+        Get a single context file with its content
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT pc.id, pc.conversation_id, pc.file_path,
+                           COALESCE(b.content, pc.file_content) AS file_content,
+                           pc.file_type, pc.last_updated, pc.token_count, pc.metadata
+                    FROM project_contexts pc
+                    LEFT JOIN blobs b ON b.hash = pc.content_hash
+                    WHERE pc.id = ?
+                ''', (context_id,))
+                result = cursor.fetchone()
+                return dict(result) if result else None
+        except Exception as e:
+            self.logger.error(f"Failed to get project context {context_id}: {str(e)}")
+            raise
+
     def get_code_artifacts(self, conversation_id: int) -> List[Dict]:
         """
         Get all code artifacts for a conversation with improved metadata
@@ -490,11 +1967,12 @@ class ConversationDatabase:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    SELECT id, content, language, timestamp,
-                        is_executable, metadata
-                    FROM code_artifacts 
-                    WHERE conversation_id = ? 
-                    ORDER BY timestamp ASC
+                    SELECT a.id, COALESCE(b.content, a.content) AS content,
+                        a.language, a.timestamp, a.is_executable, a.metadata
+                    FROM code_artifacts a
+                    LEFT JOIN blobs b ON b.hash = a.content_hash
+                    WHERE a.conversation_id = ? 
+                    ORDER BY a.timestamp ASC, a.id ASC
                 ''', (conversation_id,))
                 
                 artifacts = []
@@ -552,7 +2030,8 @@ class ConversationDatabase:
                 cursor = conn.cursor()
                 cursor.execute('''
                     UPDATE conversations 
-                    SET workspace_path = ?, last_updated = datetime('now')
+                    SET workspace_path = ?, last_updated = datetime('now'),
+                        context_version = context_version + 1
                     WHERE id = ? AND is_deleted = 0
                 ''', (workspace_path, conversation_id))
                 return cursor.rowcount > 0
@@ -599,17 +2078,15 @@ class ConversationDatabase:
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT 
-                        c.total_input_tokens,
-                        c.total_output_tokens,
-                        c.created_at,
-                        c.last_updated,
-                        (SELECT COUNT(*) FROM messages WHERE conversation_id = c.id) as message_count,
-                        (SELECT COUNT(*) FROM code_artifacts WHERE conversation_id = c.id) as artifact_count,
-                        (SELECT COUNT(*) FROM project_contexts WHERE conversation_id = c.id) as context_count
-                    FROM conversations c
-                    WHERE c.id = ? AND c.is_deleted = 0
+                if self._counters_pending(cursor, conversation_id):
+                    # Not recounted since the counters were added: count the rows directly
+                    counters = ', '.join(f'({query}) AS {column}' for column, query in CONVERSATION_COUNTERS.items())
+                else:
+                    counters = ', '.join(CONVERSATION_COUNTERS)
+                cursor.execute(f'''
+                    SELECT total_input_tokens, total_output_tokens, created_at, last_updated, {counters}
+                    FROM conversations
+                    WHERE id = ? AND is_deleted = 0
                 ''', (conversation_id,))
                 result = cursor.fetchone()
                 if not result:
@@ -619,9 +2096,7 @@ class ConversationDatabase:
                     "total_input_tokens": result['total_input_tokens'],
                     "total_output_tokens": result['total_output_tokens'],
                     "total_tokens": result['total_input_tokens'] + result['total_output_tokens'],
-                    "message_count": result['message_count'],
-                    "artifact_count": result['artifact_count'],
-                    "context_count": result['context_count'],
+                    **{column: result[column] for column in CONVERSATION_COUNTERS},
                     "created_at": result['created_at'],
                     "last_updated": result['last_updated'],
                     "duration": self._calculate_duration(result['created_at'], result['last_updated'])
@@ -671,6 +2146,158 @@ class ConversationDatabase:
             self.logger.error(f"Failed to cleanup old conversations: {str(e)}")
             raise
 
+    def purge_deleted_conversations(self, retention_days: int = 30, batch_size: int = 10,
+                                    pause: float = 0.0) -> int:
+        """
+        Permanently delete conversations that were soft-deleted more than retention_days ago
+
+        Each batch is its own short write transaction. Messages, contexts,
+        artifacts, and summaries go with their conversation (ON DELETE CASCADE,
+        or a trigger for tables created before it), and the triggers take them out of the search indexes and blob reference
+        counts. Nothing is purged while a migration backfill is pending, since
+        rows it hasn't indexed yet can't be removed from the search index.
+
+        :param retention_days: Days a deleted conversation stays recoverable
+        :param batch_size: Conversations per transaction
+        :param pause: Seconds to sleep between batches, leaving the write lock to requests
+        :return: Conversations deleted
+        """
+        purged = 0
+        try:
+            while True:
+                with self.get_connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute('BEGIN IMMEDIATE')
+                    if self._backfill_progress(cursor):
+                        self.logger.info("Purge of deleted conversations waits for migration backfills")
+                        break
+                    cursor.execute('''
+                        DELETE FROM conversations WHERE id IN (
+                            SELECT id FROM conversations
+                            WHERE is_deleted = 1 AND last_updated < datetime('now', ?)
+                            ORDER BY last_updated
+                            LIMIT ?
+                        )
+                    ''', (f'-{retention_days} days', batch_size))
+                    deleted = cursor.rowcount
+                    # Rows whose conversation was gone when earlier versions of migration 7 rebuilt their table
+                    orphans = 0
+                    for table_name in CONVERSATION_CHILD_TABLES:
+                        cursor.execute(f'''
+                            DELETE FROM {table_name} WHERE id IN (
+                                SELECT id FROM {table_name} WHERE conversation_id IS NULL LIMIT ?
+                            )
+                        ''', (self.backfill_batch_size,))
+                        orphans += cursor.rowcount
+                purged += deleted
+                if not deleted and not orphans:
+                    break
+                if pause:
+                    time.sleep(pause)
+            if purged:
+                self.logger.info(f"Purged {purged} conversations deleted over {retention_days} days ago")
+            return purged
+        except Exception as e:
+            self.logger.error(f"Failed to purge deleted conversations: {str(e)}")
+            raise
+
+    def incremental_vacuum(self, max_pages: int = 0) -> int:
+        """
+        Return free pages at the end of the file to the filesystem
+
+        Only works once the database uses auto_vacuum=INCREMENTAL (new databases
+        do; see enable_incremental_vacuum). Under WAL the file shrinks at the
+        next checkpoint.
+
+        :param max_pages: Pages to free (0 frees them all)
+        :return: Pages freed
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('PRAGMA auto_vacuum')
+                if AUTO_VACUUM_MODES.get(cursor.fetchone()[0]) != 'incremental':
+                    return 0
+                cursor.execute('PRAGMA freelist_count')
+                free_pages = cursor.fetchone()[0]
+                pages = min(free_pages, max_pages) if max_pages else free_pages
+                cursor.execute('BEGIN IMMEDIATE')
+                # The pragma frees one page per step, and execute() only takes the
+                # first step of a statement that returns no columns
+                for _ in range(pages):
+                    cursor.execute('PRAGMA incremental_vacuum(1)')
+                # Also finishes the last pragma, which commit would otherwise find still running
+                cursor.execute('PRAGMA freelist_count')
+                return free_pages - cursor.fetchone()[0]
+        except Exception as e:
+            self.logger.error(f"Failed to vacuum database: {str(e)}")
+            raise
+
+    def enable_incremental_vacuum(self) -> bool:
+        """
+        Switch an existing database to auto_vacuum=INCREMENTAL
+
+        This takes one full VACUUM, which rewrites the whole file and blocks all
+        writers while it runs, so run it offline (python migrate.py --vacuum).
+
+        :return: True if the database was converted, False if it already was incremental
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('PRAGMA auto_vacuum')
+                if AUTO_VACUUM_MODES.get(cursor.fetchone()[0]) == 'incremental':
+                    return False
+                cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                cursor.execute('VACUUM')
+                self.logger.info("Database converted to incremental auto-vacuum")
+                return True
+        except Exception as e:
+            self.logger.error(f"Failed to enable incremental vacuum: {str(e)}")
+            raise
+
+    def compact(self, retention_days: int = 30, vacuum_pages: int = 2000, pause: float = 0.05) -> Dict[str, int]:
+        """
+        One maintenance pass: purge expired conversations and unreferenced blobs, then free pages
+
+        :param vacuum_pages: Pages freed per write transaction
+        """
+        conversations = self.purge_deleted_conversations(retention_days, pause=pause)
+        blobs = self.purge_unreferenced_blobs()
+        pages = 0
+        while True:
+            freed = self.incremental_vacuum(vacuum_pages)
+            pages += freed
+            if freed < vacuum_pages:
+                break
+            time.sleep(pause)
+        return {'conversations': conversations, 'blobs': blobs, 'pages': pages}
+
+    def start_maintenance(self, interval: float = 3600.0, retention_days: int = 30, pause: float = 0.05):
+        """
+        Run compact() every interval seconds on a background thread (idempotent)
+        """
+        if interval <= 0:
+            return
+        with self._pool_lock:
+            if self._maintenance_thread is not None and self._maintenance_thread.is_alive():
+                return
+            self._maintenance_thread = threading.Thread(target=self._run_maintenance,
+                                                        args=(interval, retention_days, pause),
+                                                        name="db-maintenance", daemon=True)
+            self._maintenance_thread.start()
+
+    def _run_maintenance(self, interval: float, retention_days: int, pause: float):
+        while True:
+            time.sleep(interval)
+            try:
+                result = self.compact(retention_days, pause=pause)
+                if any(result.values()):
+                    self.logger.info(f"Database maintenance: purged {result['conversations']} conversations "
+                                     f"and {result['blobs']} blobs, freed {result['pages']} pages")
+            except Exception as e:
+                self.logger.error(f"Database maintenance failed: {str(e)}")
+
     def export_conversation(self, conversation_id: int) -> Dict[str, Any]:
         """
         Export a complete conversation with all related data
@@ -691,12 +2318,20 @@ class ConversationDatabase:
                 messages = [dict(row) for row in cursor.fetchall()]
                 
                 # Get contexts
-                cursor.execute('SELECT * FROM project_contexts WHERE conversation_id = ?', (conversation_id,))
-                contexts = [dict(row) for row in cursor.fetchall()]
+                cursor.execute('''
+                    SELECT pc.*, b.content AS blob_content FROM project_contexts pc
+                    LEFT JOIN blobs b ON b.hash = pc.content_hash
+                    WHERE pc.conversation_id = ?
+                ''', (conversation_id,))
+                contexts = [self._inline_blob(dict(row), 'file_content') for row in cursor.fetchall()]
                 
                 # Get artifacts
-                cursor.execute('SELECT * FROM code_artifacts WHERE conversation_id = ?', (conversation_id,))
-                artifacts = [dict(row) for row in cursor.fetchall()]
+                cursor.execute('''
+                    SELECT a.*, b.content AS blob_content FROM code_artifacts a
+                    LEFT JOIN blobs b ON b.hash = a.content_hash
+                    WHERE a.conversation_id = ?
+                ''', (conversation_id,))
+                artifacts = [self._inline_blob(dict(row), 'content') for row in cursor.fetchall()]
                 
                 return {
                     "conversation": conversation,
@@ -710,6 +2345,16 @@ class ConversationDatabase:
             self.logger.error(f"Failed to export conversation {conversation_id}: {str(e)}")
             raise
 
+    def _inline_blob(self, row: Dict, content_column: str) -> Dict:
+        """
+        Replace a row's blob reference with its content for export
+        """
+        blob_content = row.pop('blob_content', None)
+        if blob_content is not None:
+            row[content_column] = blob_content
+        row.pop('content_hash', None)
+        return row
+
     def import_conversation(self, data: Dict[str, Any]) -> int:
         """
         Import a conversation from exported data
@@ -736,7 +2381,8 @@ class ConversationDatabase:
                 ))
                 new_conv_id = cursor.lastrowid
                 
-                # Import messages
+                # Import messages, remembering new IDs so artifacts keep their message links
+                message_ids = {}
                 for msg in data['messages']:
                     cursor.execute('''
                         INSERT INTO messages 
@@ -752,36 +2398,30 @@ class ConversationDatabase:
                         msg['timestamp'],
                         msg.get('metadata', '{}')
                     ))
+                    if msg.get('id') is not None:
+                        message_ids[msg['id']] = cursor.lastrowid
                 
                 # Import contexts
-                for ctx in data['contexts']:
-                    cursor.execute('''
-                        INSERT INTO project_contexts 
-                        (conversation_id, file_path, file_content, 
-                         file_type, last_updated, metadata)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (
-                        new_conv_id,
-                        ctx['file_path'],
-                        ctx['file_content'],
-                        ctx.get('file_type'),
-                        ctx['last_updated'],
-                        ctx.get('metadata', '{}')
-                    ))
+                self.add_project_contexts(new_conv_id, (
+                    {**ctx, 'metadata': json.loads(ctx.get('metadata') or '{}'),
+                     'source_mtime': None, 'source_size': None}
+                    for ctx in data['contexts']
+                ))
                 
                 # Import artifacts
                 for art in data['artifacts']:
                     cursor.execute('''
                         INSERT INTO code_artifacts 
-                        (conversation_id, content, language, 
-                         timestamp, is_executable, metadata)
-                        VALUES (?, ?, ?, ?, ?, ?)
+                        (conversation_id, content, content_hash, language, 
+                         timestamp, is_executable, message_id, metadata)
+                        VALUES (?, '', ?, ?, ?, ?, ?, ?)
                     ''', (
                         new_conv_id,
-                        art['content'],
+                        self._store_blob(cursor, art['content']),
                         art['language'],
                         art['timestamp'],
                         art.get('is_executable', 0),
+                        message_ids.get(art.get('message_id')),
                         art.get('metadata', '{}')
                     ))
                 
@@ -799,34 +2439,42 @@ class ConversationDatabase:
                 cursor = conn.cursor()
                 stats = {}
                 
-                # Get total counts
-                cursor.execute('SELECT COUNT(*) FROM conversations WHERE is_deleted = 0')
-                stats['active_conversations'] = cursor.fetchone()[0]
-                
-                cursor.execute('SELECT COUNT(*) FROM messages')
-                stats['total_messages'] = cursor.fetchone()[0]
+                # Totals are kept up to date by triggers in a single row, once the backfills have seeded it
+                pending = self._backfill_progress(cursor)
+                if any(job['name'].startswith('totals:') for job in pending):
+                    totals = self._count_database_totals(cursor)
+                else:
+                    cursor.execute('SELECT * FROM database_stats WHERE id = 1')
+                    totals = cursor.fetchone()
+                stats['active_conversations'] = totals['active_conversations']
+                stats['total_messages'] = totals['message_count']
+                stats['total_artifacts'] = totals['artifact_count']
+                stats['total_contexts'] = totals['context_count']
+                stats['message_bytes'] = totals['message_bytes']
+                stats['artifact_bytes'] = totals['artifact_bytes']
+                stats['context_bytes'] = totals['context_bytes']
                 
-                cursor.execute('SELECT COUNT(*) FROM code_artifacts')
-                stats['total_artifacts'] = cursor.fetchone()[0]
+                # Get token statistics
+                stats['total_input_tokens'] = totals['total_input_tokens']
+                stats['total_output_tokens'] = totals['total_output_tokens']
+                stats['total_tokens'] = totals['total_input_tokens'] + totals['total_output_tokens']
                 
-                cursor.execute('SELECT COUNT(*) FROM project_contexts')
-                stats['total_contexts'] = cursor.fetchone()[0]
+                # Get blob store statistics (every context and artifact reference holds its blob's bytes)
+                stats['total_blobs'] = totals['blob_count']
+                stats['blob_bytes'] = totals['blob_bytes']
+                stats['blob_bytes_deduplicated'] = max(
+                    0, totals['artifact_bytes'] + totals['context_bytes'] - totals['blob_bytes'])
                 
-                # Get token statistics
-                cursor.execute('''
-                    SELECT 
-                        SUM(total_input_tokens) as total_input,
-                        SUM(total_output_tokens) as total_output
-                    FROM conversations
-                    WHERE is_deleted = 0
-                ''')
-                token_stats = cursor.fetchone()
-                stats['total_input_tokens'] = token_stats[0] or 0
-                stats['total_output_tokens'] = token_stats[1] or 0
-                stats['total_tokens'] = (token_stats[0] or 0) + (token_stats[1] or 0)
+                # Get schema version and unfinished background backfills
+                stats['schema_version'] = self._schema_version(cursor)
+                stats['pending_backfills'] = pending
                 
-                # Get database size
+                # Get database size and the space a vacuum would return
                 stats['database_size'] = os.path.getsize(self.db_path)
+                cursor.execute('PRAGMA freelist_count')
+                free_pages = cursor.fetchone()[0]
+                cursor.execute('PRAGMA page_size')
+                stats['free_bytes'] = free_pages * cursor.fetchone()[0]
                 
                 return stats
         except Exception as e:
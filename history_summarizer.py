@@ -0,0 +1,110 @@
+import queue
+import threading
+from typing import Callable, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTIONS = """Summarize the earlier part of a conversation between a user and a coding agent.
+Keep decisions made, file paths and function names discussed, requirements the user stated,
+errors encountered and how they were fixed, and any open tasks. Drop pleasantries and code
+that was already shown in full. Write compact bullet points; do not add commentary."""
+
+
+class HistorySummarizer:
+    """
+    Background worker that compacts conversation history into rolling summaries
+
+    Once a conversation has more than window_messages messages beyond its latest
+    summary, the older overflow (plus the previous summary) is summarized by the
+    model and stored, so prompt building can substitute the summary for those
+    raw turns. Jobs are deduplicated per conversation and run one at a time.
+    """
+
+    def __init__(self, db, complete: Callable[[List[Dict[str, str]]], str],
+                 window_messages: int = 12, min_batch_messages: int = 6):
+        self.db = db
+        self.complete = complete
+        self.window_messages = window_messages
+        self.min_batch_messages = max(1, min_batch_messages)
+        self._queue: 'queue.Queue[str]' = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_messages > 0
+
+    def schedule(self, conversation_id):
+        """
+        Queue a conversation for compaction check; cheap to call after every turn
+        """
+        if not self.enabled:
+            return
+        key = str(conversation_id)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="history-summarizer", daemon=True)
+                self._thread.start()
+        self._queue.put(key)
+
+    def _run(self):
+        while True:
+            conversation_id = self._queue.get()
+            try:
+                self.compact(conversation_id)
+            except Exception as e:
+                logger.error(f"History compaction failed for conversation {conversation_id}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._pending.discard(conversation_id)
+                self._queue.task_done()
+
+    def split_history(self, messages: List[Dict], summary: Optional[Dict]) -> List[Dict]:
+        """
+        Messages not yet covered by the summary
+        """
+        if not summary:
+            return messages
+        return [msg for msg in messages if msg['id'] > summary['upto_message_id']]
+
+    def compact(self, conversation_id) -> bool:
+        """
+        Summarize the overflow beyond the window if it is large enough
+
+        :return: True if a new summary was stored
+        """
+        messages = self.db.get_conversation_messages(conversation_id)
+        summary = self.db.get_latest_summary(conversation_id)
+        unsummarized = self.split_history(messages, summary)
+
+        overflow = unsummarized[:max(0, len(unsummarized) - self.window_messages)]
+        if len(overflow) < self.min_batch_messages:
+            return False
+        # Keep user/assistant pairs together in the raw window
+        if overflow[-1]['role'] == 'user':
+            overflow = overflow[:-1]
+        if not overflow:
+            return False
+
+        transcript = []
+        if summary:
+            transcript.append(f"SUMMARY SO FAR:\n{summary['summary']}\n")
+        for msg in overflow:
+            transcript.append(f"{msg['role'].upper()}:\n{msg['content']}\n")
+
+        text = self.complete([
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+            {"role": "user", "content": "\n".join(transcript)}
+        ])
+        if not text:
+            return False
+
+        covered = len(overflow) + (summary['message_count'] if summary else 0)
+        self.db.add_conversation_summary(conversation_id, overflow[-1]['id'], text, covered)
+        logger.info(f"Compacted {len(overflow)} messages of conversation {conversation_id}")
+        return True
@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QueueTimeout(Exception):
+    """Raised when a request waited longer than the scheduler's queue timeout"""
+
+
+class Ticket:
+    """
+    A request's place in the scheduler: queued, running, or done
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.state = 'queued'
+        self.submitted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self._granted = threading.Event()
+
+    @property
+    def wait_seconds(self) -> float:
+        return (self.started_at or time.monotonic()) - self.submitted_at
+
+
+class LLMScheduler:
+    """
+    Admission control in front of the LLM backend
+
+    At most max_in_flight calls run at once (match it to the backend's parallelism,
+    e.g. OLLAMA_NUM_PARALLEL); the rest wait in per-conversation FIFO queues that
+    are served round-robin, so one conversation firing many requests can't starve
+    the others. Waiters can poll their queue position, give up after queue_timeout
+    seconds, or cancel (e.g. when the browser disconnects). Limits apply per process.
+    """
+
+    def __init__(self, max_in_flight: int = 1, queue_timeout: float = 120.0):
+        self.max_in_flight = max(1, max_in_flight)
+        self.queue_timeout = queue_timeout
+        self._queues: 'OrderedDict[str, Deque[Ticket]]' = OrderedDict()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def submit(self, key) -> Ticket:
+        """
+        Queue a request for a conversation (or other fairness key such as a background job)
+        """
+        ticket = Ticket(str(key))
+        with self._lock:
+            self._queues.setdefault(ticket.key, deque()).append(ticket)
+            self._dispatch()
+        return ticket
+
+    def _dispatch(self):
+        # Caller holds the lock. Grant free slots to queue heads in round-robin order.
+        while self._in_flight < self.max_in_flight and self._queues:
+            key, waiting = next(iter(self._queues.items()))
+            ticket = waiting.popleft()
+            if waiting:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            ticket.state = 'running'
+            ticket.started_at = time.monotonic()
+            self._in_flight += 1
+            ticket._granted.set()
+
+    def position(self, ticket: Ticket) -> int:
+        """
+        1-based place of a queued ticket in the order slots will be granted (0 once running)
+        """
+        with self._lock:
+            if ticket.state != 'queued':
+                return 0
+            depth = self._queues[ticket.key].index(ticket)
+            ahead = 0
+            # Queues are served round-robin in dict order: each queue ranked before this
+            # one gets depth + 1 turns first, each ranked after it gets depth turns
+            before = True
+            for key, waiting in self._queues.items():
+                if key == ticket.key:
+                    before = False
+                ahead += min(len(waiting), depth + (1 if before else 0))
+            return ahead + 1
+
+    def wait_turn(self, ticket: Ticket, poll_interval: float = 1.0) -> Iterator[int]:
+        """
+        Wait for a ticket to start, yielding its queue position every poll_interval
+
+        Yields nothing if a slot is free. Closing the iterator (e.g. the response
+        generator being closed on disconnect) leaves the ticket queued; release it.
+
+        :raises QueueTimeout: The ticket waited longer than queue_timeout (it is cancelled)
+        """
+        while not ticket._granted.wait(poll_interval):
+            if self.queue_timeout and ticket.wait_seconds > self.queue_timeout and self._expire(ticket):
+                raise QueueTimeout(f"No model slot became free within {self.queue_timeout:g}s")
+            yield self.position(ticket)
+
+    def _expire(self, ticket: Ticket) -> bool:
+        """
+        Cancel a ticket that is still queued; False if it was granted in the meantime
+        """
+        with self._lock:
+            if ticket.state != 'queued':
+                return False
+            self._release_locked(ticket)
+        logger.warning(f"LLM request for {ticket.key} timed out after {ticket.wait_seconds:.0f}s in queue")
+        return True
+
+    def release(self, ticket: Ticket):
+        """
+        Finish a running ticket or cancel a queued one; safe to call more than once
+        """
+        with self._lock:
+            self._release_locked(ticket)
+
+    def _release_locked(self, ticket: Ticket):
+        if ticket.state == 'queued':
+            waiting = self._queues[ticket.key]
+            waiting.remove(ticket)
+            if not waiting:
+                del self._queues[ticket.key]
+        elif ticket.state == 'running':
+            self._in_flight -= 1
+        ticket.state = 'done'
+        self._dispatch()
+
+    @contextmanager
+    def slot(self, key, timeout: float = None):
+        """
+        Block until a slot is free and hold it for the duration of the with-block
+
+        :raises QueueTimeout: No slot became free within timeout (default queue_timeout)
+        """
+        ticket = self.submit(key)
+        try:
+            timeout = self.queue_timeout if timeout is None else timeout
+            if not ticket._granted.wait(timeout or None) and self._expire(ticket):
+                raise QueueTimeout(f"No model slot became free within {timeout:g}s")
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self._in_flight,
+                "queued": sum(len(waiting) for waiting in self._queues.values()),
+                "queued_conversations": len(self._queues)
+            }
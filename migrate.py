@@ -0,0 +1,76 @@
+"""
+Schema migrations for the conversation database: python migrate.py [--apply] [--vacuum]
+
+Without --apply this is a dry run: it prints the schema version, each pending
+migration step with the rows it touches while startup waits and the rows it
+leaves to a background backfill, and any backfills still in progress. With
+--apply it runs the pending steps and then finishes every backfill in the
+foreground (the server would otherwise run them in small chunks while it
+serves requests). --vacuum converts a database created before incremental
+auto-vacuum with one full VACUUM, so its file can shrink as data is purged.
+"""
+import argparse
+import os
+import sys
+import time
+
+from database import ConversationDatabase
+
+
+def print_plan(plan):
+    print(f"Schema version {plan['schema_version']} (current is {plan['target_version']})")
+    if plan['steps']:
+        print("\nPending steps:")
+        for step in plan['steps']:
+            print(f"  {step['version']:>2}. {step['description']}: {step['detail']}")
+            print(f"      {step['rows']} rows while startup waits, {step['background_rows']} rows in the background")
+    else:
+        print("\nNo pending steps")
+    if plan['backfills']:
+        print("\nBackfills in progress:")
+        for job in plan['backfills']:
+            print(f"  {job['name']:<24} id {job['position']} of {job['upto_id']} "
+                  f"({job['rows_done']} rows rewritten, queued {job['queued_at']})")
+    if plan['auto_vacuum'] != 'incremental':
+        print(f"\nauto_vacuum is {plan['auto_vacuum']}: the file never shrinks (--vacuum converts it)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default=os.getenv("DB_PATH", "conversations.db"),
+                        help='database file (default: $DB_PATH or conversations.db)')
+    parser.add_argument('--apply', action='store_true', help='apply pending steps and run backfills to completion')
+    parser.add_argument('--vacuum', action='store_true',
+                        help='switch to incremental auto-vacuum (one full VACUUM; stop the server first)')
+    parser.add_argument('--batch-size', type=int, default=2000, help='ids per backfill chunk (default 2000)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"{args.db} does not exist (the server creates it at the current version on first start)")
+        sys.exit(1)
+
+    db = ConversationDatabase(args.db, migrate=False)
+    print_plan(db.migration_plan())
+    db.close()
+    if not args.apply and not args.vacuum:
+        return
+
+    start = time.perf_counter()
+    db = ConversationDatabase(args.db, backfill_batch_size=args.batch_size)
+    print(f"\nMigrated in {time.perf_counter() - start:.1f}s")
+    start = time.perf_counter()
+    rows = db.run_backfills()
+    print(f"Backfilled {rows} rows in {time.perf_counter() - start:.1f}s")
+    if args.vacuum:
+        start = time.perf_counter()
+        size = os.path.getsize(args.db)
+        if db.enable_incremental_vacuum():
+            print(f"Vacuumed in {time.perf_counter() - start:.1f}s "
+                  f"({size} -> {os.path.getsize(args.db)} bytes)")
+    print()
+    print_plan(db.migration_plan())
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
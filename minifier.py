@@ -0,0 +1,367 @@
+import re
+import sys
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+
+def _quoted(quote: str, multiline: bool = False, escapes: bool = True) -> str:
+    """
+    Regex for a string literal delimited by quote, written as an unrolled loop
+    so the regex engine never backtracks inside long literals
+    """
+    q = re.escape(quote)
+    stop = quote + ('\\\\' if escapes else '') + ('' if multiline else '\\n')
+    body = f"[^{stop}]*"
+    if escapes:
+        body += f"(?:\\\\.[^{stop}]*)*"
+    return f"{q}{body}{q}"
+
+
+def _triple_quoted(quote: str) -> str:
+    q = re.escape(quote)
+    return f"{q * 3}[^{q}\\\\]*(?:(?:\\\\.|{q}(?!{q}{q}))[^{q}\\\\]*)*{q * 3}"
+
+
+# A JavaScript regex literal: escapes and character classes may contain "/"
+_REGEX_LITERAL = r"/(?![*/])[^/\\\[\n]*(?:(?:\\[^\n]|\[[^\]\\\n]*(?:\\[^\n][^\]\\\n]*)*\])[^/\\\[\n]*)*/[A-Za-z]*"
+
+# A "/" after one of these starts a regex literal; after anything else it divides
+_REGEX_PRECEDERS = re.compile(
+    r"(?:^|[(,=:\[!&|?{;~+\-*%<>^]|(?<![\w$.])(?:return|typeof|instanceof|in|of|new|delete|void|"
+    r"throw|case|do|else|yield|await))$"
+)
+
+# Text a regex literal shares with division only if scanning it as code changes nothing
+_REGEX_HAZARDS = re.compile(r"[\s'\"`]|/[*/]")
+
+
+class _Ambiguous(Exception):
+    """A "/" that may start a regex literal or divide, with different results"""
+
+
+class Grammar:
+    """
+    Comment and string syntax of a language family, compiled into one scanner
+
+    The scanner splits a buffer into comment, newline, whitespace, and code
+    tokens in a single left-to-right pass. Code tokens include string literals
+    and single spaces between words, so comment markers inside strings are never
+    mistaken for comments and most lines come out as one token.
+
+    :param strings: Regexes for string literals, longest delimiters first
+    :param line_comment: Regex for a comment running to the end of the line
+    :param block_comment: Regex for a delimited (possibly multi-line) comment
+    :param specials: Characters that can start a string or comment
+    :param indent: 'python' to keep block structure with one space per level,
+                   'collapse' to drop indentation, 'keep' to leave it untouched
+    :param regex_literal: Regex for a regex literal, scanned where the previous
+                          token can't end an operand (so "/" can't be division)
+    """
+
+    def __init__(self, name: str, strings: Iterable[str] = (), line_comment: Optional[str] = None,
+                 block_comment: Optional[str] = None, specials: str = '', indent: str = 'collapse',
+                 regex_literal: Optional[str] = None):
+        self.name = name
+        self.indent = indent
+        self.regex_literal = re.compile(regex_literal) if regex_literal else None
+        alternatives = []
+        strings = '|'.join(strings)
+        if block_comment:
+            alternatives.append(f"(?P<block>{block_comment})")
+        if line_comment:
+            alternatives.append(f"(?P<line>{line_comment})")
+        word = f"[^\\s{re.escape(specials)}]+" if specials else "\\S+"
+        # String literals are part of code tokens, so a typical line is a single token
+        unit = f"(?:{word}|{strings})" if strings else word
+        code = f"{unit}(?: ?{unit})*"
+        alternatives += [
+            # A line break is matched together with the code that starts the next line
+            f"(?P<nl>\\n\\s*)(?P<lead>{code})?",
+            "(?P<ws>[ \\t\\r\\f\\v]+)",
+            f"(?P<code>{code})",
+            "(?P<code1>.)",
+        ]
+        self.strings = re.compile(strings, re.S) if strings else None
+        self.pattern = re.compile('|'.join(alternatives), re.S)
+
+
+PYTHON = Grammar(
+    'python',
+    strings=[_triple_quoted("'"), _triple_quoted('"'), _quoted("'"), _quoted('"')],
+    line_comment=r"#[^\n]*",
+    specials="#'\"",
+    indent='python'
+)
+
+JAVASCRIPT = Grammar(
+    'javascript',
+    strings=[_quoted("'"), _quoted('"'), _quoted('`', multiline=True)],
+    line_comment=r"//[^\n]*",
+    block_comment=r"/\*.*?\*/",
+    specials="/'\"`",
+    regex_literal=_REGEX_LITERAL
+)
+
+C_FAMILY = Grammar(
+    'c',
+    strings=[_quoted('"'), _quoted("'")],
+    line_comment=r"//[^\n]*",
+    block_comment=r"/\*.*?\*/",
+    specials="/'\""
+)
+
+# Go raw strings and Kotlin/Swift/Dart/C# multi-line literals use a different delimiter
+C_FAMILY_RAW = Grammar(
+    'c_raw',
+    strings=[_triple_quoted('"'), _quoted('"'), _quoted("'"), _quoted('`', multiline=True, escapes=False)],
+    line_comment=r"//[^\n]*",
+    block_comment=r"/\*.*?\*/",
+    specials="/'\"`"
+)
+
+# A shell comment starts only at the beginning of a word ("$#", "a#b" are not comments)
+SHELL = Grammar(
+    'shell',
+    strings=[_quoted("'", multiline=True, escapes=False), _quoted('"', multiline=True)],
+    line_comment=r"(?<![^\s;&|()])#[^\n]*",
+    specials="#'\""
+)
+
+SQL = Grammar(
+    'sql',
+    strings=[_quoted("'", multiline=True, escapes=False), _quoted('"', escapes=False)],
+    line_comment=r"--[^\n]*",
+    block_comment=r"/\*.*?\*/",
+    specials="-/'\""
+)
+
+CSS = Grammar(
+    'css',
+    strings=[_quoted('"'), _quoted("'")],
+    block_comment=r"/\*.*?\*/",
+    specials="/'\""
+)
+
+MARKUP = Grammar(
+    'markup',
+    block_comment=r"<!--.*?-->",
+    specials="<"
+)
+
+PLAIN = Grammar('plain', indent='keep')
+
+# Keyed by the language names app._detect_language() returns
+GRAMMARS: Dict[str, Grammar] = {
+    'python': PYTHON,
+    'javascript': JAVASCRIPT, 'typescript': JAVASCRIPT, 'jsx': JAVASCRIPT, 'tsx': JAVASCRIPT,
+    'c': C_FAMILY, 'cpp': C_FAMILY, 'java': C_FAMILY, 'rust': C_FAMILY, 'php': C_FAMILY,
+    'scss': C_FAMILY, 'less': C_FAMILY,
+    'go': C_FAMILY_RAW, 'kotlin': C_FAMILY_RAW, 'swift': C_FAMILY_RAW,
+    'dart': C_FAMILY_RAW, 'csharp': C_FAMILY_RAW,
+    'bash': SHELL, 'docker': SHELL, 'powershell': SHELL, 'ruby': SHELL, 'r': SHELL,
+    'toml': SHELL, 'hcl': SHELL,
+    'sql': SQL, 'lua': SQL,
+    'css': CSS, 'sass': CSS,
+    'html': MARKUP, 'xml': MARKUP,
+}
+
+
+_DOC_COMMENT_PREFIXES = {'block': '/**', 'line': '///'}
+
+
+def grammar_for(language: str) -> Grammar:
+    return GRAMMARS.get(language, PLAIN)
+
+
+def _indent_width(indent: str) -> int:
+    return len(indent.expandtabs(8))
+
+
+def minify(content: str, language: str, keep_doc_comments: bool = False) -> str:
+    """
+    Strip comments, blank lines, and redundant whitespace in one pass
+
+    String literals (and so Python docstrings) are kept verbatim. Python keeps its
+    block structure with one space per indentation level; lines continued inside
+    brackets are joined. Other languages lose indentation but keep line breaks, so
+    automatic semicolon insertion and line-oriented syntax still work. A leading
+    shebang line is preserved. JavaScript regex literals are kept verbatim too;
+    where a "/" could be either a regex or division and the two readings differ
+    (after "}"), the content is returned unchanged.
+
+    :param keep_doc_comments: Keep /** */ and /// doc comments (used by outlines)
+    """
+    grammar = grammar_for(language)
+    original = content
+    out = []
+    if content.startswith('#!'):
+        shebang, _, content = content.partition('\n')
+        out.append(shebang.rstrip())
+    # A leading newline lets the first line's indentation go through the nl token
+    content = '\n' + content
+    if grammar.indent == 'python':
+        _minify_python(grammar, content, out)
+    else:
+        try:
+            _minify_generic(grammar, content, out, keep_doc_comments)
+        except _Ambiguous:
+            return original
+    return ''.join(out)
+
+
+def _minify_generic(grammar: Grammar, content: str, out: list, keep_doc_comments: bool = False):
+    append = out.append
+    keep_indent = grammar.indent == 'keep'
+    pending_nl: Optional[str] = None
+    pending_space = False
+    regex_literal = grammar.regex_literal
+    previous = ''  # Last code token, to tell a regex literal from division
+    resume: Optional[int] = 0
+
+    while resume is not None:
+        matches, resume = grammar.pattern.finditer(content, resume), None
+        for match in matches:
+            kind = match.lastgroup
+            if kind == 'code1' and regex_literal is not None and match.group() == '/':
+                # Comments were matched before, so this "/" is a regex literal or division
+                literal = regex_literal.match(content, match.start())
+                if literal is not None and previous.endswith('}') and _REGEX_HAZARDS.search(literal.group(), 1):
+                    raise _Ambiguous()
+                if literal is not None and _REGEX_PRECEDERS.search(previous):
+                    # Emit the literal verbatim, then rescan after it
+                    match = literal
+                    resume = literal.end()
+            if keep_doc_comments and (kind == 'block' or kind == 'line') and \
+                    match.group().startswith(_DOC_COMMENT_PREFIXES[kind]):
+                kind = 'code'
+            if kind == 'code' or kind == 'code1':
+                if pending_nl is not None:
+                    if out:
+                        append('\n')
+                    if keep_indent:
+                        append(pending_nl[pending_nl.rfind('\n') + 1:])
+                    pending_nl = None
+                elif pending_space:
+                    append(' ')
+                pending_space = False
+                if match.lastgroup != 'block' and match.lastgroup != 'line':
+                    previous = match.group()
+                append(match.group())
+                if resume is not None:
+                    break
+            elif kind == 'lead':
+                if out:
+                    append('\n')
+                if keep_indent:
+                    newline = match.group('nl')
+                    append(newline[newline.rfind('\n') + 1:])
+                previous = match.group('lead')
+                append(previous)
+                pending_nl = None
+                pending_space = False
+            elif kind == 'nl':
+                pending_nl = match.group()
+            elif kind == 'block' and '\n' in match.group():
+                pending_nl = pending_nl or '\n'
+            else:
+                pending_space = True
+
+
+def _minify_python(grammar: Grammar, content: str, out: list):
+    append = out.append
+    levels = None  # Indentation widths of the enclosing blocks
+    depth = 0  # Bracket nesting; newlines inside brackets are insignificant
+    pending_nl: Optional[str] = None
+    pending_space = False
+    continued = False  # Previous line ended with a backslash
+    last = ''
+
+    for match in grammar.pattern.finditer(content):
+        kind = match.lastgroup
+        if kind == 'lead' or kind == 'nl':
+            if last.endswith('\\'):
+                # Backslash continuation: keep the break, the next line's indentation is insignificant
+                pending_nl = ''
+                continued = True
+            elif depth > 0:
+                pending_space = True
+            else:
+                pending_nl = match.group('nl')
+                continued = False
+            if kind == 'nl':
+                last = ''
+                continue
+            token = match.group('lead')
+            kind = 'code'
+        elif kind == 'ws' or kind == 'line':
+            pending_space = True
+            continue
+        else:
+            token = match.group()
+
+        if pending_nl is not None:
+            # Indentation is only resolved for lines with code, so comment-only lines can't disturb it
+            if continued:
+                indent = ' ' * len(levels or [0])
+            else:
+                indent = pending_nl[pending_nl.rfind('\n') + 1:]
+                width = _indent_width(indent) if '\t' in indent else len(indent)
+                if levels is None:
+                    levels = [width]
+                while len(levels) > 1 and levels[-1] > width:
+                    levels.pop()
+                if width > levels[-1]:
+                    levels.append(width)
+                indent = ' ' * (len(levels) - 1)
+            if out:
+                append('\n')
+            append(indent)
+            pending_nl = None
+        elif pending_space:
+            append(' ')
+        pending_space = False
+        append(token)
+        last = token
+        if kind == 'code':
+            if "'" in token or '"' in token:
+                # Brackets inside string literals don't nest
+                token = grammar.strings.sub('', token)
+            depth += (token.count('(') + token.count('[') + token.count('{')
+                      - token.count(')') - token.count(']') - token.count('}'))
+            if depth < 0:
+                depth = 0
+
+
+def _benchmark(paths: Iterable[str], target_bytes: int = 4 * 1024 * 1024) -> Tuple[int, float]:
+    extensions = {
+        '.py': 'python', '.js': 'javascript', '.ts': 'typescript', '.c': 'c', '.h': 'c',
+        '.cpp': 'cpp', '.java': 'java', '.go': 'go', '.rs': 'rust', '.sh': 'bash',
+        '.sql': 'sql', '.css': 'css', '.html': 'html'
+    }
+    total_bytes, total_seconds = 0, 0.0
+    for path in paths:
+        ext = path[path.rfind('.'):].lower() if '.' in path else ''
+        language = extensions.get(ext, 'plaintext')
+        with open(path, encoding='utf-8', errors='replace') as f:
+            content = f.read()
+        if not content:
+            continue
+        repeat = max(1, target_bytes // len(content.encode('utf-8')))
+        size = len(content.encode('utf-8')) * repeat
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = minify(content, language)
+        elapsed = time.perf_counter() - start
+        total_bytes += size
+        total_seconds += elapsed
+        print(f"{path:40} {language:12} {size / elapsed / 1e6:8.1f} MB/s  "
+              f"{len(result) / len(content) * 100:5.1f}% of original")
+    return total_bytes, total_seconds
+
+
+if __name__ == "__main__":
+    # Throughput benchmark: python minifier.py [files...] (defaults to this repo's sources)
+    files = sys.argv[1:] or ['app.py', 'database.py', 'minifier.py', 'static/script.js']
+    total_bytes, total_seconds = _benchmark(files)
+    if total_seconds:
+        print(f"{'total':53} {total_bytes / total_seconds / 1e6:8.1f} MB/s")
@@ -0,0 +1,133 @@
+import ast
+import re
+from typing import Iterable, List, Set
+
+from minifier import PYTHON, grammar_for, minify
+
+# Assignments and compound statements longer than this are cut to a header in an outline
+MAX_STATEMENT_LINES = 3
+
+# Blocks opened by these keep their members (each member is outlined in turn)
+_CONTAINER = re.compile(r'\b(class|interface|struct|enum|impl|trait|namespace|module|object|'
+                        r'record|union|extension|protocol|mod)\b')
+_WORD = re.compile(r'[A-Za-z_$][\w$]*')
+
+
+def outline(content: str, language: str, focus: Iterable[str] = ()) -> str:
+    """
+    Reduce source to a skeleton of signatures and docstrings
+
+    Symbols named in focus (a bare name or Class.method) keep their full source.
+    Python is outlined from its AST; other languages with brace blocks are
+    outlined line by line, keeping containers (classes, structs, impls, ...) and
+    replacing function bodies with "...". Languages without blocks, and Python
+    that does not parse, fall back to the plain minifier.
+    """
+    focus = {name.strip() for name in focus if name and name.strip()}
+    if grammar_for(language) is PYTHON:
+        try:
+            return minify(_outline_python(content, focus), 'python')
+        except (SyntaxError, ValueError):
+            return minify(content, language)
+    return _outline_braces(minify(content, language, keep_doc_comments=True), language, focus)
+
+
+def _is_docstring(node: ast.stmt) -> bool:
+    return (isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant)
+            and isinstance(node.value.value, str))
+
+
+def _outline_python(content: str, focus: Set[str]) -> str:
+    lines = content.splitlines()
+    out: List[str] = []
+    _outline_python_body(ast.parse(content).body, lines, focus, '', out)
+    return '\n'.join(out)
+
+
+def _outline_python_body(nodes: List[ast.stmt], lines: List[str], focus: Set[str],
+                         scope: str, out: List[str]):
+    for node in nodes:
+        first = min([node.lineno] + [d.lineno for d in getattr(node, 'decorator_list', [])])
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            if node.end_lineno - first < MAX_STATEMENT_LINES:
+                out.extend(lines[first - 1:node.end_lineno])
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                head = lines[first - 1]
+                indent = head[:len(head) - len(head.lstrip())]
+                if isinstance(node, ast.Assign):
+                    target = ' = '.join(ast.unparse(t) for t in node.targets)
+                else:
+                    target = f"{ast.unparse(node.target)}: {ast.unparse(node.annotation)}"
+                out.append(f"{indent}{target} = ...")
+            elif getattr(node, 'body', None):
+                # Compound statement (if/for/with/try): keep its header only
+                out.extend(lines[first - 1:node.body[0].lineno - 1] or [lines[first - 1]])
+                out.append(' ' * _body_indent(lines, node) + '...')
+            else:
+                out.extend(lines[first - 1:node.end_lineno])
+            continue
+
+        qualname = f"{scope}.{node.name}" if scope else node.name
+        if node.name in focus or qualname in focus:
+            out.extend(lines[first - 1:node.end_lineno])
+            continue
+
+        body = node.body
+        if body[0].lineno <= node.lineno:
+            # Whole definition on one line
+            out.extend(lines[first - 1:node.end_lineno])
+            continue
+        out.extend(line for line in lines[first - 1:body[0].lineno - 1]
+                   if line.strip() and not line.lstrip().startswith('#'))
+        if _is_docstring(body[0]):
+            out.extend(lines[body[0].lineno - 1:body[0].end_lineno])
+            body = body[1:]
+        if isinstance(node, ast.ClassDef):
+            _outline_python_body(body, lines, focus, qualname, out)
+            if not body:
+                out.append(' ' * _body_indent(lines, node) + '...')
+        else:
+            out.append(' ' * _body_indent(lines, node) + '...')
+
+
+def _body_indent(lines: List[str], node: ast.stmt) -> int:
+    line = lines[node.body[0].lineno - 1]
+    return len(line) - len(line.lstrip())
+
+
+def _outline_braces(text: str, language: str, focus: Set[str]) -> str:
+    grammar = grammar_for(language)
+    out: List[str] = []
+    depth = 0
+    skip_to = None  # Depth at which the elided block closes
+    in_doc = False
+
+    for line in text.split('\n'):
+        # Doc comments were kept by the minifier; pass them through without counting braces
+        if in_doc or line.startswith('/**') or line.startswith('///'):
+            if line.startswith('/**'):
+                in_doc = '*/' not in line
+            elif in_doc and '*/' in line:
+                in_doc = False
+            if skip_to is None:
+                out.append(line)
+            continue
+
+        code = grammar.strings.sub('""', line) if grammar.strings else line
+        delta = code.count('{') - code.count('}')
+        if skip_to is not None:
+            depth += delta
+            if depth <= skip_to:
+                out.append(line)
+                skip_to = None
+            continue
+
+        out.append(line)
+        if (delta > 0 and not _CONTAINER.search(code) and ('(' in code or '=>' in code)
+                and not focus.intersection(_WORD.findall(code))):
+            # Function-like block: keep the signature, drop the body
+            out.append('...')
+            skip_to = depth
+        depth = max(0, depth + delta)
+
+    return '\n'.join(out)
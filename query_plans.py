@@ -0,0 +1,252 @@
+"""
+Query-plan check for the SQLite schema: python query_plans.py [--messages N]
+
+Seeds a throwaway database (1M messages by default), calls every public
+ConversationDatabase method against it, and runs EXPLAIN QUERY PLAN on each
+statement they issue. A statement that scans a whole table or index, or sorts
+through a temporary B-tree, is reported and makes the script exit non-zero,
+unless ALLOWED_PLANS lists it as intentional. Run it after changing a query
+or an index.
+"""
+import argparse
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+
+from database import ConversationDatabase, content_hash
+
+# Plan steps that are expected, per method: (method name, substring of the plan step, reason)
+ALLOWED_PLANS = [
+    ('migration_plan', 'SCAN', 'offline dry run that counts the rows each step would touch'),
+    ('run_backfills', 'SCAN sqlite_master', 'checks the backfill queue exists'),
+    ('run_backfills', 'SCAN schema_backfills', 'one row per queued backfill'),
+    ('purge_deleted_conversations', 'SCAN sqlite_master', 'checks the backfill queue exists'),
+    ('purge_deleted_conversations', 'SCAN schema_backfills', 'one row per queued backfill'),
+    ('compact', 'SCAN sqlite_master', 'checks the backfill queue exists'),
+    ('compact', 'SCAN schema_backfills', 'one row per queued backfill'),
+    ('purge_unreferenced_blobs', 'SCAN derived_blobs', 'maintenance pass over the transform cache'),
+    ('purge_unreferenced_blobs', 'SCAN project_contexts', 'reads live context sources once per pass'),
+    ('compact', 'SCAN derived_blobs', 'maintenance pass over the transform cache'),
+    ('compact', 'SCAN project_contexts', 'reads live context sources once per pass'),
+    ('get_database_stats', 'SCAN sqlite_master', 'checks the backfill queue exists'),
+    ('get_database_stats', 'SCAN schema_backfills', 'one row per queued backfill'),
+    ('get_conversation_history', 'SCAN conversations USING INDEX idx_conv_updated',
+     'walks the index in order and stops at LIMIT'),
+]
+
+# Plan steps that mean work grows with the table instead of the result
+BAD_PLAN = re.compile(r'^(SCAN (?!\S+ VIRTUAL TABLE)|USE TEMP B-TREE)')
+
+WORDS = ("index query plan sqlite conversation message context artifact token budget cache "
+         "stream backend worker retrieval summary workspace python function class import").split()
+
+
+class PlanRecordingDatabase(ConversationDatabase):
+    """
+    ConversationDatabase whose connections record every statement they run
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.statements: List[str] = []
+        self.recording = False
+        super().__init__(*args, **kwargs)
+
+    def _create_connection(self) -> sqlite3.Connection:
+        conn = super()._create_connection()
+        conn.set_trace_callback(self._trace)
+        return conn
+
+    def _trace(self, statement: str):
+        # Trigger bodies are traced as '-- TRIGGER name' and planned with their statement
+        if self.recording and not statement.lstrip().startswith('--'):
+            self.statements.append(statement)
+
+
+def seed(db: ConversationDatabase, messages: int, messages_per_conversation: int = 500):
+    """
+    Bulk-load conversations with messages, contexts, artifacts, and summaries
+    """
+    rng = random.Random(0)
+    conversations = max(1, messages // messages_per_conversation)
+    texts = [" ".join(rng.choices(WORDS, k=24)) for _ in range(1000)]
+    blobs = [(content_hash(text), text, len(text)) for text in texts[:200]]
+
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO conversations (name, created_at, last_updated, is_deleted, workspace_path)
+            VALUES (?, datetime('now', ?), datetime('now', ?), ?, NULL)
+        ''', ((f"Conversation {i} {rng.choice(WORDS)}", f'-{i} minutes', f'-{i} minutes', int(i % 10 == 0))
+              for i in range(conversations)))
+        cursor.executemany('INSERT OR IGNORE INTO blobs (hash, content, size) VALUES (?, ?, ?)', blobs)
+        cursor.executemany('''
+            INSERT INTO messages (conversation_id, role, content, tokens_input, tokens_output, timestamp)
+            VALUES (?, ?, ?, 10, 20, datetime('now', ?))
+        ''', ((1 + i // messages_per_conversation, 'user' if i % 2 == 0 else 'assistant',
+               texts[i % len(texts)], f'-{messages - i} seconds') for i in range(messages)))
+        cursor.executemany('''
+            INSERT INTO project_contexts (conversation_id, file_path, file_content, content_hash, token_count)
+            VALUES (?, ?, '', ?, 100)
+        ''', ((conversation_id, f"src/module_{n}.py", blobs[(conversation_id + n) % len(blobs)][0])
+              for conversation_id in range(1, conversations + 1) for n in range(5)))
+        cursor.execute('''
+            INSERT INTO code_artifacts (conversation_id, content, content_hash, language, timestamp, message_id)
+            SELECT conversation_id, '', ?, 'python', timestamp, id FROM messages
+            WHERE role = 'assistant' AND id % 10 = 0
+        ''', (blobs[0][0],))
+        cursor.execute('''
+            INSERT INTO conversation_summaries (conversation_id, upto_message_id, summary, message_count)
+            SELECT conversation_id, MAX(id), 'summary', COUNT(*) FROM messages GROUP BY conversation_id
+        ''')
+    return conversations
+
+
+def exercise(db: ConversationDatabase, conversations: int) -> "OrderedDict[str, Callable[[], Any]]":
+    """
+    One representative call per public method, in an order that leaves the data valid
+    """
+    cid = conversations // 2
+    page = db.get_message_page(cid, limit=10)['messages']
+    message_ids = [message['id'] for message in page]
+    artifact_id = next(iter(db.get_artifact_summaries(message_ids).values()))[0]['id']
+    context_id = db.get_context_summaries(cid)[0]['id']
+    text = "def plan():\n    return 'covered'\n"
+
+    calls = OrderedDict()
+    calls['create_conversation'] = lambda: db.create_conversation('plan check')
+    calls['rename_conversation'] = lambda: db.rename_conversation(cid, 'renamed')
+    calls['get_conversation_name'] = lambda: db.get_conversation_name(cid)
+    calls['get_context_version'] = lambda: db.get_context_version(cid)
+    calls['add_message'] = lambda: db.add_message(cid, 'user', 'plan check', 5, 0)
+    calls['add_project_context'] = lambda: db.add_project_context(cid, 'src/module_1.py', text, token_count=10)
+    calls['add_project_contexts'] = lambda: db.add_project_contexts(cid, [
+        {'file_path': 'src/new_module.py', 'file_content': text}])
+    calls['get_context_sources'] = lambda: (db.get_context_sources(cid),
+                                            db.get_context_sources(file_path='src/module_1.py'))
+    calls['update_context_source'] = lambda: db.update_context_source(context_id, 1, 2)
+    calls['set_context_token_counts'] = lambda: db.set_context_token_counts({context_id: 42})
+    calls['remove_project_context'] = lambda: db.remove_project_context(cid, 'src/new_module.py')
+    calls['add_code_artifact'] = lambda: db.add_code_artifact(cid, text, 'python', message_id=message_ids[-1])
+    calls['record_turn'] = lambda: db.record_turn(cid, [
+        {'role': 'user', 'content': 'question', 'input_tokens': 3},
+        {'role': 'assistant', 'content': f"```python\n{text}```", 'output_tokens': 9}
+    ], [{'content': text, 'language': 'python'}])
+    calls['search'] = lambda: db.search('query plan')
+    calls['get_conversation_history'] = lambda: (db.get_conversation_history(),
+                                                 db.get_conversation_history(include_deleted=True))
+    calls['get_conversation_messages'] = lambda: db.get_conversation_messages(cid)
+    calls['get_message_page'] = lambda: (db.get_message_page(cid),
+                                         db.get_message_page(cid, before_id=message_ids[0]))
+    calls['get_artifact_summaries'] = lambda: db.get_artifact_summaries(message_ids)
+    calls['get_code_artifact'] = lambda: db.get_code_artifact(artifact_id)
+    calls['add_conversation_summary'] = lambda: db.add_conversation_summary(cid, message_ids[-1], 'summary', 10)
+    calls['get_latest_summary'] = lambda: db.get_latest_summary(cid)
+    calls['get_project_contexts'] = lambda: db.get_project_contexts(cid)
+    calls['get_context_summaries'] = lambda: db.get_context_summaries(cid)
+    calls['get_project_context'] = lambda: db.get_project_context(context_id)
+    calls['get_code_artifacts'] = lambda: db.get_code_artifacts(cid)
+    calls['get_conversation_tokens'] = lambda: db.get_conversation_tokens(cid)
+    calls['set_workspace'] = lambda: db.set_workspace(cid, tempfile.gettempdir())
+    calls['get_workspace'] = lambda: db.get_workspace(cid)
+    calls['toggle_favorite'] = lambda: db.toggle_favorite(cid)
+    calls['get_conversation_stats'] = lambda: db.get_conversation_stats(cid)
+    calls['put_derived_content'] = lambda: db.put_derived_content(content_hash(text), 'plan:v1', 'compressed')
+    calls['put_derived_contents'] = lambda: db.put_derived_contents([(content_hash(text), 'plan:v2', 'compressed')])
+    calls['get_derived_content'] = lambda: db.get_derived_content(content_hash(text), 'plan:v1')
+    calls['export_conversation'] = lambda: db.export_conversation(cid)
+    calls['import_conversation'] = lambda: db.import_conversation(db.export_conversation(cid))
+    calls['cleanup_old_conversations'] = lambda: db.cleanup_old_conversations(days=3650)
+    calls['delete_conversation'] = lambda: db.delete_conversation(cid + 1)
+    calls['purge_deleted_conversations'] = lambda: db.purge_deleted_conversations(retention_days=0, batch_size=5)
+    calls['purge_unreferenced_blobs'] = lambda: db.purge_unreferenced_blobs()
+    calls['incremental_vacuum'] = lambda: db.incremental_vacuum(100)
+    calls['enable_incremental_vacuum'] = lambda: db.enable_incremental_vacuum()
+    calls['compact'] = lambda: db.compact(retention_days=0, pause=0)
+    calls['get_database_stats'] = lambda: db.get_database_stats()
+    calls['migration_plan'] = lambda: db.migration_plan()
+    calls['run_backfills'] = lambda: db.run_backfills()
+    return calls
+
+
+def explain(conn: sqlite3.Connection, statement: str) -> List[str]:
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}")]
+
+
+def check(db: PlanRecordingDatabase, calls: Dict[str, Callable[[], Any]]) -> Tuple[List[Dict], List[str]]:
+    """
+    Run each call, plan its statements, and collect the plan steps that aren't allowed
+    """
+    planner = sqlite3.connect(db.db_path)
+    problems, report = [], []
+    for name, call in calls.items():
+        db.statements.clear()
+        db.recording = True
+        start = time.perf_counter()
+        try:
+            call()
+        finally:
+            db.recording = False
+        elapsed = (time.perf_counter() - start) * 1000
+        planned = 0
+        for statement in dict.fromkeys(db.statements):
+            if not re.match(r'\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', statement, re.IGNORECASE):
+                continue
+            planned += 1
+            for step in explain(planner, statement):
+                if not BAD_PLAN.match(step):
+                    continue
+                if any(method == name and allowed in step for method, allowed, _ in ALLOWED_PLANS):
+                    continue
+                problems.append({"method": name, "step": step, "statement": " ".join(statement.split())[:240]})
+        report.append(f"{name:<28} {planned:>3} statements {elapsed:>9.1f} ms")
+    planner.close()
+    return problems, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1_000_000, help='messages to seed (default 1M)')
+    parser.add_argument('--keep', action='store_true', help='keep the seeded database and print its path')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='codechat-plans-')
+    db = PlanRecordingDatabase(os.path.join(directory, 'plans.db'))
+    start = time.perf_counter()
+    conversations = seed(db, args.messages)
+    print(f"Seeded {args.messages} messages in {conversations} conversations "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    calls = exercise(db, conversations)
+    public = {name for name in dir(ConversationDatabase)
+              if not name.startswith('_') and callable(getattr(ConversationDatabase, name))}
+    unchecked = sorted(public - set(calls) - {'close', 'get_connection', 'start_backfills', 'start_maintenance'})
+
+    problems, report = check(db, calls)
+    print("\n".join(report))
+    db.close()
+
+    if unchecked:
+        print(f"\nNot exercised (add them to exercise()): {', '.join(unchecked)}")
+    for problem in problems:
+        print(f"\n{problem['method']}: {problem['step']}\n    {problem['statement']}")
+    if args.keep:
+        print(f"\nDatabase kept at {db.db_path}")
+    else:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+    if problems or unchecked:
+        print(f"\n{len(problems)} plan problem(s), {len(unchecked)} unchecked method(s)")
+        sys.exit(1)
+    print("\nAll query plans use indexes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+import math
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Candidates from BM25 that are re-ranked with embeddings when an embedder is configured
+RERANK_CANDIDATES = 50
+# Reciprocal rank fusion constant used to combine BM25 and embedding ranks
+RRF_K = 60
+MAX_QUERY_TERMS = 32
+
+_IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*|\d+')
+_CAMEL_PARTS = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+')
+_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how i if in into is it its me my no not of on or
+so that the then there these this to was what when where which who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased search terms: whole identifiers plus their camelCase/snake_case parts
+    """
+    terms = []
+    for word in _IDENTIFIER.findall(text):
+        lower = word.lower()
+        if len(lower) > 1 and lower not in _STOPWORDS:
+            terms.append(lower)
+        if '_' in word or not (word.islower() or word.isupper()):
+            for part in _CAMEL_PARTS.findall(word):
+                part = part.lower()
+                if len(part) > 1 and part != lower and part not in _STOPWORDS:
+                    terms.append(part)
+    return terms
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class RetrievalIndex:
+    """
+    BM25 index over workspace file chunks, stored in its own SQLite database
+
+    Files are split into overlapping line windows; each chunk's term frequencies
+    go into a postings table so a query only touches the postings of its own
+    terms. Indexing is incremental (files whose mtime and size are unchanged are
+    skipped) and runs on a background worker. When an embed callable is given,
+    chunk embeddings are stored too and used to re-rank the BM25 candidates.
+    """
+
+    def __init__(self, db_path: str, ignore_dirs: Set[str], binary_extensions: Set[str],
+                 image_extensions: Set[str], max_file_size: int = 1024 * 1024,
+                 chunk_lines: int = 40, chunk_overlap: int = 8, refresh_interval: float = 30.0,
+                 embed: Optional[Callable[[List[str]], List[List[float]]]] = None):
+        self.db_path = db_path
+        self.ignore_dirs = ignore_dirs
+        self.skip_extensions = set(binary_extensions) | set(image_extensions)
+        self.max_file_size = max_file_size
+        self.chunk_lines = max(1, chunk_lines)
+        self.chunk_overlap = min(max(0, chunk_overlap), self.chunk_lines - 1)
+        self.refresh_interval = refresh_interval
+        self.embed = embed
+        self._local = threading.local()
+        self._queue: 'queue.Queue[str]' = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._initialize()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute('PRAGMA foreign_keys = ON')
+            self._local.conn = conn
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _initialize(self):
+        with self._connect() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS workspaces (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    root TEXT NOT NULL UNIQUE,
+                    indexed_at REAL DEFAULT NULL
+                );
+                CREATE TABLE IF NOT EXISTS files (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    workspace_id INTEGER NOT NULL REFERENCES workspaces(id) ON DELETE CASCADE,
+                    path TEXT NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    UNIQUE (workspace_id, path)
+                );
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+                    start_line INTEGER NOT NULL,
+                    end_line INTEGER NOT NULL,
+                    content TEXT NOT NULL,
+                    length INTEGER NOT NULL,
+                    embedding BLOB DEFAULT NULL
+                );
+                CREATE TABLE IF NOT EXISTS postings (
+                    workspace_id INTEGER NOT NULL,
+                    term TEXT NOT NULL,
+                    chunk_id INTEGER NOT NULL REFERENCES chunks(id) ON DELETE CASCADE,
+                    tf INTEGER NOT NULL,
+                    PRIMARY KEY (workspace_id, term, chunk_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_chunks_file ON chunks(file_id);
+                CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(chunk_id);
+            ''')
+
+    # ----- background indexing -----
+
+    def schedule(self, root: str):
+        """
+        Queue an incremental (re)index of a workspace; cheap to call repeatedly
+        """
+        root = os.path.abspath(root)
+        with self._lock:
+            if root in self._pending:
+                return
+            self._pending.add(root)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="retrieval-indexer", daemon=True)
+                self._thread.start()
+        self._queue.put(root)
+
+    def _run(self):
+        while True:
+            root = self._queue.get()
+            try:
+                self.index_workspace(root)
+            except Exception as e:
+                logger.error(f"Indexing workspace {root} failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._pending.discard(root)
+                self._queue.task_done()
+
+    def invalidate(self, path: str):
+        """
+        Schedule a refresh of every indexed workspace that contains path
+        """
+        path = os.path.abspath(path)
+        with self._connect() as conn:
+            roots = [row['root'] for row in conn.execute('SELECT root FROM workspaces')]
+        for root in roots:
+            if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+                self.schedule(root)
+
+    def _walk(self, root: str) -> Iterator[os.DirEntry]:
+        stack = [root]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in self.ignore_dirs and not entry.name.startswith('.'):
+                            stack.append(entry.path)
+                    elif entry.is_file() and os.path.splitext(entry.name)[1].lower() not in self.skip_extensions:
+                        yield entry
+                except OSError:
+                    continue
+
+    def _chunk(self, content: str) -> List[Tuple[int, int, str]]:
+        lines = content.split('\n')
+        step = self.chunk_lines - self.chunk_overlap
+        chunks = []
+        for start in range(0, len(lines), step):
+            window = lines[start:start + self.chunk_lines]
+            text = '\n'.join(window).rstrip()
+            if text.strip():
+                chunks.append((start + 1, start + len(window), text))
+            if start + self.chunk_lines >= len(lines):
+                break
+        return chunks
+
+    def index_workspace(self, root: str) -> Dict[str, int]:
+        """
+        Bring a workspace's index up to date, re-chunking only new or changed files
+
+        :return: Counts of indexed, unchanged, and removed files
+        """
+        root = os.path.abspath(root)
+        with self._connect() as conn:
+            conn.execute('INSERT OR IGNORE INTO workspaces (root) VALUES (?)', (root,))
+            workspace_id = conn.execute('SELECT id FROM workspaces WHERE root = ?', (root,)).fetchone()['id']
+            known = {row['path']: (row['id'], row['mtime_ns'], row['size']) for row in conn.execute(
+                'SELECT id, path, mtime_ns, size FROM files WHERE workspace_id = ?', (workspace_id,))}
+
+        stats = {"indexed": 0, "unchanged": 0, "removed": 0}
+        seen = set()
+        for entry in self._walk(root):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if stat.st_size > self.max_file_size:
+                continue
+            seen.add(entry.path)
+            previous = known.get(entry.path)
+            if previous and previous[1] == stat.st_mtime_ns and previous[2] == stat.st_size:
+                stats["unchanged"] += 1
+                continue
+            try:
+                with open(entry.path, encoding='utf-8', errors='strict') as f:
+                    content = f.read()
+            except (OSError, UnicodeDecodeError):
+                continue
+            self._index_file(workspace_id, root, entry.path, stat.st_mtime_ns, stat.st_size, content)
+            stats["indexed"] += 1
+
+        removed = [file_id for path, (file_id, _, _) in known.items() if path not in seen]
+        with self._connect() as conn:
+            conn.executemany('DELETE FROM files WHERE id = ?', [(file_id,) for file_id in removed])
+            conn.execute('UPDATE workspaces SET indexed_at = ? WHERE id = ?', (time.time(), workspace_id))
+        stats["removed"] = len(removed)
+        if stats["indexed"] or stats["removed"]:
+            logger.info(f"Indexed workspace {root}: {stats}")
+        return stats
+
+    def _index_file(self, workspace_id: int, root: str, path: str, mtime_ns: int, size: int, content: str):
+        chunks = self._chunk(content)
+        embeddings = self._embed_chunks([text for _, _, text in chunks])
+        with self._connect() as conn:
+            conn.execute('DELETE FROM files WHERE workspace_id = ? AND path = ?', (workspace_id, path))
+            file_id = conn.execute(
+                'INSERT INTO files (workspace_id, path, mtime_ns, size) VALUES (?, ?, ?, ?)',
+                (workspace_id, path, mtime_ns, size)
+            ).lastrowid
+            # Path components are searchable too ("the retrieval module")
+            path_terms = tokenize(os.path.relpath(path, root))
+            for (start, end, text), embedding in zip(chunks, embeddings):
+                terms = Counter(tokenize(text))
+                terms.update(path_terms)
+                chunk_id = conn.execute(
+                    'INSERT INTO chunks (file_id, start_line, end_line, content, length, embedding) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (file_id, start, end, text, sum(terms.values()) or 1,
+                     array('f', embedding).tobytes() if embedding else None)
+                ).lastrowid
+                conn.executemany(
+                    'INSERT INTO postings (workspace_id, term, chunk_id, tf) VALUES (?, ?, ?, ?)',
+                    [(workspace_id, term, chunk_id, tf) for term, tf in terms.items()]
+                )
+
+    def _embed_chunks(self, texts: List[str]) -> List[Optional[List[float]]]:
+        if not self.embed or not texts:
+            return [None] * len(texts)
+        try:
+            return self.embed(texts)
+        except Exception as e:
+            logger.warning(f"Embedding chunks failed, indexing without embeddings: {str(e)}")
+            return [None] * len(texts)
+
+    # ----- querying -----
+
+    def search(self, root: str, query: str, k: int = 5,
+               exclude_paths: Set[str] = frozenset()) -> List[Dict]:
+        """
+        Top-k chunks of a workspace for a query
+
+        An unindexed workspace returns nothing and is queued for indexing; a stale
+        one is answered from the current index and refreshed in the background.
+
+        :param exclude_paths: Files whose chunks are skipped (e.g. already in context)
+        """
+        root = os.path.abspath(root)
+        terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+        with self._connect() as conn:
+            workspace = conn.execute('SELECT id, indexed_at FROM workspaces WHERE root = ?', (root,)).fetchone()
+            if workspace is None or workspace['indexed_at'] is None:
+                self.schedule(root)
+                return []
+            if time.time() - workspace['indexed_at'] > self.refresh_interval:
+                self.schedule(root)
+            if not terms or k <= 0:
+                return []
+
+            workspace_id = workspace['id']
+            totals = conn.execute('''
+                SELECT COUNT(*) AS n, AVG(c.length) AS avg_length
+                FROM chunks c JOIN files f ON f.id = c.file_id
+                WHERE f.workspace_id = ?
+            ''', (workspace_id,)).fetchone()
+            if not totals['n']:
+                return []
+            placeholders = ','.join('?' * len(terms))
+            rows = conn.execute(f'''
+                SELECT p.term, p.chunk_id, p.tf, c.length
+                FROM postings p JOIN chunks c ON c.id = p.chunk_id
+                WHERE p.workspace_id = ? AND p.term IN ({placeholders})
+            ''', (workspace_id, *terms)).fetchall()
+
+            scores = self._bm25(rows, totals['n'], totals['avg_length'])
+            ranked = sorted(scores, key=scores.get, reverse=True)
+            candidates = ranked[:max(k * 4, RERANK_CANDIDATES if self.embed else 0)]
+            if not candidates:
+                return []
+            chunk_rows = {row['id']: row for row in conn.execute(f'''
+                SELECT c.id, c.start_line, c.end_line, c.content, c.embedding, f.path
+                FROM chunks c JOIN files f ON f.id = c.file_id
+                WHERE c.id IN ({','.join('?' * len(candidates))})
+            ''', candidates)}
+
+        candidates = [cid for cid in candidates if chunk_rows[cid]['path'] not in exclude_paths]
+        if self.embed:
+            candidates = self._rerank(query, candidates, chunk_rows)
+        return [{
+            "path": chunk_rows[cid]['path'],
+            "start_line": chunk_rows[cid]['start_line'],
+            "end_line": chunk_rows[cid]['end_line'],
+            "content": chunk_rows[cid]['content'],
+            "score": round(scores[cid], 4)
+        } for cid in candidates[:k]]
+
+    @staticmethod
+    def _bm25(rows: List[sqlite3.Row], n: int, avg_length: float) -> Dict[int, float]:
+        df = Counter(row['term'] for row in rows)
+        scores: Dict[int, float] = {}
+        for row in rows:
+            idf = math.log(1 + (n - df[row['term']] + 0.5) / (df[row['term']] + 0.5))
+            tf = row['tf']
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * row['length'] / avg_length)
+            scores[row['chunk_id']] = scores.get(row['chunk_id'], 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        return scores
+
+    def _rerank(self, query: str, candidates: List[int], chunk_rows: Dict[int, sqlite3.Row]) -> List[int]:
+        try:
+            query_embedding = self.embed([query])[0]
+        except Exception as e:
+            logger.warning(f"Embedding query failed, using BM25 order: {str(e)}")
+            return candidates
+        similarity = {}
+        for cid in candidates:
+            blob = chunk_rows[cid]['embedding']
+            if blob:
+                similarity[cid] = _cosine(query_embedding, array('f', blob))
+        if not similarity:
+            return candidates
+        by_similarity = sorted(similarity, key=similarity.get, reverse=True)
+        fused = {cid: 1 / (RRF_K + rank) for rank, cid in enumerate(candidates)}
+        for rank, cid in enumerate(by_similarity):
+            fused[cid] += 1 / (RRF_K + rank)
+        return sorted(candidates, key=fused.get, reverse=True)
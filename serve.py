@@ -0,0 +1,49 @@
+"""
+Production launcher: python serve.py
+
+Serves the app without the debugger or reloader. Chat requests spend most of
+their time waiting on Ollama, so they are served from a large thread pool:
+threads waiting on the network release the GIL, and a slow completion only
+occupies its own thread. Uses waitress when installed, otherwise Werkzeug's
+threaded server.
+"""
+import os
+
+try:
+    from waitress import serve
+except ImportError:  # waitress is optional; fall back to Werkzeug's threaded server
+    serve = None
+
+from werkzeug.serving import run_simple
+
+from app import app, initialize_server
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 5000))
+# Each streaming chat holds a thread for its whole response
+SERVER_THREADS = int(os.getenv("SERVER_THREADS", 64))
+SERVER_CONNECTION_LIMIT = int(os.getenv("SERVER_CONNECTION_LIMIT", 256))
+# Seconds an idle client connection is kept open
+SERVER_CHANNEL_TIMEOUT = int(os.getenv("SERVER_CHANNEL_TIMEOUT", 300))
+
+
+def main():
+    initialize_server()
+    if serve is not None:
+        print(f"Serving on http://{HOST}:{PORT} with waitress ({SERVER_THREADS} threads)")
+        serve(
+            app,
+            host=HOST,
+            port=PORT,
+            threads=SERVER_THREADS,
+            connection_limit=SERVER_CONNECTION_LIMIT,
+            channel_timeout=SERVER_CHANNEL_TIMEOUT,
+            ident="codechat"
+        )
+    else:
+        print(f"waitress is not installed; serving on http://{HOST}:{PORT} with Werkzeug's threaded server")
+        run_simple(HOST, PORT, app, threaded=True, use_reloader=False, use_debugger=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,11 @@ const sidebar = document.getElementById('sidebar');
 const toggleSidebarBtn = document.getElementById('toggle-sidebar');
 const newConversationBtn = document.getElementById('new-conversation-btn');
 const conversationList = document.getElementById('conversation-list');
+const conversationSearchInput = document.getElementById('conversation-search-input');
+const searchResults = document.getElementById('search-results');
 const currentConversationIdInput = document.getElementById('current-conversation-id');
 const processingOverlay = document.getElementById('processing-overlay');
+const processingStatus = document.getElementById('processing-status');
 const codeArtifactTemplate = document.getElementById('code-artifact-template');
 const contextWindowTemplate = document.getElementById('context-window-template');
 const confirmDialogTemplate = document.getElementById('confirm-dialog-template');
@@ -310,7 +313,9 @@ async function loadFileTree(dirPath) {
     currentFileTreePath = dirPath;
 
     try {
-        const resp = await fetch(`/browse?path=${encodeURIComponent(dirPath)}`);
+        const params = new URLSearchParams({ path: dirPath });
+        if (currentWorkspacePath) params.append('workspace', currentWorkspacePath);
+        const resp = await fetch(`/browse?${params}`);
         const data = await resp.json();
         if (data.error) {
             showToast(data.error, 'error');
@@ -361,11 +366,13 @@ async function loadFileTree(dirPath) {
                 e.preventDefault();
                 if (item.is_dir) {
                     showFileTreeContextMenu(e, [
-                        { label: 'Add folder to context', icon: 'fa-folder-plus', action: () => addFolderToContext(item.path) }
+                        { label: 'Add folder to context', icon: 'fa-folder-plus', action: () => addFolderToContext(item.path) },
+                        { label: 'Add folder to context (outline large files)', icon: 'fa-list', action: () => addFolderToContext(item.path, { compression: 'auto' }) }
                     ]);
                 } else if (!item.is_binary) {
                     showFileTreeContextMenu(e, [
-                        { label: 'Add to context', icon: 'fa-plus-circle', action: () => addFileToContext(item.path) }
+                        { label: 'Add to context', icon: 'fa-plus-circle', action: () => addFileToContext(item.path) },
+                        { label: 'Add outline to context…', icon: 'fa-list', action: () => addFileOutlineToContext(item.path) }
                     ]);
                 }
             });
@@ -488,7 +495,7 @@ function showFileTreeContextMenu(event, items) {
 }
 
 // ─── Context Management ──────────────────────────────────────────────────────
-async function addFolderToContext(folderPath) {
+async function addFolderToContext(folderPath, options = {}) {
     const convId = currentConversationIdInput.value;
     if (!convId) { showToast('Create a conversation first', 'warning'); return; }
 
@@ -497,21 +504,58 @@ async function addFolderToContext(folderPath) {
         const resp = await fetch('/add-folder-context', {
             method: 'POST',
             headers: { 'Content-Type': 'application/x-www-form-urlencoded' },
-            body: new URLSearchParams({ conversation_id: convId, folder_path: folderPath })
+            body: new URLSearchParams({ conversation_id: convId, folder_path: folderPath, stream: '1', ...options })
         });
-        const data = await resp.json();
-        if (data.error) {
-            showToast(data.error, 'error');
-        } else {
-            showToast(`${data.message} (${data.skipped_count} skipped)`, 'success', 4000);
-            loadContextFiles();
+        if (!resp.ok || !resp.body) {
+            const data = await resp.json();
+            showToast(data.error || 'Failed to add folder', 'error');
+            return;
         }
+
+        const reader = resp.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = '';
+        let lastToast = 0;
+        const handleEvent = (evt) => {
+            if (evt.type === 'progress' && evt.phase === 'reading' && evt.total) {
+                const now = Date.now();
+                if (now - lastToast > 1000 || evt.processed === evt.total) {
+                    lastToast = now;
+                    showToast(`Reading files ${evt.processed}/${evt.total}...`, 'info', 1500);
+                }
+            } else if (evt.type === 'done') {
+                showToast(`${evt.message} (${evt.skipped_count} skipped)`, 'success', 4000);
+                (evt.failed || []).forEach(f => console.warn(`Skipped ${f.file}: ${f.error}`));
+                loadContextFiles();
+            } else if (evt.type === 'error') {
+                showToast(evt.error, 'error');
+            }
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffered += decoder.decode(value, { stream: true });
+            let newline;
+            while ((newline = buffered.indexOf('\n')) >= 0) {
+                const line = buffered.slice(0, newline).trim();
+                buffered = buffered.slice(newline + 1);
+                if (line) handleEvent(JSON.parse(line));
+            }
+        }
+        if (buffered.trim()) handleEvent(JSON.parse(buffered));
     } catch (e) {
         showToast('Failed to add folder', 'error');
     }
 }
 
-async function addFileToContext(filePath) {
+function addFileOutlineToContext(filePath) {
+    const focus = prompt('Keep the full source of these symbols (comma-separated, optional):', '');
+    if (focus === null) return;
+    addFileToContext(filePath, { compression: 'outline', focus });
+}
+
+async function addFileToContext(filePath, options = {}) {
     const convId = currentConversationIdInput.value;
     if (!convId) {
         showToast('Create a conversation first', 'warning');
@@ -522,7 +566,7 @@ async function addFileToContext(filePath) {
         const resp = await fetch('/add-file-context', {
             method: 'POST',
             headers: { 'Content-Type': 'application/x-www-form-urlencoded' },
-            body: new URLSearchParams({ conversation_id: convId, file_path: filePath })
+            body: new URLSearchParams({ conversation_id: convId, file_path: filePath, ...options })
         });
         const data = await resp.json();
         if (data.error) {
@@ -558,18 +602,29 @@ async function removeFileFromContext(filePath) {
     }
 }
 
+// ETag of the context list currently rendered, so unchanged lists aren't re-downloaded
+let contextListState = { convId: null, etag: null };
+
 async function loadContextFiles() {
     const convId = currentConversationIdInput.value;
     const container = document.getElementById('context-file-list');
 
     if (!convId) {
+        contextListState = { convId: null, etag: null };
         container.innerHTML = '<div class="context-empty"><i class="fas fa-layer-group"></i><p>No active conversation</p></div>';
         return;
     }
 
     try {
-        const resp = await fetch(`/load-conversation/${convId}`);
+        const headers = {};
+        if (contextListState.convId === convId && contextListState.etag) {
+            headers['If-None-Match'] = contextListState.etag;
+        }
+        const resp = await fetch(`/list-contexts/${convId}`, { headers, cache: 'no-store' });
+        if (resp.status === 304 || currentConversationIdInput.value !== convId) return;
         const data = await resp.json();
+        if (data.error) throw new Error(data.error);
+        contextListState = { convId, etag: resp.headers.get('ETag') };
 
         if (!data.contexts || data.contexts.length === 0) {
             container.innerHTML = '<div class="context-empty"><i class="fas fa-layer-group"></i><p>No files in context</p><small>Right-click files in the Files tab to add</small></div>';
@@ -585,6 +640,7 @@ async function loadContextFiles() {
                 <div class="context-file-info">
                     <i class="fas fa-file-code"></i>
                     <span class="context-file-name" title="${ctx.file_path}">${name}</span>
+                    <small class="context-file-tokens" title="${ctx.compression || 'minify'}">${ctx.token_count.toLocaleString()} tok</small>
                 </div>
                 <button class="icon-btn small remove-ctx-btn" title="Remove from context">
                     <i class="fas fa-times"></i>
@@ -816,7 +872,17 @@ function createMessageElement(message) {
     const ts = document.createElement('span');
     ts.className = 'message-timestamp';
     ts.textContent = message.formatted_time || formatTimestamp(message.timestamp);
+    if (message.timing) ts.title = describeTiming(message.timing);
     metaEl.appendChild(ts);
+    (message.artifacts || []).forEach(artifact => {
+        const chip = document.createElement('button');
+        chip.className = 'artifact-chip';
+        chip.title = `Open code artifact (${artifact.size} chars)`;
+        chip.innerHTML = '<i class="fas fa-code"></i> ';
+        chip.appendChild(document.createTextNode(artifact.language));
+        chip.addEventListener('click', () => openArtifact(artifact.id));
+        metaEl.appendChild(chip);
+    });
 
     body.appendChild(contentEl);
     body.appendChild(metaEl);
@@ -862,6 +928,74 @@ function showConfirmDialog(title, message, onConfirm) {
 // ─── Conversation Handlers ───────────────────────────────────────────────────
 function initializeConversationHandlers() {
     conversationList.addEventListener('click', handleConversationClick);
+    getConversationContainer().addEventListener('scroll', (e) => {
+        if (e.target.scrollTop < 200) loadOlderMessages();
+    });
+
+    let searchTimer = null;
+    conversationSearchInput.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => searchConversations(conversationSearchInput.value.trim()), 200);
+    });
+    conversationSearchInput.addEventListener('keydown', (e) => {
+        if (e.key === 'Escape') {
+            conversationSearchInput.value = '';
+            searchConversations('');
+        }
+    });
+    searchResults.addEventListener('click', async (e) => {
+        const result = e.target.closest('.search-result');
+        if (!result) return;
+        await loadConversation(result.dataset.convId);
+        const item = conversationList.querySelector(`.conversation-item[data-conv-id="${result.dataset.convId}"]`);
+        if (item && item.dataset.workspace) setWorkspace(item.dataset.workspace);
+    });
+}
+
+const SEARCH_RESULT_KINDS = { conversation: 'Chat', message: 'Message', artifact: 'Code' };
+
+async function searchConversations(query) {
+    if (!query) {
+        searchResults.style.display = 'none';
+        searchResults.innerHTML = '';
+        conversationList.style.display = '';
+        return;
+    }
+    try {
+        const resp = await fetch(`/search?${new URLSearchParams({ q: query })}`);
+        const data = await resp.json();
+        if (conversationSearchInput.value.trim() !== query) return;  // a newer search is pending
+        if (data.error) { showToast(data.error, 'error'); return; }
+
+        searchResults.innerHTML = '';
+        data.results.forEach(result => {
+            const el = document.createElement('div');
+            el.className = 'search-result';
+            el.dataset.convId = result.conversation_id;
+
+            const title = document.createElement('div');
+            title.className = 'search-result-title';
+            const kind = document.createElement('span');
+            kind.className = 'search-result-kind';
+            kind.textContent = result.type === 'message' ? result.role : SEARCH_RESULT_KINDS[result.type];
+            title.appendChild(kind);
+            title.appendChild(document.createTextNode(result.conversation_name));
+            el.appendChild(title);
+
+            const snippet = document.createElement('div');
+            snippet.className = 'search-result-snippet';
+            snippet.innerHTML = result.snippet_html;  // escaped server-side, only <mark> tags added
+            el.appendChild(snippet);
+            searchResults.appendChild(el);
+        });
+        if (data.results.length === 0) {
+            searchResults.innerHTML = '<div class="search-results-empty">No matches</div>';
+        }
+        conversationList.style.display = 'none';
+        searchResults.style.display = '';
+    } catch (e) {
+        showToast('Search failed', 'error');
+    }
 }
 
 async function handleConversationClick(event) {
@@ -950,6 +1084,10 @@ function detectLanguage(filePath) {
     return map[ext] || 'plaintext';
 }
 
+// Cursor for the next (older) page of the open conversation; null when fully loaded
+let olderMessagesCursor = null;
+let loadingOlderMessages = false;
+
 async function loadConversation(conversationId) {
     try {
         const resp = await fetch(`/load-conversation/${conversationId}`);
@@ -962,6 +1100,7 @@ async function loadConversation(conversationId) {
         data.messages.forEach(message => {
             container.appendChild(createMessageElement(message));
         });
+        olderMessagesCursor = data.has_more ? data.next_before : null;
 
         if (data.tokens) {
             updateTokenCounters({
@@ -983,6 +1122,41 @@ async function loadConversation(conversationId) {
     }
 }
 
+// Prepends the next page of older messages, keeping the visible messages in place
+async function loadOlderMessages() {
+    const convId = currentConversationIdInput.value;
+    if (!convId || olderMessagesCursor === null || loadingOlderMessages) return;
+    loadingOlderMessages = true;
+    try {
+        const resp = await fetch(`/load-messages/${convId}?before=${olderMessagesCursor}`);
+        const data = await resp.json();
+        if (currentConversationIdInput.value !== convId || data.error) return;
+
+        const container = getConversationContainer();
+        const previousHeight = container.scrollHeight;
+        const fragment = document.createDocumentFragment();
+        data.messages.forEach(message => fragment.appendChild(createMessageElement(message)));
+        container.insertBefore(fragment, container.firstChild);
+        container.scrollTop += container.scrollHeight - previousHeight;
+        olderMessagesCursor = data.has_more ? data.next_before : null;
+    } catch (e) {
+        console.error('Failed to load older messages:', e);
+    } finally {
+        loadingOlderMessages = false;
+    }
+}
+
+async function openArtifact(artifactId) {
+    try {
+        const resp = await fetch(`/artifact/${artifactId}`);
+        const artifact = await resp.json();
+        if (artifact.error) { showToast(artifact.error, 'error'); return; }
+        createContextWindow(artifact.content, artifact.language, `Artifact (${artifact.language})`);
+    } catch (e) {
+        showToast('Failed to load artifact', 'error');
+    }
+}
+
 // ─── Form Submission ─────────────────────────────────────────────────────────
 async function handleFormSubmit(event) {
     event.preventDefault();
@@ -990,6 +1164,7 @@ async function handleFormSubmit(event) {
     const prompt = formData.get('prompt');
     if (!prompt.trim()) return;
 
+    processingStatus.textContent = 'Agent is thinking...';
     processingOverlay.classList.add('active');
 
     try {
@@ -1017,21 +1192,14 @@ async function handleFormSubmit(event) {
 
         formData.set('conversation_id', currentConversationIdInput.value);
 
-        const resp = await fetch('/process', { method: 'POST', body: formData });
-        if (!resp.ok) throw new Error('Failed to process request');
-
-        const data = await resp.json();
         const container = getConversationContainer();
-
         container.appendChild(createMessageElement({
             role: 'user', content: prompt,
             formatted_time: new Date().toLocaleTimeString()
         }));
+        container.scrollTop = container.scrollHeight;
 
-        container.appendChild(createMessageElement({
-            role: 'assistant', content: data.response,
-            formatted_time: data.timestamp
-        }));
+        const data = await streamProcessRequest(formData, container);
 
         if (data.artifacts && data.artifacts.length > 0) {
             data.artifacts.forEach((artifact, index) => {
@@ -1058,6 +1226,96 @@ async function handleFormSubmit(event) {
     }
 }
 
+// Tooltip for a response's latency breakdown; prompt eval drops when the
+// model reuses the cached prompt prefix from the previous turn
+function describeTiming(timing) {
+    const parts = [];
+    if (timing.queue_ms) parts.push(`queued ${timing.queue_ms} ms`);
+    if (timing.prompt_eval_ms != null) parts.push(`prompt eval ${timing.prompt_eval_ms} ms`);
+    if (timing.generation_ms != null) parts.push(`generation ${timing.generation_ms} ms`);
+    if (timing.tokens_per_second) parts.push(`${timing.tokens_per_second} tok/s`);
+    if (timing.prompt_tokens) {
+        parts.push(`cached prefix ${Math.round(timing.prefix_reuse * 100)}% of ~${timing.prompt_tokens} prompt tokens`);
+    }
+    return parts.join(' · ');
+}
+
+// Reads the NDJSON event stream from /process-stream, rendering answer deltas
+// into a live assistant message. Resolves with the final "done" payload.
+async function streamProcessRequest(formData, container) {
+    const resp = await fetch('/process-stream', { method: 'POST', body: formData });
+    if (!resp.ok || !resp.body) {
+        let message = 'Failed to process request';
+        try { message = (await resp.json()).error || message; } catch (e) { /* not JSON */ }
+        throw new Error(message);
+    }
+
+    const reader = resp.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    let text = '';
+    let liveEl = null;
+    let renderPending = false;
+    let result = null;
+
+    const render = () => {
+        renderPending = false;
+        liveEl.querySelector('.message-content').innerHTML = formatMessageContent(text);
+        container.scrollTop = container.scrollHeight;
+    };
+
+    const handleEvent = (evt) => {
+        if (evt.type === 'delta') {
+            if (!liveEl) {
+                processingOverlay.classList.remove('active');
+                liveEl = createMessageElement({ role: 'assistant', content: '', formatted_time: '' });
+                container.appendChild(liveEl);
+            }
+            text += evt.content;
+            if (!renderPending) {
+                renderPending = true;
+                requestAnimationFrame(render);
+            }
+        } else if (evt.type === 'queued') {
+            // The model is busy with other chats; the server reports our place in line
+            processingStatus.textContent = evt.position > 1
+                ? `Waiting for the model (${evt.position - 1} ahead in queue)...`
+                : 'Waiting for the model (next in queue)...';
+        } else if (evt.type === 'done') {
+            result = evt;
+        } else if (evt.type === 'error') {
+            throw new Error(evt.error);
+        }
+    };
+
+    try {
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffered += decoder.decode(value, { stream: true });
+            let newline;
+            while ((newline = buffered.indexOf('\n')) >= 0) {
+                const line = buffered.slice(0, newline).trim();
+                buffered = buffered.slice(newline + 1);
+                if (line) handleEvent(JSON.parse(line));
+            }
+        }
+        if (buffered.trim()) handleEvent(JSON.parse(buffered));
+    } finally {
+        if (liveEl) liveEl.remove();
+    }
+
+    if (!result) throw new Error('Response stream ended unexpectedly');
+
+    // Re-render the final message so inline code buttons get wired up
+    container.appendChild(createMessageElement({
+        role: 'assistant', content: result.response,
+        formatted_time: result.timestamp,
+        timing: result.metadata && result.metadata.timing
+    }));
+    return result;
+}
+
 // ─── Token Counters ──────────────────────────────────────────────────────────
 function updateTokenCounters(tokens) {
     if (tokens) {
@@ -1098,6 +1356,7 @@ function createConversationListItem(data) {
 }
 
 function showWelcomeScreen() {
+    olderMessagesCursor = null;
     const container = getConversationContainer();
     container.innerHTML = `
         <div class="welcome-screen">
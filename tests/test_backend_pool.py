@@ -0,0 +1,128 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from openai import OpenAI, APIConnectionError, InternalServerError
+
+from backend_pool import BackendPool, BackendsUnavailable
+
+
+class StubBackend:
+    """
+    An OpenAI-compatible server on localhost that answers chats with its own name
+    """
+
+    def __init__(self, name: str, port: int = 0):
+        self.name = name
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body):
+                encoded = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def do_GET(self):
+                self._send({"object": "list", "data": [
+                    {"id": "stub", "object": "model", "created": 0, "owned_by": stub.name}
+                ]})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.requests += 1
+                self._send({
+                    "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": "stub",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": stub.name}}]
+                })
+
+        self.server = HTTPServer(("127.0.0.1", port), Handler)
+        self.port = self.server.server_port
+        self.url = f"http://127.0.0.1:{self.port}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_client(url: str) -> OpenAI:
+    return OpenAI(base_url=url, api_key="stub", timeout=5, max_retries=0)
+
+
+def chat(client) -> str:
+    response = client.chat.completions.create(model="stub", messages=[{"role": "user", "content": "hi"}])
+    return response.choices[0].message.content
+
+
+class BackendPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stubs = [StubBackend("a"), StubBackend("b")]
+        self.warmed = []
+        self.pool = BackendPool([stub.url for stub in self.stubs], make_client,
+                                failure_types=(APIConnectionError, InternalServerError),
+                                failure_threshold=2, health_interval=0, warm=self.warmed.append)
+
+    def tearDown(self):
+        for stub in self.stubs:
+            if stub.server.socket.fileno() != -1:
+                stub.stop()
+
+    def test_conversation_sticks_to_its_backend(self):
+        first = {key: self.pool.run(key, chat) for key in ("1", "2")}
+        self.assertEqual(set(first.values()), {"a", "b"})
+        for _ in range(3):
+            for key, name in first.items():
+                self.assertEqual(self.pool.run(key, chat), name)
+
+    def test_fails_over_and_evicts_a_stopped_backend(self):
+        owner = self.pool.run("1", chat)
+        down, up = (self.stubs[0], self.stubs[1]) if owner == "a" else (self.stubs[1], self.stubs[0])
+        down.stop()
+
+        self.assertEqual(self.pool.run("1", chat), up.name)
+        backends = {backend.url: backend for backend in self.pool.backends}
+        for _ in range(10):
+            if not backends[down.url].healthy:
+                break
+            # Unbound requests rotate over both backends, so the stopped one keeps failing
+            self.assertEqual(self.pool.run(None, chat), up.name)
+        self.assertFalse(backends[down.url].healthy)
+        self.assertTrue(backends[up.url].healthy)
+        # An evicted backend gets no traffic while a healthy one is left
+        self.assertEqual({self.pool.run(key, chat) for key in ("4", "5", "6")}, {up.name})
+
+    def test_reports_every_backend_that_failed(self):
+        for stub in self.stubs:
+            stub.stop()
+        with self.assertRaises(BackendsUnavailable) as raised:
+            self.pool.run("1", chat)
+        self.assertEqual(set(raised.exception.urls), {stub.url for stub in self.stubs})
+        self.assertIsInstance(raised.exception.__cause__, APIConnectionError)
+
+    def test_health_check_reinstates_a_recovered_backend(self):
+        stub = self.stubs[0]
+        stub.stop()
+        backend = next(b for b in self.pool.backends if b.url == stub.url)
+        self.pool.check_all()
+        self.pool.check_all()
+        self.assertFalse(backend.healthy)
+
+        self.stubs[0] = StubBackend("a", stub.port)
+        self.pool.check_all()
+        self.assertTrue(backend.healthy)
+        self.assertEqual(self.warmed, [backend])
+        self.assertEqual({self.pool.run(key, chat) for key in ("1", "2")}, {"a", "b"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from database import ConversationDatabase, content_hash
+
+
+class PurgeUnreferencedBlobsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = ConversationDatabase(os.path.join(self.directory.name, 'conversations.db'))
+        self.conversation_id = self.db.create_conversation('purge')
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def add_file(self, path: str, source: str, compressed: str) -> str:
+        source_hash = content_hash(source)
+        self.db.put_derived_content(source_hash, 'minify:python', compressed)
+        # An outline nobody is using: its blob is only referenced by the cache
+        self.db.put_derived_content(source_hash, 'outline:python:', f'outline of {path}')
+        self.db.add_project_context(self.conversation_id, path, compressed, source_hash=source_hash)
+        return source_hash
+
+    def cached(self, table: str, column: str, value: str) -> bool:
+        with sqlite3.connect(self.db.db_path) as conn:
+            return conn.execute(f'SELECT 1 FROM {table} WHERE {column} = ?', (value,)).fetchone() is not None
+
+    def test_compact_removes_transforms_of_sources_no_longer_in_context(self):
+        removed = self.add_file('/src/old.py', 'def old():\n    pass\n', 'def old():pass')
+        kept = self.add_file('/src/kept.py', 'def kept():\n    pass\n', 'def kept():pass')
+        self.db.remove_project_context(self.conversation_id, '/src/old.py')
+
+        self.db.compact(retention_days=0, pause=0)
+
+        self.assertFalse(self.cached('derived_blobs', 'source_hash', removed))
+        self.assertFalse(self.cached('blobs', 'hash', content_hash('def old():pass')))
+        self.assertFalse(self.cached('blobs', 'hash', content_hash('outline of /src/old.py')))
+        self.assertTrue(self.cached('blobs', 'hash', content_hash('def kept():pass')))
+        self.assertEqual(self.db.get_derived_content(kept, 'minify:python'), 'def kept():pass')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+from minifier import minify
+
+
+class JavaScriptRegexLiteralTest(unittest.TestCase):
+
+    def test_comment_marker_inside_regex_literal(self):
+        source = "const trimmed = url.replace(/\\/*$/, '');\nfoo();\n/* real comment */\nbar();\n"
+        self.assertEqual(minify(source, 'javascript'),
+                         "const trimmed = url.replace(/\\/*$/, '');\nfoo();\nbar();")
+
+    def test_regex_literal_after_keyword_and_in_class(self):
+        source = "if (/\\/\\//.test(s)) {\n    return /[/*]/g; // slashes\n}\n"
+        self.assertEqual(minify(source, 'javascript'),
+                         "if (/\\/\\//.test(s)) {\nreturn /[/*]/g;\n}")
+
+    def test_division_is_not_a_regex_literal(self):
+        source = "const y = (a + b) / 2; // half\nz = c[1] / d /* x */;\n"
+        self.assertEqual(minify(source, 'javascript'), "const y = (a + b) / 2;\nz = c[1] / d ;")
+
+    def test_ambiguous_slash_leaves_source_untouched(self):
+        source = "function f() {}\n/ab c/.test(s) // x\n"
+        self.assertEqual(minify(source, 'javascript'), source)
+
+    def test_unambiguous_slash_after_brace_is_minified(self):
+        source = "function f() {}\n/abc/.test(s) // x\n"
+        self.assertEqual(minify(source, 'javascript'), "function f() {}\n/abc/.test(s)")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,319 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+import logging
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # watchdog is optional; fall back to mtime polling
+    Observer = None
+    FileSystemEventHandler = object
+
+logger = logging.getLogger(__name__)
+
+
+class _DirectoryListing:
+    """
+    Cached entries of a single directory plus the directory mtime they were read at
+    """
+    __slots__ = ('entries', 'dir_mtime_ns', 'checked_at', 'error')
+
+    def __init__(self, entries: List[Dict], dir_mtime_ns: int, error: Optional[str] = None):
+        self.entries = entries
+        self.dir_mtime_ns = dir_mtime_ns
+        self.checked_at = time.monotonic()
+        self.error = error
+
+
+class _InvalidationHandler(FileSystemEventHandler):
+    """
+    Watchdog handler that drops cached listings touched by filesystem events
+    """
+
+    RELEVANT_EVENTS = {'created', 'deleted', 'moved', 'modified'}
+
+    def __init__(self, index: 'WorkspaceIndex'):
+        self.index = index
+
+    def on_any_event(self, event):
+        if event.event_type not in self.RELEVANT_EVENTS:
+            return
+        paths = [getattr(event, 'src_path', None), getattr(event, 'dest_path', None)]
+        for path in paths:
+            if path:
+                self.index.invalidate(os.path.dirname(os.fsdecode(path)))
+                if event.is_directory:
+                    self.index.invalidate(os.fsdecode(path))
+        # Watches are per directory, so follow directories as they come and go
+        if event.is_directory and event.event_type in ('created', 'moved', 'deleted'):
+            if event.event_type != 'created':
+                self.index.unwatch_tree(os.fsdecode(event.src_path))
+            if event.event_type != 'deleted':
+                self.index.watch_tree(os.fsdecode(getattr(event, 'dest_path', None) or event.src_path))
+
+
+class WorkspaceIndex:
+    """
+    In-memory index of a workspace's directory listings
+
+    Directories are scanned lazily the first time they are listed and then served
+    from memory. When watchdog is installed an inotify/FSEvents/ReadDirectoryChanges
+    watcher invalidates listings as files change; otherwise each listing is
+    revalidated with a single directory stat at most every poll_interval seconds.
+    The watcher only covers directories the index can list: each one gets its own
+    non-recursive watch, so ignored trees such as node_modules or .git don't use
+    up the system's watch limit.
+    """
+
+    def __init__(self, root: str, ignore_dirs: Set[str], binary_extensions: Set[str],
+                 image_extensions: Set[str], poll_interval: float = 2.0,
+                 use_watcher: bool = True):
+        self.root = os.path.abspath(root)
+        self.ignore_dirs = ignore_dirs
+        self.binary_extensions = binary_extensions
+        self.image_extensions = image_extensions
+        self.poll_interval = poll_interval
+        self.generation = 0
+        self._listings: Dict[str, _DirectoryListing] = {}
+        self._tree_cache: Dict[tuple, tuple] = {}
+        self._lock = threading.RLock()
+        self._observer = None
+        self._handler = None
+        self._watches: Dict[str, object] = {}
+        if use_watcher and Observer is not None:
+            self._start_watcher()
+
+    @property
+    def is_watched(self) -> bool:
+        return self._observer is not None
+
+    def _start_watcher(self):
+        try:
+            observer = Observer()
+            observer.daemon = True
+            observer.start()
+            self._handler = _InvalidationHandler(self)
+            self._observer = observer
+            self.watch_tree(self.root)
+            logger.info(f"Watching {len(self._watches)} directories of workspace {self.root} for changes")
+        except Exception as e:
+            logger.warning(f"Filesystem watcher unavailable for {self.root}, polling instead: {str(e)}")
+            self.close()
+
+    def watch_tree(self, path: str):
+        """
+        Watch a directory and its subdirectories, skipping ignored ones
+        """
+        observer = self._observer
+        if observer is None or not self.contains(path) or os.path.basename(path) in self.ignore_dirs:
+            return
+        for directory, subdirs, _ in os.walk(os.path.abspath(path)):
+            subdirs[:] = [name for name in subdirs if name not in self.ignore_dirs]
+            with self._lock:
+                if directory in self._watches:
+                    continue
+            watch = observer.schedule(self._handler, directory, recursive=False)
+            with self._lock:
+                self._watches[directory] = watch
+
+    def unwatch_tree(self, path: str):
+        """
+        Stop watching a directory that was removed or moved, and everything below it
+        """
+        path = os.path.abspath(path)
+        prefix = path.rstrip(os.sep) + os.sep
+        with self._lock:
+            removed = [directory for directory in self._watches
+                       if directory == path or directory.startswith(prefix)]
+            watches = [self._watches.pop(directory) for directory in removed]
+        observer = self._observer
+        for watch in watches:
+            try:
+                observer.unschedule(watch)
+            except Exception:
+                pass  # Already gone with its directory
+
+    def close(self):
+        """
+        Stop the filesystem watcher, if any
+        """
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+        with self._lock:
+            self._watches.clear()
+
+    def contains(self, path: str) -> bool:
+        path = os.path.abspath(path)
+        return path == self.root or path.startswith(self.root.rstrip(os.sep) + os.sep)
+
+    def invalidate(self, path: str):
+        """
+        Drop the cached listing for a directory so it is rescanned on next access
+        """
+        with self._lock:
+            if self._listings.pop(os.path.abspath(path), None) is not None:
+                self.generation += 1
+
+    def _scan(self, path: str) -> _DirectoryListing:
+        entries = []
+        try:
+            dir_mtime_ns = os.stat(path).st_mtime_ns
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.name in self.ignore_dirs:
+                        continue
+                    try:
+                        is_dir = entry.is_dir()
+                        item = {"name": entry.name, "path": entry.path, "is_dir": is_dir}
+                        if not is_dir:
+                            ext = os.path.splitext(entry.name)[1].lower()
+                            item["size"] = entry.stat().st_size
+                            item["ext"] = ext
+                            item["is_image"] = ext in self.image_extensions
+                            item["is_binary"] = ext in self.binary_extensions
+                        entries.append(item)
+                    except OSError:
+                        continue
+        except PermissionError:
+            return _DirectoryListing([], 0, error='permission')
+        except OSError as e:
+            return _DirectoryListing([], 0, error=str(e))
+
+        entries.sort(key=lambda x: (not x["is_dir"], x["name"].lower()))
+        return _DirectoryListing(entries, dir_mtime_ns)
+
+    def _is_current(self, path: str, listing: _DirectoryListing) -> bool:
+        if self._observer is not None:
+            return True
+        if time.monotonic() - listing.checked_at < self.poll_interval:
+            return True
+        try:
+            current = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+        if current != listing.dir_mtime_ns:
+            return False
+        listing.checked_at = time.monotonic()
+        return True
+
+    def _listing(self, path: str) -> _DirectoryListing:
+        path = os.path.abspath(path)
+        with self._lock:
+            listing = self._listings.get(path)
+            if listing is not None and self._is_current(path, listing):
+                return listing
+        fresh = self._scan(path)
+        with self._lock:
+            self._listings[path] = fresh
+            self.generation += 1
+        return fresh
+
+    def list_dir(self, path: str) -> List[Dict]:
+        """
+        Entries of a directory (IGNORE_DIRS removed), directories first, for /browse
+
+        :raises PermissionError: if the directory cannot be read
+        """
+        listing = self._listing(path)
+        if listing.error == 'permission':
+            raise PermissionError(path)
+        if listing.error:
+            raise OSError(listing.error)
+        return listing.entries
+
+    def render_tree(self, max_depth: int = 3, show_sizes: bool = True) -> str:
+        """
+        Text directory tree for the system prompt, hiding dotfiles and binaries
+
+        :param show_sizes: Annotate files with their size; without sizes the tree
+                           only changes when files are added, removed, or renamed
+        """
+        key = (max_depth, show_sizes)
+        with self._lock:
+            generation = self.generation
+            cached = self._tree_cache.get(key)
+            if cached and cached[0] == generation and self._observer is not None:
+                return cached[1]
+
+        lines = []
+        self._render(self.root, 0, max_depth, lines, show_sizes)
+        tree = "\n".join(lines)
+        with self._lock:
+            self._tree_cache[key] = (generation, tree)
+        return tree
+
+    def _render(self, path: str, depth: int, max_depth: int, lines: List[str], show_sizes: bool = True):
+        if depth >= max_depth:
+            return
+        indent = "  " * depth
+        listing = self._listing(path)
+        if listing.error == 'permission':
+            lines.append(f"{indent}⛔ [Permission Denied]")
+            return
+        for item in listing.entries:
+            if item["name"].startswith('.'):
+                continue
+            if item["is_dir"]:
+                lines.append(f"{indent}📁 {item['name']}/")
+                self._render(item["path"], depth + 1, max_depth, lines, show_sizes)
+            elif not item["is_binary"]:
+                size = f" ({item['size'] / 1024:.1f}KB)" if show_sizes else ""
+                lines.append(f"{indent}📄 {item['name']}{size}")
+
+
+class WorkspaceIndexRegistry:
+    """
+    Keeps one WorkspaceIndex per workspace root, evicting the least recently used
+    """
+
+    def __init__(self, ignore_dirs: Set[str], binary_extensions: Set[str],
+                 image_extensions: Set[str], max_workspaces: int = 8,
+                 poll_interval: float = 2.0, use_watcher: bool = True):
+        self.ignore_dirs = ignore_dirs
+        self.binary_extensions = binary_extensions
+        self.image_extensions = image_extensions
+        self.max_workspaces = max_workspaces
+        self.poll_interval = poll_interval
+        self.use_watcher = use_watcher
+        self._indexes: 'OrderedDict[str, WorkspaceIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, root: str) -> WorkspaceIndex:
+        """
+        Index for a workspace root, creating it on first use
+        """
+        root = os.path.abspath(root)
+        with self._lock:
+            index = self._indexes.get(root)
+            if index is None:
+                index = WorkspaceIndex(root, self.ignore_dirs, self.binary_extensions,
+                                       self.image_extensions, self.poll_interval,
+                                       self.use_watcher)
+                self._indexes[root] = index
+                while len(self._indexes) > self.max_workspaces:
+                    _, evicted = self._indexes.popitem(last=False)
+                    evicted.close()
+            self._indexes.move_to_end(root)
+            return index
+
+    def find(self, path: str) -> Optional[WorkspaceIndex]:
+        """
+        Already-registered index whose workspace contains path, if any
+        """
+        with self._lock:
+            matches = [index for index in self._indexes.values() if index.contains(path)]
+        return max(matches, key=lambda index: len(index.root), default=None)
+
+    def invalidate(self, path: str):
+        """
+        Drop cached listings for path in every index that contains it
+        """
+        with self._lock:
+            indexes = list(self._indexes.values())
+        for index in indexes:
+            if index.contains(path):
+                index.invalidate(path)